@@ -0,0 +1,205 @@
+"""
+Choose the solver, encoding version and search policy of a sequence from the
+results of past tests. Every combination in the results gets a least squares
+fit of its log time on features of the sequences, refitted whenever results
+are added, and the combination with the lowest predicted time is chosen
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+
+import numpy as np
+
+import src.bounds
+import src.encode
+
+MODEL_FILE = "results/auto.json"
+RESULTS_DIRS = ["results/encoding", "results/solver", "results/policy"]
+INPUT_DIR = "input"
+
+# Combinations with fewer results than features plus this are not fitted
+MIN_SAMPLES = 5
+
+# Weight of the ridge penalty, which keeps the fits of combinations with few results sane
+RIDGE = 1e-3
+
+
+def main() -> None:
+    args = parse_args()
+    model = load_model(args.retrain)
+    if args.input_file is None:
+        return evaluate(read_results())
+    seq = src.encode.get_sequence(args.input_file)
+    print(f"Predicted times from {model['samples']} results")
+    for seconds, solver, ver, policy in predict(model, seq, args.dimension)[:args.top]:
+        print(f"{seconds:>10.2f}s {solver:<14} v{ver} {policy}")
+
+
+def choose(seq: str, dim: int) -> tuple[str, int, str]:
+    """Return the solver, version and policy expected to be fastest for a sequence"""
+    ranking = predict(load_model(), seq, dim)
+    if not ranking:
+        raise ValueError(f"No results to choose a configuration for {dim}D from")
+    seconds, solver, ver, policy = ranking[0]
+    print(f"Chose {solver}, v{ver} and {policy}, expected to take {seconds:.2f}s")
+    return solver, ver, policy
+
+
+def predict(model: dict, seq: str, dim: int) -> list[tuple[float, str, int, str]]:
+    """Return the predicted seconds of every fitted combination, fastest first"""
+    x = np.array(get_features(seq, dim))
+    ranking = []
+    for key, fit in model["fits"].items():
+        solver, ver, policy = key.split(":")
+        if dim not in fit["dims"]:
+            continue
+        seconds = math.exp(min(float(x @ np.array(fit["coef"])), 50.0))
+        ranking.append((seconds, solver, int(ver), policy))
+    return sorted(ranking)
+
+
+def get_features(seq: str, dim: int) -> list[float]:
+    """
+    Return the features of a sequence: its length, fraction of "1"s, dimension
+    and contact bound. The times grow about as a power of the length and bound,
+    so their logarithms are fitted to the log time
+    """
+    bound = src.bounds.get_contact_bound(seq, dim)
+    return [1.0, math.log(len(seq)), seq.count("1") / len(seq), dim, math.log1p(bound)]
+
+
+def load_model(retrain: bool = False) -> dict:
+    """Return the fitted model, refitting it if results were added since it was fitted"""
+    files = get_results_files()
+    latest = max((os.path.getmtime(f) for f in files), default=0.0)
+    if not retrain and os.path.isfile(MODEL_FILE):
+        with open(MODEL_FILE) as f:
+            model = json.load(f)
+        if model["files"] == len(files) and model["latest"] >= latest:
+            return model
+    print(f"Fitting the configuration model on {len(files)} results")
+    model = {"files": len(files), "latest": latest, **fit(read_results(files))}
+    os.makedirs(os.path.dirname(MODEL_FILE), exist_ok=True)
+    with open(MODEL_FILE, "w+") as f:
+        json.dump(model, f)
+    return model
+
+
+def fit(results: dict[tuple[str, int, str], list[tuple[str, list[float], float]]]) -> dict:
+    """Fit the log time of every combination with enough results on the features"""
+    fits, samples = {}, 0
+    for (solver, ver, policy), rows in results.items():
+        x = np.array([features for _, features, _ in rows])
+        if len(rows) < x.shape[1] + MIN_SAMPLES:
+            continue
+        y = np.log(np.array([seconds for _, _, seconds in rows]))
+        # Scale the features so the ridge penalty is the same on each, but not the intercept
+        scale = np.maximum(np.abs(x).max(axis=0), 1e-9)
+        penalty = RIDGE * len(rows) * np.diag([0.0] + [1.0] * (x.shape[1] - 1))
+        coef = np.linalg.solve((x / scale).T @ (x / scale) + penalty, (x / scale).T @ y) / scale
+        fits[f"{solver}:{ver}:{policy}"] = {
+            "coef": coef.tolist(),
+            "dims": sorted({int(features[3]) for _, features, _ in rows}),
+            "samples": len(rows)
+        }
+        samples += len(rows)
+    return {"fits": fits, "samples": samples}
+
+
+def read_results(files: list[str] = None) -> dict[tuple[str, int, str], list[tuple[str, list[float], float]]]:
+    """Return the name, features and seconds of the solved results by solver, version and policy"""
+    results = {}
+    sequences = {}
+    for results_file in files or get_results_files():
+        with open(results_file) as f:
+            for r in csv.DictReader(f):
+                # Results which were only encoded have no solver or time to learn from
+                if r["solver"] == "NA" or r["policy"] == "NA":
+                    continue
+                # Searches which ran out of time did not take the time to solve
+                if r.get("status", "optimal") != "optimal":
+                    continue
+                name, dim = r["name"], int(r["dim"])
+                if name not in sequences:
+                    seq_file = os.path.join(INPUT_DIR, name)
+                    sequences[name] = src.encode.get_sequence(seq_file) if os.path.isfile(seq_file) else None
+                if sequences[name] is None:
+                    continue
+                seconds = float(r["encode_time"]) + abs(float(r["total_time"]))
+                key = (r["solver"], int(r["ver"]), r["policy"])
+                results.setdefault(key, []).append((name, get_features(sequences[name], dim), max(seconds, 1e-3)))
+    return results
+
+
+def get_results_files() -> list[str]:
+    return sorted(f for results_dir in RESULTS_DIRS for f in glob.glob(os.path.join(results_dir, "*.csv")))
+
+
+def evaluate(results: dict[tuple[str, int, str], list[tuple[str, list[float], float]]]) -> None:
+    """
+    Compare the choices with the default of kissat, v2 and the linear search,
+    fitting without each sequence in turn before choosing for it among the
+    combinations it has results for
+    """
+    times: dict[tuple[str, int], dict[tuple[str, int, str], float]] = {}
+    for key, rows in results.items():
+        for name, features, seconds in rows:
+            times.setdefault((name, int(features[3])), {})[key] = seconds
+    default = ("kissat", 2, "linear_search_policy")
+    chosen_total, default_total, best_total, count = 0.0, 0.0, 0.0, 0
+    for name in sorted({name for name, _ in times}):
+        held_out = {key: [row for row in rows if row[0] != name] for key, rows in results.items()}
+        model = fit(held_out)
+        for (other, dim), seconds in times.items():
+            if other != name or default not in seconds:
+                continue
+            features = np.array(next(f for rows in results.values() for n, f, _ in rows if n == name and f[3] == dim))
+            ranking = sorted(
+                (float(features @ np.array(fit["coef"])), tuple(key.split(":")))
+                for key, fit in model["fits"].items()
+            )
+            known = [(s, ver, p) for _, (s, ver, p) in ranking if (s, int(ver), p) in seconds]
+            solver, ver, policy = known[0]
+            chosen_total += seconds[solver, int(ver), policy]
+            default_total += seconds[default]
+            best_total += min(seconds.values())
+            count += 1
+    print(f"Over {count} sequences and dimensions fitted without them")
+    print(f"Default : {default_total:.2f}s")
+    print(f"Chosen  : {chosen_total:.2f}s")
+    print(f"Best    : {best_total:.2f}s")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "input_file",
+        nargs="?", type=str,
+        help="the path to the input file containing a string of 1s and 0s, evaluate the choices if not given"
+    )
+    parser.add_argument(
+        "-d", "--dimension",
+        nargs="?", type=int, default=2, choices={2, 3},
+        help="the dimension of the embedding grid, default value: 2"
+    )
+    parser.add_argument(
+        "--retrain",
+        action="store_true",
+        help="fit the model again even if no results were added"
+    )
+    parser.add_argument(
+        "--top",
+        nargs="?", type=int, default=10,
+        help="the number of combinations printed, default value: 10"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
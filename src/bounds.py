@@ -0,0 +1,125 @@
+"""
+Upper bounds on the number of contacts of a sequence, so the search policies
+start as close as possible to the optimum instead of probing hard UNSAT goals
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections import deque
+
+import src.encode
+
+# Number of neighbours of a point on the square and cubic lattices
+COORDINATION = {2: 4, 3: 6}
+
+SOURCE, SINK = -1, -2
+
+
+def main() -> None:
+    args = parse_args()
+    seq = src.encode.get_sequence(args.input_file)
+    print(f"Per residue bound : {src.encode.get_max_contacts(seq, args.dimension)}")
+    print(f"Parity bound      : {get_parity_bound(seq, args.dimension)}")
+    print(f"Matching bound    : {get_matching_bound(seq, args.dimension)}")
+
+
+def get_contact_bound(seq: str, dim: int) -> int:
+    """Return the upper bound on the number of contacts used by the search policies"""
+    return get_matching_bound(seq, dim)
+
+
+def get_capacities(seq: str, dim: int) -> dict[int, int]:
+    """
+    Return the number of free neighbours of every "1", which are the lattice
+    neighbours not taken by the characters before and after it in the chain
+    """
+    z, last = COORDINATION[dim], len(seq) - 1
+    return {
+        i: z - (i > 0) - (i < last)
+        for i, c in enumerate(seq) if c == "1"
+    }
+
+
+def get_parity_bound(seq: str, dim: int) -> int:
+    """
+    Return the free neighbours of the smaller of the even and odd "1"s, as the
+    lattices are bipartite and every contact pairs an even with an odd index
+    """
+    caps = get_capacities(seq, dim)
+    even = sum(c for i, c in caps.items() if i % 2 == 0)
+    odd = sum(c for i, c in caps.items() if i % 2 == 1)
+    return min(even, odd)
+
+
+def get_matching_bound(seq: str, dim: int) -> int:
+    """
+    Return the size of the largest set of potential contacts where no "1" is
+    in more contacts than it has free neighbours, found as a max flow from the
+    even to the odd "1"s. It is at most the parity bound
+    """
+    caps = get_capacities(seq, dim)
+    even = [i for i in caps if i % 2 == 0]
+    odd = [j for j in caps if j % 2 == 1]
+
+    # Residual capacities of the flow network
+    residual: dict[int, dict[int, int]] = {SOURCE: {}, SINK: {}}
+
+    def add_edge(u: int, v: int, capacity: int) -> None:
+        residual.setdefault(u, {})[v] = capacity
+        residual.setdefault(v, {}).setdefault(u, 0)
+
+    for i in even:
+        add_edge(SOURCE, i, caps[i])
+        for j in odd:
+            # Adjacent characters are not contacts
+            if abs(i - j) > 1:
+                add_edge(i, j, 1)
+    for j in odd:
+        add_edge(j, SINK, caps[j])
+
+    flow = 0
+    while path := get_augmenting_path(residual):
+        amount = min(residual[u][v] for u, v in path)
+        for u, v in path:
+            residual[u][v] -= amount
+            residual[v][u] += amount
+        flow += amount
+    return flow
+
+
+def get_augmenting_path(residual: dict[int, dict[int, int]]) -> list[tuple[int, int]]:
+    """Return the edges of a shortest path from the source to the sink with capacity left"""
+    parents = {SOURCE: None}
+    todo = deque([SOURCE])
+    while todo and SINK not in parents:
+        u = todo.popleft()
+        for v, capacity in residual[u].items():
+            if capacity > 0 and v not in parents:
+                parents[v] = u
+                todo.append(v)
+    if SINK not in parents:
+        return []
+    path, v = [], SINK
+    while parents[v] is not None:
+        path.append((parents[v], v))
+        v = parents[v]
+    return path[::-1]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "input_file",
+        help="the path to the input file containing a string of 1s and 0s"
+    )
+    parser.add_argument(
+        "-d", "--dimension",
+        nargs="?", type=int, default=2, choices={2, 3},
+        help="the dimension of the embedding grid, default value: 2"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Content addressed cache of DIMACS encodings. Entries are keyed by a hash of
+everything an encoding depends on, and the least recently used entries are
+evicted when the cache grows over its byte budget.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+from src import config
+
+CACHE_DIR = "models/cache/"
+INDEX_FILE = os.path.join(CACHE_DIR, "index.json")
+LOCK_FILE = os.path.join(CACHE_DIR, "index.lock")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.clear:
+        with open_index() as index:
+            for key in list(index["entries"]):
+                remove(index, key)
+    with open_index() as index:
+        size = sum(entry["size"] for entry in index["entries"].values())
+        lookups = index["hits"] + index["misses"]
+        print(f"Entries  : {len(index['entries'])}")
+        print(f"Size     : {size} / {config.CACHE_BUDGET} bytes")
+        print(f"Hits     : {index['hits']}")
+        print(f"Misses   : {index['misses']}")
+        print(f"Hit rate : {index['hits'] / lookups if lookups else 0:.3f}")
+
+
+def get_key(*params: object, files: list[str]) -> str:
+    """Return the hash of the parameters and the contents of the files"""
+    h = hashlib.sha256()
+    h.update(repr(params).encode())
+    for file in files:
+        with open(file, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def fetch(key: str, output: str) -> bool:
+    """
+    Link the cached encoding of the key to output, returning if there was one.
+    Links removed since, by eviction or by hand, are linked again
+    """
+    with open_index() as index:
+        entry = index["entries"].get(key)
+        if entry is None or not os.path.isfile(entry["path"]):
+            index["entries"].pop(key, None)
+            index["misses"] += 1
+            return False
+        link(entry["path"], output)
+        entry["last_used"] = time.time()
+        entry["links"] = sorted({path for path in entry["links"] if os.path.isfile(path)} | {output})
+        index["hits"] += 1
+        return True
+
+
+def store(key: str, output: str) -> None:
+    """Add the encoding at output to the cache, evicting entries over the budget"""
+    if os.path.getsize(output) > config.CACHE_BUDGET:
+        print(f"Not caching {output}, it is over the cache budget of {config.CACHE_BUDGET} bytes")
+        return
+    # Keep the suffix of compressed encodings
+    path = os.path.join(CACHE_DIR, key + output[output.rindex(".cnf"):])
+    with open_index() as index:
+        link(output, path)
+        index["entries"][key] = {
+            "path": path,
+            "size": os.path.getsize(path),
+            "last_used": time.time(),
+            "links": [output]
+        }
+        evict(index, config.CACHE_BUDGET, key)
+
+
+def evict(index: dict, budget: int, keep: str = None) -> None:
+    """
+    Remove the least recently used entries other than keep, and the encodings
+    linked to them, until the cache fits in the budget. Searches which already
+    opened an encoding keep reading it until they close it
+    """
+    entries = index["entries"]
+    size = sum(entry["size"] for entry in entries.values())
+    for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+        if size <= budget:
+            break
+        if key == keep:
+            continue
+        size -= entries[key]["size"]
+        remove(index, key)
+
+
+def remove(index: dict, key: str, links: bool = True) -> None:
+    """Delete an entry, together with the encodings that are links to it if links"""
+    entry = index["entries"].pop(key)
+    if not os.path.isfile(entry["path"]):
+        return
+    for path in entry["links"] if links else []:
+        if os.path.isfile(path) and os.path.samefile(path, entry["path"]):
+            os.remove(path)
+    os.remove(entry["path"])
+
+
+def link(src: str, dst: str) -> None:
+    """
+    Hard link src to dst, copying it if it cannot be linked. The link or copy
+    is made beside dst and then replaces it, so readers of dst never see a
+    half copied file
+    """
+    if os.path.isfile(dst) and os.path.samefile(src, dst):
+        return
+    temp = os.path.join(os.path.dirname(dst), f".{os.getpid()}.{os.path.basename(dst)}")
+    if os.path.isfile(temp):
+        os.remove(temp)
+    try:
+        os.link(src, temp)
+    except OSError:
+        shutil.copyfile(src, temp)
+    os.replace(temp, dst)
+
+
+@contextmanager
+def open_index():
+    """Lock the index against other processes and write it back when done"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(LOCK_FILE, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index = {"entries": {}, "hits": 0, "misses": 0}
+        if os.path.isfile(INDEX_FILE):
+            with open(INDEX_FILE) as f:
+                index = json.load(f)
+        yield index
+        with open(INDEX_FILE + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(INDEX_FILE + ".tmp", INDEX_FILE)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--clear",
+        action="store_true",
+        help="remove every entry and the encodings linked to it"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Cardinality encodings of `sum(xs) >= bound` generated in Python, to use in
+place of `bule/counter.bul` through the count_encoding of an encoding. The
+counter encodes both directions of the sum while the search only needs the
+lower bound, so these only have the clauses which stop an output from being
+set without enough of its inputs being set: a one sided sequential counter, a
+totalizer, a modulo totalizer and a cardinality network. Run it to benchmark
+them against the bule counters for every version in TEST_VERSIONS
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import math
+import os
+import time
+
+import numpy as np
+
+import src.encode
+import src.native
+import src.run_tests
+import src.search_policies
+import src.sizes
+from src import config
+from src.config import POLICIES, TEST_VERSIONS
+
+RESULTS_FILE = "results/cardinality.csv"
+RESULTS_HEADER = "name,len,dim,ver,encoding,vars,cls,encode_time,solve_time,contacts"
+
+# Counting encodings of bule to benchmark these against
+BULE_ENCODINGS = ["counter.bul", "cc_a.bul"]
+
+
+def main() -> None:
+    args = parse_args()
+    config.NATIVE_ENCODING = args.native
+    policy = getattr(src.search_policies, args.policy)
+    sequences = src.run_tests.get_sequences(args.input_dir, args.sequence_type, args.min_len, "", args.max_len)
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "w+") as f:
+        f.write(f"{RESULTS_HEADER}\n")
+    for sequence in sequences:
+        seq_file = os.path.join(args.input_dir, sequence["filename"])
+        for ver in args.versions:
+            results = [benchmark(seq_file, args.dimension, ver, e, policy, args.solver) for e in args.encodings]
+            with open(RESULTS_FILE, "a") as f:
+                f.writelines(f"{','.join(map(str, r))}\n" for r in results)
+            if len({r[-1] for r in results}) > 1:
+                print(f"{sequence['filename']} v{ver}: the encodings disagree on the max contacts")
+    print_summary(RESULTS_FILE)
+
+
+def encode_seq_counter(variables: src.native.Variables, xs: np.ndarray, bound: int) -> list[np.ndarray]:
+    """
+    Return the clauses of a sequential counter of `sum(xs) >= bound`, where
+    seq(I,J) is only set if at least J of xs[:I+1] are. Only the registers
+    from which the bound can still be reached are generated
+    """
+    n = len(xs)
+    trivial = get_trivial_blocks(n, bound)
+    if trivial is not None:
+        return trivial
+    xs = xs.tolist()
+    cells = [(i, j) for i in range(n) for j in range(max(1, bound - (n - 1 - i)), min(i + 1, bound) + 1)]
+    ids = variables.add([f"seq({i},{j})" for i, j in cells], (len(cells),))
+    s = dict(zip(cells, ids.tolist()))
+
+    clauses = []
+    for (i, j), v in s.items():
+        # Registers past the first I+1 inputs are false
+        before = [s[i - 1, j]] if (i - 1, j) in s else []
+        clauses.append([-v, xs[i]] + before)
+        if j > 1:
+            clauses.append([-v, s[i - 1, j - 1]] + before)
+    clauses.append([s[n - 1, bound]])
+    return get_blocks(clauses)
+
+
+def encode_totalizer(variables: src.native.Variables, xs: np.ndarray, bound: int) -> list[np.ndarray]:
+    """
+    Return the clauses of a totalizer of `sum(xs) >= bound`, a tree where
+    tot(I,K,J) is only set if at least J of xs[I:K] are, counting to the bound
+    """
+    n = len(xs)
+    trivial = get_trivial_blocks(n, bound)
+    if trivial is not None:
+        return trivial
+    clauses = []
+
+    def count(lo: int, hi: int) -> list[int]:
+        if hi - lo == 1:
+            return [int(xs[lo])]
+        mid = (lo + hi) // 2
+        a, b = count(lo, mid), count(mid, hi)
+        m = min(hi - lo, bound)
+        r = variables.add([f"tot({lo},{hi},{j})" for j in range(1, m + 1)], (m,)).tolist()
+        # At least S+1 needs more than A of the left or more than S-A of the right
+        for alpha in range(len(a) + 1):
+            for beta in range(min(len(b), m - 1 - alpha) + 1):
+                clause = [-r[alpha + beta]]
+                clause += [a[alpha]] if alpha < len(a) else []
+                clause += [b[beta]] if beta < len(b) else []
+                clauses.append(clause)
+        return r
+
+    clauses.append([count(0, n)[bound - 1]])
+    return get_blocks(clauses)
+
+
+def encode_mtotalizer(variables: src.native.Variables, xs: np.ndarray, bound: int) -> list[np.ndarray]:
+    """
+    Return the clauses of a modulo totalizer of `sum(xs) >= bound`. Its digits
+    only carry upwards, so it encodes that at most len(xs) - bound of the
+    negated xs are set: every node counts them as P * Q + R with R below the
+    modulo P, in unary digits mtot(I,K,q,J) and mtot(I,K,r,J) which are set if
+    the count is at least that, and mtot(I,K,c) for the carry of R
+    """
+    n = len(xs)
+    trivial = get_trivial_blocks(n, bound)
+    if trivial is not None:
+        return trivial
+    most = n - bound
+    p = max(2, math.isqrt(most))
+    # The count must stay below P * QK + RK, so Q is only counted up to QK + 1
+    qk, rk = divmod(most + 1, p)
+    clauses = []
+
+    def count(lo: int, hi: int) -> tuple[list[int], list[int]]:
+        if hi - lo == 1:
+            return [], [-int(xs[lo])]
+        mid = (lo + hi) // 2
+        (qa, ra), (qb, rb) = count(lo, mid), count(mid, hi)
+        size_q, size_r = min(qk + 1, -(-(hi - lo) // p)), min(p - 1, hi - lo)
+        q = variables.add([f"mtot({lo},{hi},q,{j})" for j in range(1, size_q + 1)], (size_q,)).tolist()
+        r = variables.add([f"mtot({lo},{hi},r,{j})" for j in range(1, size_r + 1)], (size_r,)).tolist()
+        c = variables.add([f"mtot({lo},{hi},c)"], (1,)).tolist()[0]
+        # Either R carried, or the remainders add up
+        for alpha in range(len(ra) + 1):
+            for beta in range(len(rb) + 1):
+                given = ([-ra[alpha - 1]] if alpha else []) + ([-rb[beta - 1]] if beta else [])
+                s = alpha + beta
+                if 0 < s < p:
+                    clauses.append(given + [c, r[s - 1]])
+                elif s >= p:
+                    clauses.append(given + [c])
+                    if s > p:
+                        clauses.append(given + [r[s - p - 1]])
+        # The quotients add up with the carry, counts past the last digit set it
+        for alpha in range(len(qa) + 1):
+            for beta in range(len(qb) + 1):
+                given = ([-qa[alpha - 1]] if alpha else []) + ([-qb[beta - 1]] if beta else [])
+                if alpha + beta:
+                    clauses.append(given + [q[min(alpha + beta, size_q) - 1]])
+                clauses.append(given + [-c, q[min(alpha + beta + 1, size_q) - 1]])
+        return q, r
+
+    q, r = count(0, n)
+    if qk < len(q):
+        clauses.append([-q[qk]])
+    if qk:
+        clauses.append([-q[qk - 1]] + ([-r[rk - 1]] if rk else []))
+    else:
+        clauses.append([-r[rk - 1]])
+    return get_blocks(clauses)
+
+
+def encode_cardinality_network(variables: src.native.Variables, xs: np.ndarray, bound: int) -> list[np.ndarray]:
+    """
+    Return the clauses of a cardinality network of `sum(xs) >= bound`, which
+    sorts the largest K of xs with K the bound rounded up to a power of 2. An
+    output of a comparator is only set if its inputs are, and only the
+    comparators leading to the K-th largest output are generated
+    """
+    n = len(xs)
+    trivial = get_trivial_blocks(n, bound)
+    if trivial is not None:
+        return trivial
+    k = 1 << (bound - 1).bit_length()
+    # Wires are an input ("x", literal), the output of a gate ("g", index), or False as None
+    gates = []
+
+    def compare(a: tuple | None, b: tuple | None) -> tuple[tuple | None, tuple | None]:
+        if a is None or b is None:
+            return a or b, None
+        gates.extend([("or", a, b), ("and", a, b)])
+        return ("g", len(gates) - 2), ("g", len(gates) - 1)
+
+    def merge(a: list, b: list) -> list:
+        if len(a) == 1:
+            return list(compare(a[0], b[0]))
+        d, e = merge(a[::2], b[::2]), merge(a[1::2], b[1::2])
+        return [d[0]] + [w for i in range(1, len(a)) for w in compare(d[i], e[i - 1])] + [e[-1]]
+
+    def sort(a: list) -> list:
+        if len(a) == 1:
+            return a
+        return merge(sort(a[:len(a) // 2]), sort(a[len(a) // 2:]))
+
+    def simplified_merge(a: list, b: list) -> list:
+        """Return the largest len(a) + 1 of two sorted lists"""
+        if len(a) == 1:
+            return list(compare(a[0], b[0]))
+        d, e = simplified_merge(a[::2], b[::2]), simplified_merge(a[1::2], b[1::2])
+        return [d[0]] + [w for i in range(1, len(a) // 2 + 1) for w in compare(d[i], e[i - 1])]
+
+    def card(a: list) -> list:
+        if len(a) == k:
+            return sort(a)
+        return simplified_merge(card(a[:k]), card(a[k:]))[:k]
+
+    wires = [("x", x) for x in xs.tolist()]
+    output = card(wires + [None] * (-n % k))[bound - 1]
+
+    # Gates the output depends on, in the order they were added
+    needed, stack = set(), [output]
+    while stack:
+        kind, i = stack.pop()
+        if kind == "g" and i not in needed:
+            needed.add(i)
+            stack.extend(gates[i][1:])
+    needed = sorted(needed)
+    ids = dict(zip(needed, variables.add([f"card({i})" for i in needed], (len(needed),)).tolist()))
+    literal = {"x": lambda x: x, "g": ids.get}
+
+    clauses = []
+    for i in needed:
+        op, (ka, a), (kb, b) = gates[i]
+        a, b = literal[ka](a), literal[kb](b)
+        clauses.extend([[-ids[i], a, b]] if op == "or" else [[-ids[i], a], [-ids[i], b]])
+    clauses.append([literal[output[0]](output[1])])
+    return get_blocks(clauses)
+
+
+def get_trivial_blocks(n: int, bound: int) -> list[np.ndarray] | None:
+    """Return no clauses if the bound always holds, an empty clause if it cannot, or None otherwise"""
+    if bound <= 0:
+        return []
+    if bound > n:
+        return [np.zeros((1, 0), dtype=np.int64)]
+    return None
+
+
+def get_blocks(clauses: list[list[int]]) -> list[np.ndarray]:
+    """Return clauses as blocks of clauses of the same length"""
+    lengths: dict[int, list[list[int]]] = {}
+    for clause in clauses:
+        lengths.setdefault(len(clause), []).append(clause)
+    return [np.array(c, dtype=np.int64) for _, c in sorted(lengths.items())]
+
+
+ENCODINGS = {
+    "seq_counter": encode_seq_counter,
+    "totalizer": encode_totalizer,
+    "mtotalizer": encode_mtotalizer,
+    "card_network": encode_cardinality_network
+}
+
+
+def get_size(count_encoding: str, n: int, bound: int) -> tuple[int, int]:
+    """Return the variables and clauses a cardinality encoding adds for sum(xs) >= bound over n variables"""
+    variables = src.native.Variables(n)
+    blocks = ENCODINGS[count_encoding](variables, np.arange(1, n + 1), bound)
+    return len(variables.names), sum(len(block) for block in blocks)
+
+
+def add_to_cnf(cnf_file: str, count_encoding: str, bound: int) -> None:
+    """Add a cardinality encoding of the contacts to an encoding ground by bule without one"""
+    variable_map = src.encode.get_variable_map(cnf_file)
+    xs = np.array(sorted(var for name, var in variable_map.items() if "contact(" in name), dtype=np.int64)
+    num_vars, num_clauses = src.encode.get_cnf_header(cnf_file)
+    variables = src.native.Variables(num_vars)
+    blocks = ENCODINGS[count_encoding](variables, xs, bound)
+
+    # Written next to the encoding with the same suffix, so it is compressed the same way
+    with src.encode.replacing(cnf_file) as temp, src.encode.open_cnf(cnf_file, "rt") as f, \
+            src.encode.open_cnf(temp, "wt") as out:
+        for line in f:
+            if line.startswith("p"):
+                src.native.write_names(out, variables)
+                out.write(f"p cnf {len(variables)} {num_clauses + sum(len(block) for block in blocks)}\n")
+            else:
+                out.write(line)
+        src.native.write_clauses(out, blocks)
+
+
+def benchmark(seq_file: str, dim: int, ver: int, count_encoding: str, policy: callable, solver: str) -> list:
+    """Return the size of an encoding at the max contacts and the time the policy takes to find them"""
+    seq = src.encode.get_sequence(seq_file)
+    start = time.time()
+    r = policy(seq_file, dim, ver, False, solver, count_encoding)
+    print(f"{os.path.basename(seq_file)} v{ver} {count_encoding}: {r['max_contacts']} in {time.time() - start:.2f}s")
+    num_vars, num_clauses = src.sizes.get_size(seq, dim, ver, r["max_contacts"], None, count_encoding)
+    return [
+        os.path.basename(seq_file), len(seq), dim, ver, count_encoding, num_vars, num_clauses,
+        round(r["encode_time"], 4), round(r["solve_time"], 4), r["max_contacts"]
+    ]
+
+
+def print_summary(results_file: str) -> None:
+    """Print the total clauses and solve time of every encoding for every version"""
+    totals: dict[tuple[int, str], list[float]] = {}
+    with open(results_file) as f:
+        for r in csv.DictReader(f):
+            total = totals.setdefault((int(r["ver"]), r["encoding"]), [0, 0, 0])
+            total[0] += 1
+            total[1] += int(r["cls"])
+            total[2] += float(r["solve_time"])
+    print(f"{'ver':<4} {'encoding':<14} {'tests':>6} {'clauses':>12} {'solve time':>12}")
+    for (ver, encoding), (tests, num_clauses, solve_time) in sorted(totals.items()):
+        print(f"v{ver:<3} {encoding:<14} {tests:>6} {num_clauses:>12} {solve_time:>12.2f}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-d", "--dimension",
+        nargs="?", type=int, default=2, choices={2, 3},
+        help="the dimension of the embedding grid, default value: 2"
+    )
+    parser.add_argument(
+        "-e", "--encodings",
+        nargs="+", type=str, default=[*BULE_ENCODINGS, *ENCODINGS], choices=[*BULE_ENCODINGS, *ENCODINGS],
+        help="the counting encodings to benchmark, default: all of them"
+    )
+    parser.add_argument(
+        "-i", "--input-dir",
+        nargs="?", type=str, default="input",
+        help="the folder of the sequences, default value: input"
+    )
+    parser.add_argument(
+        "--min-len",
+        nargs="?", type=int, default=0,
+        help="only benchmark sequences at least this long, default value: 0"
+    )
+    parser.add_argument(
+        "--max-len",
+        nargs="?", type=int, default=20,
+        help="only benchmark sequences shorter than this, default value: 20"
+    )
+    parser.add_argument(
+        "-n", "--native",
+        action="store_true",
+        help="generate the v2 and v4 encodings in Python instead of with bule"
+    )
+    parser.add_argument(
+        "-p", "--policy",
+        nargs="?", type=str, default="binary_search_policy", choices=POLICIES,
+        help="the search policy to find the max contacts with, default value: binary_search_policy"
+    )
+    parser.add_argument(
+        "-s", "--solver",
+        nargs="?", type=str, default="cadical",
+        help="the SAT solver to use, default value: cadical"
+    )
+    parser.add_argument(
+        "-t", "--sequence-type",
+        nargs="?", type=str, default="all", choices={"real", "random", "other", "all"},
+        help="only benchmark sequences of this type, default value: all"
+    )
+    parser.add_argument(
+        "-v", "--versions",
+        nargs="+", type=int, default=TEST_VERSIONS, choices=TEST_VERSIONS,
+        help=f"the versions of the encoding to benchmark, default value: {TEST_VERSIONS}"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
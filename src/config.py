@@ -2,7 +2,7 @@
 TEST_REPEATS = 1
 
 # List of different encodings to test
-TEST_VERSIONS = [0, 1, 2, 3]
+TEST_VERSIONS = [0, 1, 2, 3, 4]
 
 # File to use for SAT test
 SAT_TEST_SEQ = "input/length-23-7"
@@ -11,4 +11,73 @@ SAT_TEST_SEQ = "input/length-23-7"
 SOLVERS = ["cadical", "cryptominisat", "glucose", "kissat", "maplesat"]
 
 # List of different search policies
-POLICIES = ["binary_search_policy", "linear_search_policy", "double_binary_policy", "double_linear_policy"]
+POLICIES = ["binary_search_policy", "linear_search_policy", "double_binary_policy", "double_linear_policy", "parallel_search_policy", "maxsat_policy"]
+
+# Solve the goal probes of a search with one persistent solver and assumptions
+INCREMENTAL = False
+
+# pysat backends used for each solver when solving incrementally, solvers
+# without an incremental interface in pysat fall back to the default
+INCREMENTAL_SOLVERS = {"cadical": "cadical153", "glucose": "glucose4", "maplesat": "maplesat"}
+INCREMENTAL_DEFAULT_SOLVER = "cadical153"
+
+# pysat backend used instead of CaDiCaL under a time budget, as it cannot be interrupted
+INCREMENTAL_INTERRUPTIBLE_SOLVER = "glucose4"
+
+# Generate v2 encodings with the counter encoding in Python instead of bule
+NATIVE_ENCODING = False
+
+# Encode goals from a goal independent base, adding only the bound per goal
+SPLIT_BASE = False
+
+# Solvers raced on the same encoding by the portfolio solver
+PORTFOLIO = ["cadical", "glucose", "kissat"]
+
+# File which records the winner and run times of every portfolio race
+PORTFOLIO_LOG = "results/portfolio.csv"
+
+# Number of goals probed at once by the parallel search, None for every core
+PARALLEL_PROBES = None
+
+# Split every probe into cubes on the dimensions of its first bonds, solved at once
+CUBE = False
+
+# Number of worker processes solving the cubes of a probe, None for every core
+CUBE_WORKERS = None
+
+# Size in bytes the cache of encodings is kept under by evicting old entries
+CACHE_BUDGET = 10 * 2 ** 30
+
+# Compression of the DIMACS files written to models/cnf, None, "gz" or "xz"
+CNF_COMPRESSION = None
+
+# Start the search policies from the contacts of a heuristic fold
+HEURISTIC = False
+
+# Solve goals on growing grids, from one which fits a compact fold to the full grid
+DEEPENING = False
+
+# Decode the fold of every SAT answer from the model of the solver
+DECODE_FOLDS = False
+
+# Wall clock seconds a goal probe and a whole search may take, None for no limit
+PROBE_TIMEOUT = None
+SEARCH_TIMEOUT = None
+
+# CPU seconds a solver may use on a goal probe, None for no limit
+PROBE_CPU_TIMEOUT = None
+
+# JSONL file the phases and solver statistics of every probe are appended to, None to not trace
+TRACE = None
+
+# Clauses the largest encoding of a test may have, as predicted by src.sizes, None for no limit
+MAX_CLAUSES = None
+
+# SQLite database every result is appended to besides its CSV, None to only write the CSVs
+RESULTS_STORE = "results/results.db"
+
+# MaxSAT solver binary the maxsat_policy runs on a WCNF file, None to use RC2 from pysat
+MAXSAT_SOLVER = None
+
+# CSV of the contacts of the native folds of the PDB sequences, written by src.get_sequences
+NATIVE_FILE = "expected/native.csv"
@@ -0,0 +1,342 @@
+"""
+Corpus of sequences packed into one file instead of one file per sequence. The
+sequences are bit packed and stored once however many names they have, behind
+an index sorted by type, length and name, so selecting sequences is a binary
+search. Sequences are added and removed by appending them and a delta of the
+records changed since the index to the file, and pointing its header at them.
+The delta is folded into a new index once it outgrows a fraction of the index,
+with `--compact` to reclaim space.
+
+Layout: header | packed sequences | records by type, length and name | order of the records by name | delta records
+"""
+
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import re
+import struct
+from typing import BinaryIO
+
+import numpy as np
+
+CORPUS_FILE = "input.corpus"
+
+MAGIC = b"HPCORPU2"
+# Magic, number and offset of the records of the index, and of the records of the delta
+HEADER = struct.Struct("<8sIQIQ")
+RECORD = np.dtype([("type", "u1"), ("len", "<u4"), ("offset", "<u8"), ("name", "S32")])
+ORDER = np.dtype("<u4")
+
+# Type of the delta records of removed sequences
+REMOVED = 255
+
+# Fraction of the records of the index the delta grows to before it is folded into a new index
+DELTA_FRACTION = 1 / 8
+
+# Types of sequence by their name: real ones from the PDB and random ones from gen_rand_sequence.py
+TYPES = ["real", "random", "other"]
+
+
+def main() -> None:
+    args = parse_args()
+    with Corpus(args.corpus) as corpus:
+        if args.add:
+            added = corpus.add(read_dir(args.add, args.max_len))
+            print(f"Added {added} sequences from {args.add}")
+        if args.remove:
+            print(f"Removed {corpus.remove(args.remove)} sequences")
+        if args.compact:
+            corpus.compact()
+        sequences = corpus.select(args.sequence_type, args.min_len, args.max_len)
+        for s in sequences if args.list else []:
+            print(f"{s['filename']:<16} {s['seq']}")
+        print(f"{len(sequences)} of {len(corpus)} sequences selected, {os.path.getsize(corpus.path)} bytes")
+
+
+class Corpus:
+    """A corpus file, opened read only until it is changed"""
+
+    def __init__(self, path: str = CORPUS_FILE) -> None:
+        self.path = path
+        self.map = None
+        if not os.path.isfile(path):
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, 0, HEADER.size, 0, HEADER.size))
+        self.load()
+
+    def __enter__(self) -> Corpus:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def close(self) -> None:
+        self.records, self.order, self.delta = np.zeros(0, RECORD), np.zeros(0, ORDER), np.zeros(0, RECORD)
+        self.indexed = 0
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def load(self) -> None:
+        """
+        Map the file and read its index and delta, the records are copied out of
+        the map so it can be closed, and the sequences read from it as needed
+        """
+        self.close()
+        with open(self.path, "rb") as f:
+            magic, count, index, delta_count, delta_index = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a corpus, or is of an older version and needs to be added again")
+            if count or delta_count:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map is None:
+            return
+        self.indexed = count
+        self.records = np.frombuffer(self.map, RECORD, count, index).copy()
+        self.order = np.frombuffer(self.map, ORDER, count, index + count * RECORD.itemsize).copy()
+        self.delta = np.frombuffer(self.map, RECORD, delta_count, delta_index).copy()
+        if delta_count:
+            self.records = merge(self.records, self.delta)
+            self.order = np.argsort(self.records["name"], kind="stable").astype(ORDER)
+
+    def get_sequence(self, name: str) -> str | None:
+        """Return the sequence of a name, or None if it is not in the corpus"""
+        names = self.records["name"]
+        key = name.encode()
+        i = search(len(self), lambda k: names[self.order[k]] < key)
+        if i == len(self) or names[self.order[i]] != key:
+            return None
+        return self.decode(self.records[self.order[i]])
+
+    def select(
+        self,
+        seq_type: str = "all",
+        min_len: int = 0,
+        max_len: int = None,
+        min_name: str = ""
+    ) -> list[dict[str, str]]:
+        """Return the sequences of a type with min_len <= length < max_len and a name from min_name on"""
+        types, lengths = self.records["type"], self.records["len"]
+        selected = []
+        for t in range(len(TYPES)) if seq_type == "all" else [TYPES.index(seq_type)]:
+            # Records are sorted by (type, length), so those selected are a slice of them
+            start = search(len(self), lambda i: (types[i], lengths[i]) < (t, min_len))
+            end = search(len(self), lambda i: (types[i], lengths[i]) < (t, max_len or 2 ** 32))
+            for r in self.records[start:end]:
+                if r["name"].decode() >= min_name:
+                    selected.append({"filename": r["name"].decode(), "seq": self.decode(r)})
+        return sorted(selected, key=lambda x: (len(x["seq"]), x["filename"]))
+
+    def read(self, record: np.void) -> bytes:
+        """Return the packed bits of the sequence of a record, copied out of the map"""
+        offset = int(record["offset"])
+        return self.map[offset:offset + (int(record["len"]) + 7) // 8]
+
+    def decode(self, record: np.void) -> str:
+        packed = np.frombuffer(self.read(record), np.uint8)
+        return (np.unpackbits(packed)[:record["len"]] + ord("0")).tobytes().decode()
+
+    def add(self, sequences: dict[str, str]) -> int:
+        """
+        Add or replace sequences by name, appending only the ones which are not
+        in the corpus yet. Return the number of names added or replaced
+        """
+        packed = {}
+        stored = self.get_stored(sequences.values())
+        with open(self.path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            for name, seq in sequences.items():
+                if len(name.encode()) > RECORD["name"].itemsize or not re.fullmatch("[01]+", seq):
+                    raise ValueError(f"Cannot add {name}, names are at most 32 bytes and sequences of 0s and 1s")
+                key = (len(seq), self.pack(seq))
+                if key not in stored:
+                    stored[key] = f.tell()
+                    f.write(key[1])
+                packed[name] = (TYPES.index(get_type(name)), len(seq), stored[key], name.encode())
+        if packed:
+            self.write_delta(np.array(list(packed.values()), RECORD))
+        return len(packed)
+
+    def get_stored(self, sequences: iter[str]) -> dict[tuple[int, bytes], int]:
+        """Return the offsets of the sequences already stored by their length and packed bits"""
+        stored = {}
+        by_length = {}
+        for seq in sequences:
+            by_length.setdefault(len(seq), set()).add(self.pack(seq))
+        for length, keys in by_length.items():
+            offsets = self.records["offset"][self.records["len"] == length].astype(np.int64)
+            if not len(offsets):
+                continue
+            size = (length + 7) // 8
+            # Copy the bits of the records of this length out of the map at once
+            bits = np.frombuffer(self.map, np.uint8)[offsets[:, None] + np.arange(size)]
+            found = np.isin(bits.view(f"S{size}").ravel(), np.array(list(keys), f"S{size}"))
+            stored.update({(length, b.tobytes()): int(o) for b, o in zip(bits[found], offsets[found])})
+        return stored
+
+    def remove(self, names: list[str]) -> int:
+        """Remove sequences by name, leaving their bits in the file until it is compacted"""
+        removed = self.records[np.isin(self.records["name"], [name.encode() for name in names])].copy()
+        removed["type"] = REMOVED
+        if len(removed):
+            self.write_delta(removed)
+        return len(removed)
+
+    def compact(self) -> None:
+        """Rewrite the corpus with only the sequences in its index"""
+        sequences = {r["name"].decode(): self.decode(r) for r in self.records}
+        self.close()
+        temp = f"{self.path}.tmp"
+        if os.path.isfile(temp):
+            os.remove(temp)
+        with Corpus(temp) as corpus:
+            corpus.add(sequences)
+        os.replace(temp, self.path)
+        self.load()
+
+    def write_delta(self, changed: np.ndarray) -> None:
+        """
+        Append the delta with the records changed, or a new index of every
+        record once the delta outgrows DELTA_FRACTION of the index
+        """
+        delta = merge(self.delta, changed, keep_removed=True)
+        if len(delta) > DELTA_FRACTION * self.indexed:
+            return self.write_index(merge(self.records, changed))
+        with open(self.path, "r+b") as f:
+            f.seek(0)
+            magic, count, index, _, _ = HEADER.unpack(f.read(HEADER.size))
+            delta_index = f.seek(0, os.SEEK_END)
+            f.write(delta.tobytes())
+            commit(f, HEADER.pack(magic, count, index, len(delta), delta_index))
+        self.load()
+
+    def write_index(self, records: np.ndarray) -> None:
+        """Append an index of the records and point the header at it, with an empty delta"""
+        order = np.argsort(records["name"], kind="stable").astype(ORDER)
+        with open(self.path, "r+b") as f:
+            index = f.seek(0, os.SEEK_END)
+            f.write(records.tobytes())
+            f.write(order.tobytes())
+            commit(f, HEADER.pack(MAGIC, len(records), index, 0, f.tell()))
+        self.load()
+
+    @staticmethod
+    def pack(seq: str) -> bytes:
+        return np.packbits(np.frombuffer(seq.encode(), np.uint8) - ord("0")).tobytes()
+
+
+def merge(records: np.ndarray, changed: np.ndarray, keep_removed: bool = False) -> np.ndarray:
+    """
+    Return the records with those changed replacing the ones of the same name,
+    sorted by type, length and name. The later of changes to a name wins, and
+    removed records are dropped unless keep_removed
+    """
+    # Only the last change to a name counts
+    _, last = np.unique(changed["name"][::-1], return_index=True)
+    changed = changed[len(changed) - 1 - last]
+    records = np.concatenate([records[~np.isin(records["name"], changed["name"])], changed])
+    if not keep_removed:
+        records = records[records["type"] != REMOVED]
+    return records[np.lexsort((records["name"], records["len"], records["type"]))]
+
+
+def commit(f: BinaryIO, header: bytes) -> None:
+    """Point the header at what was appended once it is on disk, which commits the change"""
+    f.flush()
+    os.fsync(f.fileno())
+    f.seek(0)
+    f.write(header)
+
+
+def search(n: int, before: callable) -> int:
+    """Return the first of range(n) which is not before the target, those before being a prefix"""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if before(mid):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def get_type(name: str) -> str:
+    """Return if a sequence is real, random or other by its name"""
+    if re.match("^[a-zA-Z0-9]{6}$", name):
+        return "real"
+    elif name.startswith("length-"):
+        return "random"
+    return "other"
+
+
+def get_sequence(seq_file: str, path: str = CORPUS_FILE) -> str | None:
+    """Return the sequence of the name of a sequence file from the corpus, if it is in it"""
+    if not os.path.isfile(path):
+        return None
+    with Corpus(path) as corpus:
+        return corpus.get_sequence(os.path.basename(seq_file))
+
+
+def read_dir(input_dir: str, max_len: int = None) -> dict[str, str]:
+    """Return the sequences of the files of a folder, shorter than max_len"""
+    sequences = {}
+    for filename in sorted(os.listdir(input_dir)):
+        with open(os.path.join(input_dir, filename)) as f:
+            seq = f.readline().strip()
+        if max_len is None or len(seq) < max_len:
+            sequences[filename] = seq
+    return sequences
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a", "--add",
+        nargs="?", type=str,
+        help="add the sequences of the files in a folder, replacing those with the same name"
+    )
+    parser.add_argument(
+        "-c", "--corpus",
+        nargs="?", type=str, default=CORPUS_FILE,
+        help=f"the path of the corpus, default value: {CORPUS_FILE}"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="rewrite the corpus without the sequences which were removed or replaced"
+    )
+    parser.add_argument(
+        "-l", "--list",
+        action="store_true",
+        help="print the sequences selected"
+    )
+    parser.add_argument(
+        "--max-len",
+        nargs="?", type=int,
+        help="only add and select sequences shorter than this, default: no limit"
+    )
+    parser.add_argument(
+        "--min-len",
+        nargs="?", type=int, default=0,
+        help="only select sequences at least this long, default value: 0"
+    )
+    parser.add_argument(
+        "-r", "--remove",
+        nargs="+", type=str,
+        help="remove the sequences with these names"
+    )
+    parser.add_argument(
+        "-t", "--sequence-type",
+        nargs="?", type=str, default="all", choices=set(TYPES) | {"all"},
+        help="only select sequences of this type, default value: all"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Cube and conquer a single probe: split the folds into cubes which fix the
+dimension each of the first bonds of the chain goes in, and solve the cubes on
+worker processes as unit clauses on top of the encoding, stopping at the first
+SAT cube or once every cube is UNSAT. The dimensions are only enumerated in the
+order of their first bond, as permuting the dimensions of a fold keeps its
+contacts, and there are enough cubes to keep every core busy
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import re
+import threading
+
+import src.encode
+from src import config
+
+# Cubes per worker, so workers which finish their cubes early take others
+CUBES_PER_WORKER = 4
+
+# same(I,J,D): characters I and J are at the same position in dimension D
+SAME = re.compile(r"same\((\d+),(\d+),(\d+)\)")
+
+
+def get_workers() -> int:
+    return config.CUBE_WORKERS or os.cpu_count() or 1
+
+
+def get_patterns(depth: int, dim: int) -> list[tuple[int, ...]]:
+    """
+    Return the dimensions the first depth bonds can go in, up to permuting the
+    dimensions: every bond goes in a dimension used before or the next unused one
+    """
+    patterns = [()]
+    for _ in range(depth):
+        patterns = [p + (d,) for p in patterns for d in range(min(dim, max(p, default=-1) + 2))]
+    return patterns
+
+
+def get_depth(bonds: int, dim: int, workers: int) -> int:
+    """Return the fewest bonds to split on for CUBES_PER_WORKER cubes per worker"""
+    depth = 0
+    while depth < bonds and len(get_patterns(depth, dim)) < workers * CUBES_PER_WORKER:
+        depth += 1
+    return depth
+
+
+def get_cubes(file_path: str, dim: int, workers: int) -> list[list[int]]:
+    """
+    Return the unit clauses of every cube of an encoding, none if it has no
+    same(I,I+1,D) to fix the dimension of the bonds with, as v0 does not
+    """
+    same = {}
+    for name, var in src.encode.get_variable_map(file_path).items():
+        match = SAME.fullmatch(name)
+        if match and int(match.group(2)) == int(match.group(1)) + 1:
+            same[int(match.group(1)), int(match.group(3))] = var
+    bonds = 0
+    while all((bonds, d) in same for d in range(dim)):
+        bonds += 1
+    if not bonds:
+        return []
+    # A bond goes in the one dimension its characters are not the same in
+    return [
+        [-same[k, d] if d == pattern[k] else same[k, d] for k in range(len(pattern)) for d in range(dim)]
+        for pattern in get_patterns(get_depth(bonds, dim, workers), dim)
+    ]
+
+
+def solve_cubes(
+    solver: str,
+    file_path: str,
+    units: list[int] | None,
+    cubes: list[list[int]],
+    workers: int,
+    timeout: float = None,
+    model: bool = False
+) -> tuple[bool | None, list[int]]:
+    """
+    Solve the cubes of an encoding (see `src.encode.start_solver`) on at most
+    workers solvers at once. Return if it is SAT, UNSAT or None if a cube had no
+    answer within timeout seconds, and the true variables of the SAT cube
+    """
+    pending, results = queue.Queue(), queue.Queue()
+    for cube in cubes:
+        pending.put(cube)
+    running, lock, stopped = set(), threading.Lock(), threading.Event()
+
+    def work() -> None:
+        while True:
+            try:
+                cube = pending.get_nowait()
+            except queue.Empty:
+                return
+            if stopped.is_set():
+                results.put((None, []))
+                continue
+            p = src.encode.start_solver(solver, file_path, (units or []) + cube)
+            with lock:
+                running.add(p)
+            if stopped.is_set():
+                src.encode.stop_solver(p)
+            results.put(src.encode.wait_solver(p, model))
+            with lock:
+                running.discard(p)
+
+    def stop() -> None:
+        stopped.set()
+        with lock:
+            for p in list(running):
+                src.encode.stop_solver(p)
+
+    for _ in range(min(workers, len(cubes))):
+        threading.Thread(target=work, daemon=True).start()
+    timer = src.encode.start_timer(timeout, stop)
+
+    # Any SAT cube is a fold, but UNSAT needs every cube to be UNSAT
+    sat, true_vars, counts = False, [], {True: 0, False: 0, None: 0}
+    for _ in cubes:
+        result, cube_vars = results.get()
+        counts[result] += 1
+        if result:
+            sat, true_vars = True, cube_vars
+            break
+        if result is None:
+            sat = None
+    timer.cancel()
+    stop()
+    print(f"{len(cubes)} cubes on {workers} workers, {counts[False]} UNSAT and {counts[None]} without an answer:", end=" ")
+    return sat, true_vars
@@ -0,0 +1,131 @@
+"""
+Iterative deepening of the width of the grid. A goal is first solved on a small
+grid, with every dimension boxed in by assumptions on the order literals. The
+box of a dimension is only enlarged when it is in the core of an UNSAT answer,
+and the grid only grows once no box is, so SAT answers come from encodings a
+fraction of the size while UNSAT is only final on the full grid.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+import time
+
+import src.encode
+import src.incremental
+import src.trace
+
+# Encodings where y(I,P,D) is "character I is at least at position P in dimension D"
+ORDER_VERSIONS = {2, 3, 4}
+
+
+def solve_deepening(
+    seq_file: str,
+    goal: int,
+    dim: int,
+    ver: int,
+    use_cached: bool,
+    solver: str,
+    count_encoding: str = None,
+    timeout: float = None
+) -> tuple[float, float]:
+    """Drop in for `solve_sat` which solves on growing grids"""
+    try:
+        from pysat.formula import CNF
+        from pysat.solvers import Solver
+    except ImportError:
+        raise ImportError("Grid deepening requires pysat, install it with `pip install python-sat`")
+
+    n = len(src.encode.get_sequence(seq_file))
+    full = src.encode.get_grid_diameter(dim, n)
+    widths = get_widths(dim, n, full)
+    name = src.incremental.get_backend(solver, timeout is not None)
+    box = [widths[0]] * dim
+    encode_duration, solve_duration, stats = 0.0, 0.0, {}
+    src.trace.start_probe()
+    deadline = None if timeout is None else time.time() + timeout
+    for w in widths:
+        start = time.time()
+        file_path = src.encode.encode(
+            seq_file, goal, dim, ver, False, use_cached, count_encoding, None if w == full else w)
+        ys = get_position_literals(file_path)
+        encode_duration += time.time() - start
+
+        start = time.time()
+        with src.trace.phase("solve"), Solver(name=name, bootstrap_with=CNF(from_file=file_path).clauses) as s:
+            sat = solve_box(s, ys, box, n, w, deadline)
+            for stat, value in src.trace.get_pysat_statistics(s).items():
+                stats[stat] = stats.get(stat, 0) + value
+        solve_duration += time.time() - start
+        if sat is None:
+            src.trace.write_probe(seq_file, goal, dim, ver, solver, "TIMEOUT", stats)
+            print("TIMEOUT")
+            raise src.encode.Timeout(goal, encode_duration, solve_duration)
+        if sat:
+            src.trace.write_probe(seq_file, goal, dim, ver, solver, "SAT", stats)
+            print(f"SAT in box {box}")
+            return (encode_duration, solve_duration)
+        if w < full:
+            print(f"UNSAT on width {w}, enlarging the grid")
+    src.trace.write_probe(seq_file, goal, dim, ver, solver, "UNSAT", stats)
+    print("UNSAT")
+    return (encode_duration, -solve_duration)
+
+
+def solve_box(
+    s,
+    ys: dict[tuple[int, int, int], int],
+    box: list[int],
+    n: int,
+    w: int,
+    deadline: float = None
+) -> bool | None:
+    """
+    Solve on a grid of width w, enlarging the box in place while it is in the
+    core. Return if it is SAT, UNSAT or None if the deadline passed
+    """
+    while True:
+        # No character beyond the box of the dimensions narrower than the grid
+        walls = {d: [-ys[i, box[d], d] for i in range(n)] for d in range(len(box)) if box[d] < w}
+        assumptions = [lit for lits in walls.values() for lit in lits]
+        if deadline is None:
+            sat = s.solve(assumptions=assumptions)
+        else:
+            sat = src.incremental.solve_limited(s, assumptions, max(0.0, deadline - time.time()))
+        if sat is not False:
+            return sat
+        core = set(s.get_core() or [])
+        binding = [d for d, lits in walls.items() if core & set(lits)]
+        if not binding:
+            return False
+        for d in binding:
+            box[d] = min(w, box[d] + max(1, box[d] // 2))
+        print(f"Box binding in dimensions {binding}, enlarging it to {box}")
+
+
+def can_deepen(ver: int) -> bool:
+    """Return if goals of the encoding version can be solved on growing grids"""
+    if ver not in ORDER_VERSIONS:
+        print(f"No grid deepening for v{ver}, solving on the full grid")
+        return False
+    return True
+
+
+def get_widths(dim: int, n: int, full: int) -> list[int]:
+    """Return the widths of the grids tried, from one which fits a compact fold to the full grid"""
+    widths = [min(full, max(2, math.ceil(n ** (1 / dim)) + 1))]
+    while widths[-1] < full:
+        widths.append(min(full, widths[-1] + max(1, widths[-1] // 2)))
+    return widths
+
+
+def get_position_literals(cnf_file: str) -> dict[tuple[int, int, int], int]:
+    """Return the variables y(I,P,D) of an encoding by (I, P, D)"""
+    pattern = re.compile(r"y\((\d+),(\d+),(\d+)\)")
+    literals = {}
+    for name, var in src.encode.get_variable_map(cnf_file).items():
+        match = pattern.fullmatch(name)
+        if match:
+            literals[tuple(map(int, match.groups()))] = var
+    return literals
@@ -3,17 +3,61 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import gzip
+import lzma
 import os
+import math
+import re
+import resource
+import shutil
 import subprocess
+import threading
 import time
+from collections import deque
+from contextlib import contextmanager
 from typing import Callable
 
+import src.auto
+import src.bounds
+import src.cache
+import src.cardinality
+import src.corpus
+import src.cube
+import src.deepening
+import src.fold
+import src.incremental
+import src.maxsat
+import src.native
+import src.portfolio
+import src.store
+import src.trace
+import src.verify
+from src import config
 from src.config import POLICIES, TEST_REPEATS, SOLVERS
 from src.search_policies import *
 
 RESULTS_DIR = "results/"
 BULE_DIR = "bule/"
-CSV_HEADER = "name,len,dim,ver,solver,policy,encode_time,total_time,sat_time,vars,cls"
+CSV_HEADER = "name,len,dim,ver,solver,policy,encode_time,total_time,sat_time,vars,cls,status,lower,upper"
+
+# Base encodings by (sequence file, dimension, version, counting encoding)
+BASES: dict[tuple, tuple[str, dict[int, int]]] = {}
+
+# Answers of SAT solvers by their exit code and by their status line
+EXIT_CODES = {10: True, 20: False}
+STATUS = {b"SATISFIABLE": True, b"UNSATISFIABLE": False}
+
+# Openers of compressed DIMACS files by their suffix
+CNF_OPENERS = {".gz": functools.partial(gzip.open, compresslevel=6), ".xz": lzma.open}
+
+
+class Timeout(Exception):
+    """A probe which ran out of its time budget before the solver gave an answer"""
+
+    def __init__(self, goal: int, encode_time: float, solve_time: float) -> None:
+        super().__init__(f"Ran out of time solving {goal}")
+        self.goal, self.encode_time, self.solve_time = goal, encode_time, solve_time
 
 
 def main() -> None:
@@ -26,6 +70,28 @@ def main() -> None:
     use_cached = args.use_cached
     policy = eval(args.policy)
     solver = args.solver
+    if args.auto:
+        solver, ver, policy_name = src.auto.choose(get_sequence(input_file), dim)
+        policy = eval(policy_name)
+    config.INCREMENTAL = args.incremental
+    config.NATIVE_ENCODING = args.native
+    config.SPLIT_BASE = args.split_base
+    if args.portfolio:
+        config.PORTFOLIO = args.portfolio
+    config.PARALLEL_PROBES = args.probes
+    config.CUBE = args.cube
+    config.CUBE_WORKERS = args.cube_workers
+    if args.cache_budget is not None:
+        config.CACHE_BUDGET = args.cache_budget
+    config.CNF_COMPRESSION = args.compress
+    config.HEURISTIC = args.heuristic
+    config.DEEPENING = args.deepen
+    config.DECODE_FOLDS = args.fold
+    config.PROBE_TIMEOUT = args.probe_timeout
+    config.PROBE_CPU_TIMEOUT = args.probe_cpu_timeout
+    config.SEARCH_TIMEOUT = args.search_timeout
+    config.TRACE = args.trace
+    config.MAXSAT_SOLVER = args.maxsat_solver
     if args.track:
         global RESULTS_DIR
         RESULTS_DIR = os.path.join(RESULTS_DIR, args.results_dir)
@@ -37,11 +103,17 @@ def main() -> None:
             encode(input_file, 1, dim, ver, True, True)
     elif args.solve:
         print("Attempting to solve\n")
-        print(f"Max contacts: {policy(input_file, dim, ver, use_cached, solver)}")
+        r = policy(input_file, dim, ver, use_cached, solver, args.count_encoding)
+        print(f"Max contacts: {r}")
+        verify_result(input_file, dim, r)
+    elif args.wcnf:
+        print("Attempting to encode for MaxSAT\n")
+        file_path = encode(input_file, 0, dim, ver, False, use_cached, args.count_encoding)
+        print(f"Encoding wcnf   : {src.maxsat.write_wcnf(file_path, src.maxsat.get_soft_literals(file_path))}")
     else:
         print("Attempting to encode\n")
-        file_path = encode(input_file, goal_contacts, dim, ver, False, use_cached)
-        print(f"Encoding bul    : {file_path.replace('cnf', 'bul')}")
+        file_path = encode(input_file, goal_contacts, dim, ver, False, use_cached, args.count_encoding)
+        print(f"Encoding bul    : {file_path.split('.cnf')[0].replace('cnf', 'bul')}.bul")
         print(f"Encoding dimacs : {file_path}")
 
 
@@ -67,40 +139,192 @@ def timed_solve(
         print(policy.__name__)
         r = policy(seq_file, dim, ver, use_cached, solver)
         print(r["max_contacts"])
-        v, c = get_num_vars_and_clauses(filename, dim, ver, r['max_contacts'])
+        verify_result(seq_file, dim, r)
+        v, c = get_result_size(filename, dim, ver, r)
         print(results_file)
-        results = [filename,length,dim,ver,solver,pol_name,r["encode_time"],r["solve_time"],r["sat_solve_time"],v,c]
-        string = ",".join(list(map(str, results)))
-        results_list.append(string)
+        results = [filename,length,dim,ver,solver,pol_name,r["encode_time"],r["solve_time"],r["sat_solve_time"],v,c,
+                   r["status"],r["lower"],r["upper"]]
+        results_list.append(results)
 
     # Write results in csv file
     with open(results_file, "w+") as f:
         f.write(f"{CSV_HEADER}\n")
-        for string in results_list:
-            f.write(f"{string}\n")
-
-
-def solve_sat(seq_file: str, goal: int, dim: int, ver: int, use_cached: bool, solver: str, count_encoding: str = None) -> tuple[float, float]:
-    """Encode and solve input, then return tuple (encode duration, solve duration)"""
+        for results in results_list:
+            f.write(f"{','.join(map(str, results))}\n")
+    src.store.add_results(os.path.basename(os.path.normpath(RESULTS_DIR)), results_list, results_file)
+
+
+def get_result_size(filename: str, dim: int, ver: int, r: dict) -> tuple[int | str, int | str]:
+    """
+    Return the variables and clauses of the encoding a search solved at its max
+    contacts, or NA if it never probed them, as when it ran out of time or a
+    heuristic fold reached them
+    """
+    # Policies which did not solve the encoding of their max contacts give the size of the one they solved
+    if "vars" in r:
+        return r["vars"], r["cls"]
+    cnf_file = find_cnf(f"models/cnf/{filename}_{dim}d_v{ver}_{r['max_contacts']}c.cnf")
+    base_file = find_cnf(f"models/cnf/{filename}_{dim}d_v{ver}_counter_base.cnf")
+    if r["max_contacts"] not in r["probed"] or not (os.path.isfile(cnf_file) or os.path.isfile(base_file)):
+        return "NA", "NA"
+    return get_num_vars_and_clauses(filename, dim, ver, r["max_contacts"])
+
+
+def verify_result(seq_file: str, dim: int, r: dict) -> None:
+    """Check an optimum against the references, a search which ran out of time only has bounds"""
+    if r["status"] == "optimal":
+        src.verify.verify_optimum(seq_file, dim, r["max_contacts"])
+
+
+def solve_sat(
+    seq_file: str,
+    goal: int,
+    dim: int,
+    ver: int,
+    use_cached: bool,
+    solver: str,
+    count_encoding: str = None,
+    timeout: float = None
+) -> tuple[float, float]:
+    """
+    Encode and solve input, then return tuple (encode duration, solve duration).
+    Raise Timeout if there is no answer within timeout seconds of starting
+    """
+    if config.INCREMENTAL:
+        return src.incremental.solve_incremental(seq_file, goal, dim, ver, use_cached, solver, count_encoding, timeout)
+    if config.DEEPENING and src.deepening.can_deepen(ver):
+        return src.deepening.solve_deepening(seq_file, goal, dim, ver, use_cached, solver, count_encoding, timeout)
+
+    src.trace.start_probe()
     start = time.time()
-    file_path = encode(seq_file, goal, dim, ver, False, use_cached, count_encoding)
-    print(f"filepath: {file_path}")
+    if use_split_base(count_encoding):
+        # Stream the base and the goal's bound into the solver without writing a file
+        file_path, bounds = get_base(seq_file, dim, ver, use_cached)
+        units = get_bound_units(bounds, get_sequence(seq_file), goal, ver)
+        print(f"filepath: {file_path} + {units or []}")
+    else:
+        file_path, units = encode(seq_file, goal, dim, ver, False, use_cached, count_encoding), None
+        print(f"filepath: {file_path}")
+    # A goal whose bound cannot be reached is UNSAT without splitting it
+    cubes = src.cube.get_cubes(file_path, dim, src.cube.get_workers()) if config.CUBE and units != [] else []
+    if config.CUBE and units != [] and not cubes:
+        print(f"No bonds to split v{ver} on, solving it whole")
     encode_duration = time.time() - start
+    budget = None if timeout is None else max(0.0, timeout - encode_duration)
 
     start = time.time()
-    output = str(subprocess.run([solver, file_path], capture_output=True).stdout)
+    comments = [] if config.TRACE else None
+    with src.trace.phase("solve"):
+        if solver == "portfolio":
+            sat, model = src.portfolio.solve_portfolio(
+                file_path, units, config.PORTFOLIO, budget, config.DECODE_FOLDS, comments)
+        elif cubes:
+            sat, model = src.cube.solve_cubes(
+                solver, file_path, units, cubes, src.cube.get_workers(), budget, config.DECODE_FOLDS)
+        else:
+            p = start_solver(solver, file_path, units)
+            timer = start_timer(budget, stop_solver, p)
+            sat, model = wait_solver(p, config.DECODE_FOLDS, comments)
+            timer.cancel()
+    with src.trace.phase("parse"):
+        stats = src.trace.parse_statistics(comments or [])
+        if sat and config.DECODE_FOLDS:
+            fold_file = src.fold.write_fold(seq_file, goal, dim, ver, file_path, model)
+            print(f"fold: {fold_file}")
+            src.verify.verify_fold_file(fold_file, goal)
     solve_duration = time.time() - start
 
-    if "UNSAT" in output:
+    timed_out = sat is None and is_out_of_budget(budget, solve_duration)
+    result = {True: "SAT", False: "UNSAT", None: "TIMEOUT" if timed_out else "NA"}[sat]
+    src.trace.write_probe(seq_file, goal, dim, ver, solver, result, stats)
+    if sat is False:
         print("UNSAT")
         return (encode_duration, -solve_duration)
-    elif "SAT" in output:
+    elif sat:
         print("SAT")
         return (encode_duration, solve_duration)
-    print(f"There was a bug in solving with bule. Output: {output}")
+    elif timed_out:
+        print("TIMEOUT")
+        raise Timeout(goal, encode_duration, solve_duration)
+    print(f"There was a bug in solving with {solver}")
     return (0, 0)
 
 
+def start_solver(solver: str, file_path: str, units: list[int] = None) -> subprocess.Popen:
+    """
+    Start the solver on a DIMACS file, or if it is compressed or units are given
+    stream it decompressed into its stdin together with the unit clauses of the goal
+    """
+    limit = limit_cpu if config.PROBE_CPU_TIMEOUT is not None else None
+    if units is None and not is_compressed(file_path):
+        return subprocess.Popen([solver, file_path], stdout=subprocess.PIPE, preexec_fn=limit)
+    p = subprocess.Popen([solver], stdin=subprocess.PIPE, stdout=subprocess.PIPE, preexec_fn=limit)
+    threading.Thread(target=feed_cnf, args=(file_path, units, p.stdin), daemon=True).start()
+    return p
+
+
+def wait_solver(
+    p: subprocess.Popen,
+    model: bool = False,
+    comments: list[bytes] = None
+) -> tuple[bool | None, list[int]]:
+    """
+    Read the output of the solver line by line until its status line, and its
+    model after it if wanted, or to the end if its comment lines are collected.
+    Return if it is SAT, UNSAT or None if neither, preferring the exit code,
+    and the true variables of the model
+    """
+    sat, true_vars, tail = None, [], deque(maxlen=10)
+    for line in p.stdout:
+        if line.startswith(b"s "):
+            sat = STATUS.get(line.split()[-1])
+            if not (model and sat) and comments is None:
+                break
+        elif line.startswith(b"v ") and model:
+            true_vars.extend(lit for lit in map(int, line.split()[1:]) if lit > 0)
+        else:
+            tail.append(line)
+            if comments is not None and line.startswith(b"c "):
+                comments.append(line)
+    p.stdout.close()
+    sat = EXIT_CODES.get(p.wait(), sat)
+    if sat is None and p.returncode >= 0:
+        # Solvers which were stopped have nothing to show
+        print(b"".join(tail).decode(errors="replace"))
+    return sat, true_vars
+
+
+def stop_solver(p: subprocess.Popen) -> None:
+    """Kill a solver that is still running, asking it to terminate first"""
+    if p.poll() is None:
+        p.terminate()
+        try:
+            p.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            p.wait()
+
+
+def start_timer(timeout: float | None, function: Callable, *args) -> threading.Timer:
+    """Call the function after timeout seconds unless the timer is cancelled, never if None"""
+    timer = threading.Timer(timeout, function, args)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def limit_cpu() -> None:
+    """Limit the CPU time of a solver to the probe budget, run in its process before it starts"""
+    limit = math.ceil(config.PROBE_CPU_TIMEOUT)
+    # The solver gets SIGXCPU at the soft limit and is killed at the hard limit
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + 1))
+
+
+def is_out_of_budget(budget: float | None, duration: float) -> bool:
+    """Return if a solver without an answer was stopped by the wall clock or CPU time budget"""
+    return (budget is not None and duration >= budget) or config.PROBE_CPU_TIMEOUT is not None
+
+
 def encode(
     seq_file: str,
     goal: int,
@@ -108,18 +332,250 @@ def encode(
     ver: int,
     tracked: bool,
     use_cached: bool,
-    count_encoding: str = "counter.bul"
+    count_encoding: str = "counter.bul",
+    width: int = None
 ) -> str:
-    """Generate bule encoding and write it to a file in the models folder that path"""
+    """
+    Generate bule encoding and write it to a file in the models folder that path,
+    on a grid of the given width instead of the grid diameter if set
+    """
     if count_encoding == None:
         count_encoding = "counter.bul"
     filename = seq_file.split("/")[-1]
     seq = get_sequence(seq_file)
-    w = get_grid_diameter(dim, len(seq))
-    in_file = f"models/bul/{filename}_{dim}d_v{ver}_{goal}c.bul"
+    # Encodings on a smaller grid are kept apart from the default ones
+    name = f"{filename}_{dim}d_v{ver}_{goal}c" + (f"_w{width}" if width else "")
+    in_file = f"models/bul/{name}.bul"
+    native = use_native_encoding(ver, count_encoding)
+    if not native:
+        with src.trace.phase("bul"):
+            write_bul(in_file, seq, dim, goal, width)
+
+    # Generate encoding, the cardinality encodings of src.cardinality are added after grounding
+    counter = src.cardinality.ENCODINGS.get(count_encoding)
+    bule_files = get_encoding_file(dim, ver) + ("" if counter else f" {BULE_DIR + count_encoding}")
+    output = get_cnf_path(f"models/cnf/{name}.cnf")
+    start = time.time()
+    split = use_split_base(count_encoding) and not width
+    key = get_cache_key(seq, dim, ver, goal, bule_files, native, width, count_encoding) if use_cached and not split else None
+    if split:
+        # Goals are cheap to add to the base, which is cached on its own
+        base, bounds = get_base(seq_file, dim, ver, use_cached)
+        with src.trace.phase("cnf"), replacing(output) as temp, open_cnf(temp, "wb") as f:
+            write_goal_cnf(base, get_bound_units(bounds, seq, goal, ver), f)
+        encode_time = time.time() - start
+    elif key and src.cache.fetch(key, output):
+        encode_time = 0
+    else:
+        with replacing(output) as temp:
+            if native:
+                w = width or get_grid_diameter(dim, len(seq))
+                with src.trace.phase("ground"):
+                    variables, blocks = src.native.ENCODERS[ver](seq, dim, w, goal, counter=counter)
+                with src.trace.phase("cnf"), open_cnf(temp, "wt") as f:
+                    src.native.write_dimacs(f, variables, blocks)
+            else:
+                with src.trace.phase("ground"):
+                    run_bule(bule_files, in_file, temp)
+                    if counter:
+                        # v0 counts the contacts of adjacent "1"s too
+                        bound = goal + (get_adjacent_ones(seq) if ver == 0 else 0)
+                        src.cardinality.add_to_cnf(temp, count_encoding, bound)
+        encode_time = time.time() - start
+        if key:
+            src.cache.store(key, output)
+    if config.DECODE_FOLDS:
+        src.fold.load_variable_map(output, ver)
+
+    if tracked:
+        result_name = f"{filename}_{dim}d_v{ver}_NAs_NAp"
+        results_file = f"{os.path.join(RESULTS_DIR, result_name)}.csv"
+        vars, cls = get_num_vars_and_clauses(filename, dim, ver, goal)
+        results = [filename, len(seq), dim, ver, "NA", "NA", encode_time, 0, 0, vars, cls, "NA", "NA", "NA"]
+        with open(results_file, "w+") as f:
+            f.write(f"{CSV_HEADER}\n")
+            f.write(",".join(map(str, results)))
+        src.store.add_results(os.path.basename(os.path.normpath(RESULTS_DIR)), [results], results_file)
+    return output
+
+
+def encode_base(seq_file: str, dim: int, ver: int, use_cached: bool) -> str:
+    """
+    Generate a goal independent encoding where the goal is left to assumptions
+    on the counter's bound literals, up to the max contacts of the sequence
+    """
+    filename = seq_file.split("/")[-1]
+    seq = get_sequence(seq_file)
+    max_contacts = src.bounds.get_contact_bound(seq, dim)
+    in_file = f"models/bul/{filename}_{dim}d_v{ver}_base.bul"
+    native = use_native_encoding(ver, "counter.bul")
+    if not native:
+        write_bul(in_file, seq, dim, max_contacts)
+
+    bule_files = f"{get_encoding_file(dim, ver)} {BULE_DIR}counter_assume.bul"
+    output = get_cnf_path(f"models/cnf/{filename}_{dim}d_v{ver}_counter_base.cnf")
+    key = get_cache_key(seq, dim, ver, f"base{max_contacts}", bule_files, native)
+    if not use_cached or not src.cache.fetch(key, output):
+        with replacing(output) as temp:
+            if native:
+                w = get_grid_diameter(dim, len(seq))
+                with open_cnf(temp, "wt") as f:
+                    src.native.write_dimacs(f, *src.native.ENCODERS[ver](seq, dim, w, max_contacts, True))
+            else:
+                run_bule(bule_files, in_file, temp)
+        if use_cached:
+            src.cache.store(key, output)
+    if config.DECODE_FOLDS:
+        src.fold.load_variable_map(output, ver)
+    return output
+
+
+def run_bule(bule_files: str, in_file: str, output: str) -> None:
+    """Ground the bule files into output, compressing it on the way if needed"""
+    if not is_compressed(output):
+        subprocess.run(f"bule --output dimacs {bule_files} {in_file} > {output}", shell=True)
+        return
+    p = subprocess.Popen(f"bule --output dimacs {bule_files} {in_file}", shell=True, stdout=subprocess.PIPE)
+    with open_cnf(output, "wb") as f:
+        shutil.copyfileobj(p.stdout, f)
+    p.wait()
+
+
+def get_cnf_path(path: str) -> str:
+    """Return the path of a DIMACS file with the suffix of the compression in use"""
+    return path + (f".{config.CNF_COMPRESSION}" if config.CNF_COMPRESSION else "")
+
+
+def find_cnf(path: str) -> str:
+    """Return the path of a DIMACS file as it was written, compressed or not"""
+    for suffix in ["", *CNF_OPENERS]:
+        if os.path.isfile(path + suffix):
+            return path + suffix
+    return get_cnf_path(path)
+
+
+def is_compressed(path: str) -> bool:
+    return os.path.splitext(path)[1] in CNF_OPENERS
+
+
+def open_cnf(path: str, mode: str = "rt"):
+    """Open a DIMACS file, decompressing or compressing it by its suffix"""
+    opener = CNF_OPENERS.get(os.path.splitext(path)[1])
+    return opener(path, mode) if opener else open(path, mode)
+
+
+def get_temp_path(path: str) -> str:
+    """Return a path next to path for this process and thread to write, with the same suffix"""
+    head, tail = os.path.split(path)
+    return os.path.join(head, f".{os.getpid()}-{threading.get_ident()}.{tail}")
+
+
+@contextmanager
+def replacing(path: str):
+    """
+    Yield a temporary path to write instead of path, which then replaces path.
+    Jobs writing the same file never see each other's half written files, and
+    files linked into the cache are replaced instead of overwritten
+    """
+    temp = get_temp_path(path)
+    try:
+        yield temp
+        os.replace(temp, path)
+    finally:
+        if os.path.isfile(temp):
+            os.remove(temp)
+
+
+def get_cache_key(
+    seq: str,
+    dim: int,
+    ver: int,
+    goal: int | str,
+    bule_files: str,
+    native: bool,
+    width: int = None,
+    count_encoding: str = "counter.bul"
+) -> str:
+    """Return the key of an encoding, which changes with any of the files used to generate it"""
+    files = [src.native.__file__] if native else bule_files.split()
+    w = width or get_grid_diameter(dim, len(seq))
+    params = (seq, dim, ver, goal, w, native, config.CNF_COMPRESSION)
+    if count_encoding in src.cardinality.ENCODINGS:
+        files, params = files + [src.cardinality.__file__], params + (count_encoding,)
+    return src.cache.get_key(*params, files=files)
+
+
+def get_base(seq_file: str, dim: int, ver: int, use_cached: bool) -> tuple[str, dict[int, int]]:
+    """Return the base encoding and its bound literals, encoding it once per run"""
+    key = (seq_file, dim, ver, "counter.bul")
+    if key not in BASES:
+        file_path = encode_base(seq_file, dim, ver, use_cached)
+        BASES[key] = (file_path, get_bound_literals(file_path))
+    return BASES[key]
+
+
+def get_bound_units(bounds: dict[int, int], seq: str, goal: int, ver: int) -> list[int] | None:
+    """
+    Return the unit clauses of the goal, None if its bound always holds, as
+    for a goal of 0, or none if its bound cannot be reached
+    """
+    # The original encoding counts the adjacent "1"s as contacts as well
+    bound = goal + (get_adjacent_ones(seq) if ver == 0 else 0)
+    if bound <= 0:
+        return None
+    return [bounds[bound]] if bound in bounds else []
+
+
+def write_goal_cnf(base_file: str, units: list[int] | None, f) -> None:
+    """Stream the base encoding into the binary file f with the unit clauses of a goal, if any"""
+    added = 0 if units is None else max(1, len(units))
+    with open_cnf(base_file, "rb") as base:
+        for line in base:
+            if line.startswith(b"p"):
+                _, _, num_vars, num_clauses = line.split()
+                f.write(f"p cnf {int(num_vars)} {int(num_clauses) + added}\n".encode())
+                break
+            f.write(line)
+        shutil.copyfileobj(base, f)
+    if units is not None:
+        # An empty clause if the bound cannot be reached
+        f.write("".join(f"{lit} 0\n" for lit in units).encode() if units else b"0\n")
+
+
+def feed_cnf(file_path: str, units: list[int] | None, stdin) -> None:
+    """Write an encoding, or a goal's if units are given, into a solver's stdin which may close early"""
+    try:
+        if units is None:
+            with open_cnf(file_path, "rb") as f:
+                shutil.copyfileobj(f, stdin)
+        else:
+            write_goal_cnf(file_path, units, stdin)
+        stdin.close()
+    except BrokenPipeError:
+        pass
+
+
+def use_split_base(count_encoding: str) -> bool:
+    """Return if goals are encoded from a cached base instead of from scratch"""
+    return config.SPLIT_BASE and count_encoding in (None, "counter.bul")
+
+
+def use_native_encoding(ver: int, count_encoding: str) -> bool:
+    """Return if the encoding is generated natively instead of with bule"""
+    if not config.NATIVE_ENCODING:
+        return False
+    if ver not in src.native.ENCODERS or count_encoding not in ("counter.bul", *src.cardinality.ENCODINGS):
+        print(f"No native encoding for v{ver} with {count_encoding}, using bule")
+        return False
+    return True
+
+
+def write_bul(in_file: str, seq: str, dim: int, goal: int, width: int = None) -> None:
+    """Write the facts of the sequence, grid width and goal into a bule file"""
+    w = width or get_grid_diameter(dim, len(seq))
 
     # Number of contacts = adjacent "1"s minus offset
-    with open(in_file, "w+") as f:
+    with replacing(in_file) as temp, open(temp, "w+") as f:
         f.write(f"% {seq}\n\n")
         f.writelines(
             [f"#ground sequence[{i}, {c}].\n" for i, c in enumerate(seq)] + ["\n"]
@@ -129,24 +585,37 @@ def encode(
             f"#ground goal[{(get_adjacent_ones(seq) + goal)}].\n",
             f"#ground dim[0..{dim - 1}].\n"
         ])
-    
-    # Generate encoding
-    bule_files = f"{get_encoding_file(dim, ver)} {BULE_DIR + count_encoding}"
-    output = f"models/cnf/{filename}_{dim}d_v{ver}_{goal}c.cnf"
-    start = time.time()
-    if not use_cached or not os.path.isfile(output) or os.path.getsize(output) == 0:
-        subprocess.run(f"bule --output dimacs {bule_files} {in_file} > {output}", shell=True)
-        encode_time = time.time() - start
-    else:
-        encode_time = 0
 
-    if tracked:
-        result_name = f"{filename}_{dim}d_v{ver}_NAs_NAp"
-        with open(f"{os.path.join(RESULTS_DIR, result_name)}.csv", "w+") as f:
-            vars, cls = get_num_vars_and_clauses(filename, dim, ver, goal)
-            f.write(f"{CSV_HEADER}\n")
-            f.write(f"{filename},{len(seq)},{dim},{ver},NA,NA,{encode_time},0,0,{vars},{cls}")
-    return output
+
+def get_variable_map(cnf_file: str) -> dict[str, int]:
+    """Read the symbol table from the `c <var> <name>` comments of a DIMACS file"""
+    variables = {}
+    with open_cnf(cnf_file) as f:
+        for line in f:
+            if not line.startswith("c"):
+                continue
+            tokens = line[1:].split(maxsplit=1)
+            if len(tokens) != 2:
+                continue
+            var, name = tokens if tokens[0].isdigit() else reversed(tokens)
+            if var.strip().isdigit():
+                variables[name.replace(" ", "").strip()] = int(var)
+    return variables
+
+
+def get_bound_literals(cnf_file: str) -> dict[int, int]:
+    """Return map of bound to the variable of "at least bound contacts" of a base encoding"""
+    counts = {}
+    pattern = re.compile(r"count\(0,(-?\d+),(\d+)\)")
+    for name, var in get_variable_map(cnf_file).items():
+        match = pattern.fullmatch(name)
+        if match:
+            counts[tuple(map(int, match.groups()))] = var
+    if not counts:
+        print(f"Could not find the bound literals of {cnf_file}")
+        return {}
+    last = max(i for i, _ in counts)
+    return {j: var for (i, j), var in counts.items() if i == last}
 
 
 def get_encoding_file(dim: int, v: int) -> str:
@@ -154,9 +623,23 @@ def get_encoding_file(dim: int, v: int) -> str:
 
 
 def get_num_vars_and_clauses(filename: str, dim: int, v: int, goal: int) -> tuple[int, int]:
-    cnf_filename = f"models/cnf/{filename}_{dim}d_v{v}_{goal}c.cnf"
-    with open(cnf_filename, "r") as f:
-        line = f.readline().split()
+    cnf_filename = find_cnf(f"models/cnf/{filename}_{dim}d_v{v}_{goal}c.cnf")
+    base_filename = find_cnf(f"models/cnf/{filename}_{dim}d_v{v}_counter_base.cnf")
+    if not os.path.isfile(cnf_filename) and os.path.isfile(base_filename):
+        # Goals streamed from the base add a single unit clause
+        num_vars, num_clauses = get_cnf_header(base_filename)
+        return num_vars, num_clauses + 1
+    return get_cnf_header(cnf_filename)
+
+
+def get_cnf_header(cnf_filename: str) -> tuple[int, int]:
+    """Return the number of variables and clauses in the header of a DIMACS file"""
+    # Only the lines up to the header are decompressed
+    with open_cnf(cnf_filename) as f:
+        line = f.readline()
+        while line.startswith("c"):
+            line = f.readline()
+        line = line.split()
         if not line:
             print(f"Could not find {cnf_filename}")
             return
@@ -164,6 +647,11 @@ def get_num_vars_and_clauses(filename: str, dim: int, v: int, goal: int) -> tupl
 
 
 def get_sequence(seq_file: str) -> str:
+    if not os.path.isfile(seq_file):
+        # The sequence may only be in the corpus
+        seq = src.corpus.get_sequence(seq_file)
+        if seq is not None:
+            return seq
     with open(seq_file, "r") as f:
         # Return the last "\n"
         return f.readline()[:-1]
@@ -196,6 +684,41 @@ def parse_args() -> argparse.Namespace:
         "input_file",
         help="the path to the input file containing a string of 1s and 0s"
     )
+    parser.add_argument(
+        "--cache-budget",
+        nargs="?", type=int,
+        help="the size in bytes the cache of encodings used by --use-cached is kept under"
+    )
+    parser.add_argument(
+        "--count-encoding",
+        nargs="?", type=str, default="counter.bul", choices=["counter.bul", "cc_a.bul", *src.cardinality.ENCODINGS],
+        help="the encoding of the number of contacts, a bule file or one of src.cardinality, default value: counter.bul"
+    )
+    parser.add_argument(
+        "-a", "--auto",
+        action="store_true",
+        help="use the solver, version and policy expected to be fastest from past results instead of --solver, -v and -p"
+    )
+    parser.add_argument(
+        "--cube",
+        action="store_true",
+        help="split every probe into cubes on the dimensions of the first bonds and solve them at once"
+    )
+    parser.add_argument(
+        "--cube-workers",
+        nargs="?", type=int,
+        help="the number of solvers the cubes of a probe are solved on at once, default: every core"
+    )
+    parser.add_argument(
+        "-z", "--compress",
+        nargs="?", type=str, choices={"gz", "xz"},
+        help="compress the dimacs files with gzip or xz, which are decompressed into the solver"
+    )
+    parser.add_argument(
+        "--deepen",
+        action="store_true",
+        help="solve every goal on a small grid first, growing it only where an UNSAT core needs it"
+    )
     parser.add_argument(
         "-d", "--dimension",
         nargs="?", type=int, default=2, choices={2, 3},
@@ -206,12 +729,52 @@ def parse_args() -> argparse.Namespace:
         nargs="?", type=int, default=1,
         help="the goal number of (H-H) contacts, default value: 1"
     )
+    parser.add_argument(
+        "-f", "--fold",
+        action="store_true",
+        help="decode the fold of SAT answers from the solver's model into models/cnf"
+    )
+    parser.add_argument(
+        "--heuristic",
+        action="store_true",
+        help="start the search from the contacts of a heuristic fold instead of from 0"
+    )
+    parser.add_argument(
+        "-i", "--incremental",
+        action="store_true",
+        help="solve every goal with one encoding and a persistent solver using assumptions"
+    )
+    parser.add_argument(
+        "-k", "--probes",
+        nargs="?", type=int,
+        help="the number of goals probed at once by the parallel search, default: every core"
+    )
+    parser.add_argument(
+        "--maxsat-solver",
+        nargs="?", type=str,
+        help="the MaxSAT solver binary the maxsat_policy runs on the WCNF, default: RC2 from pysat"
+    )
+    parser.add_argument(
+        "-n", "--native",
+        action="store_true",
+        help="generate v2 and v4 encodings with the counter encoding natively instead of with bule"
+    )
     parser.add_argument(
         "-p", "--policy",
         nargs="?", type=str, default="linear_search_policy",
         choices=set(POLICIES),
         help="the search policy used to find the maximum number of contacts"
     )
+    parser.add_argument(
+        "--probe-timeout",
+        nargs="?", type=float,
+        help="the wall clock seconds a single goal may take, default: no limit"
+    )
+    parser.add_argument(
+        "--probe-cpu-timeout",
+        nargs="?", type=float,
+        help="the CPU seconds a solver may use on a single goal, default: no limit"
+    )
     parser.add_argument(
         "-r", "--results-dir",
         nargs="?", type=str, default="encoding",
@@ -223,11 +786,31 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="solve for the maximum number of contacts"
     )
+    parser.add_argument(
+        "--search-timeout",
+        nargs="?", type=float,
+        help="the wall clock seconds a search may take, returning the bounds proven so far, default: no limit"
+    )
+    parser.add_argument(
+        "-b", "--split-base",
+        action="store_true",
+        help="encode a goal independent base once and only add the bound clause per goal"
+    )
     parser.add_argument(
         "--solver",
         nargs="?", type=str, default="kissat",
-        choices=set(SOLVERS),
-        help="the SAT solver used"
+        choices=set(SOLVERS) | {"portfolio"},
+        help="the SAT solver used, or portfolio to race several solvers"
+    )
+    parser.add_argument(
+        "--portfolio",
+        nargs="+", type=str, choices=set(SOLVERS),
+        help="the solvers raced by the portfolio solver"
+    )
+    parser.add_argument(
+        "--trace",
+        nargs="?", type=str, const=src.trace.TRACE_FILE,
+        help=f"append the phases and solver statistics of every probe to a JSONL file, default file: {src.trace.TRACE_FILE}"
     )
     parser.add_argument(
         "-t", "--track",
@@ -239,10 +822,15 @@ def parse_args() -> argparse.Namespace:
         nargs="?", type=int, default=2,
         help="Select which encoding version to use"
     )
+    parser.add_argument(
+        "--wcnf",
+        action="store_true",
+        help="encode the fold constraints as hard and the contacts as soft clauses in a WCNF file"
+    )
     parser.add_argument(
         "-u", "--use-cached",
         action="store_true",
-        help="use the already generated dimacs file when testing multiple times"
+        help="use the cached dimacs file if nothing it depends on has changed"
     )
     return parser.parse_args()
 
@@ -0,0 +1,128 @@
+"""
+Decode the model of a solver into the coordinates of every character, for every
+encoding version and dimension, through the position variables of an encoding
+which are saved next to it when it is generated, with the inode, size and mtime
+of the encoding they were read from
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+
+import src.encode
+
+# Position variables of each version: v0 places character I at point c(X,Y[,Z]),
+# v1 at position P in dimension D and the order encodings at least at P in D
+PATTERNS = {
+    0: re.compile(r"x\((\d+),c\(([\d,]+)\)\)"),
+    1: re.compile(r"x\((\d+),(\d+),(\d+)\)"),
+    2: re.compile(r"y\((\d+),(\d+),(\d+)\)"),
+    3: re.compile(r"y\((\d+),(\d+),(\d+)\)"),
+    4: re.compile(r"y\((\d+),(\d+),(\d+)\)")
+}
+
+# Position variables read in this process by encoding and stamp, as every probe decodes a fold
+MAPS: dict[tuple[str, tuple[int, ...]], dict[int, list[int]]] = {}
+
+
+def get_map_path(cnf_file: str) -> str:
+    return re.sub(r"\.cnf(\.\w+)?$", ".map.json", cnf_file)
+
+
+def get_fold_path(seq_file: str, goal: int, dim: int, ver: int) -> str:
+    filename = seq_file.split("/")[-1]
+    return f"models/cnf/{filename}_{dim}d_v{ver}_{goal}c.fold.json"
+
+
+def get_stamp(cnf_file: str) -> list[int]:
+    """
+    Return the inode, size and mtime of an encoding, which change whenever it is
+    written again, as it is replaced by a new file or a link to another entry
+    of the cache, which keeps the mtime of when it was cached
+    """
+    stat = os.stat(cnf_file)
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def save_variable_map(cnf_file: str, ver: int, stamp: list[int] = None) -> dict[int, list[int]]:
+    """Write the position variables of an encoding next to it and return them"""
+    positions = {}
+    for name, var in src.encode.get_variable_map(cnf_file).items():
+        match = PATTERNS[ver].fullmatch(name)
+        if match:
+            positions[var] = [int(x) for group in match.groups() for x in group.split(",")]
+    with src.encode.replacing(get_map_path(cnf_file)) as temp, open(temp, "w+") as f:
+        json.dump({"stamp": stamp or get_stamp(cnf_file), "positions": positions}, f)
+    return positions
+
+
+def load_variable_map(cnf_file: str, ver: int) -> dict[int, list[int]]:
+    """
+    Return the position variables of an encoding, reading them again if they
+    were saved for another encoding than the one at cnf_file now
+    """
+    map_file, stamp = get_map_path(cnf_file), get_stamp(cnf_file)
+    key = (cnf_file, tuple(stamp))
+    if key not in MAPS:
+        saved = {}
+        if os.path.isfile(map_file):
+            with open(map_file) as f:
+                saved = json.load(f)
+        if saved.get("stamp") == stamp:
+            MAPS[key] = {int(var): position for var, position in saved["positions"].items()}
+        else:
+            MAPS[key] = save_variable_map(cnf_file, ver, stamp)
+    return MAPS[key]
+
+
+def decode(model: list[int], positions: dict[int, list[int]], n: int, dim: int, ver: int) -> list[list[int]]:
+    """Return the coordinates of the n characters from the true variables of a model"""
+    coords = [[0] * dim for _ in range(n)]
+    for var in model:
+        if var not in positions:
+            continue
+        i, *position = positions[var]
+        if ver == 0:
+            coords[i] = position
+        else:
+            # The highest position which is true, as the order encodings are "at least"
+            p, d = position
+            coords[i][d] = max(coords[i][d], p)
+    return coords
+
+
+def save_fold(fold_file: str, seq: str, dim: int, coords: list[list[int]]) -> None:
+    """Write the coordinates of a fold with the number of contacts they make"""
+    with open(fold_file, "w+") as f:
+        json.dump({"seq": seq, "dim": dim, "contacts": count_contacts(seq, coords), "coords": coords}, f)
+
+
+def load_fold(fold_file: str) -> dict:
+    with open(fold_file) as f:
+        return json.load(f)
+
+
+def count_contacts(seq: str, coords: list[list[int]]) -> int:
+    """Return the number of "1"s next to each other on the grid but not in the sequence"""
+    points = {tuple(c): i for i, c in enumerate(coords)}
+    contacts = 0
+    for i, c in enumerate(coords):
+        if seq[i] != "1":
+            continue
+        for d in range(len(c)):
+            neighbour = tuple(c[:d] + [c[d] + 1] + c[d + 1:])
+            j = points.get(neighbour)
+            if j is not None and seq[j] == "1" and abs(i - j) > 1:
+                contacts += 1
+    return contacts
+
+
+def write_fold(seq_file: str, goal: int, dim: int, ver: int, cnf_file: str, model: list[int]) -> str:
+    """Decode the model of the encoding of a goal and write its fold, returning its path"""
+    seq = src.encode.get_sequence(seq_file)
+    coords = decode(model, load_variable_map(cnf_file, ver), len(seq), dim, ver)
+    fold_file = get_fold_path(seq_file, goal, dim, ver)
+    save_fold(fold_file, seq, dim, coords)
+    return fold_file
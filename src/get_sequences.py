@@ -4,138 +4,143 @@
 
 from __future__ import annotations
 
+import argparse
+import multiprocessing
 import os
-
-from pathlib import Path
-
-
-def write_binary_sequence_and_contact_number(read_file: Path, output_file: Path) -> None:
-    with open(output_file, "w") as f:
-        file_contents = read_file.read_text()
-        remarks = file_contents.split("REMARK")
-
-        for i, x in enumerate(remarks):
-            line = x.strip()
-            remarks[i] = line
-
-        for i, x in enumerate(remarks):
-            if remarks[i-1].find("Native sequence") != -1:
-                original_sequence = ""
-
-                while len(remarks[i]) > 0:
-                    original_sequence += remarks[i]
-                    i += 1
-            elif x.find("*") != -1:
-                coord_str = x[1:]
-
-                while len(remarks[i+1]) > 0:
-                    coord_str += remarks[i+1]
-                    i += 1
+from typing import Iterator
+
+import numpy as np
+
+import src.fold
+from src import config
+
+INPUT_DIR = "input"
+
+# Hydrophobic (1) and polar (0) amino acids
+HP = {
+    **{a: "1" for a in "ACGILMFPWYV"},
+    **{a: "0" for a in "RNDQEHKST"}
+}
+
+# Moves of the native fold on the cubic lattice
+MOVES = {
+    "L": (1, 0, 0), "R": (-1, 0, 0),
+    "F": (0, 1, 0), "B": (0, -1, 0),
+    "U": (0, 0, 1), "D": (0, 0, -1)
+}
+
+
+def main() -> None:
+    args = parse_args()
+    files = [f for path in args.paths for f in get_pdb_files(path, args.filter)]
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(args.native_file) or ".", exist_ok=True)
+    with multiprocessing.Pool(args.workers) as pool, open(args.native_file, "w+") as f:
+        f.write("name,len,seq,contacts\n")
+        # Files are independent, so they are parsed in any order as workers finish them
+        for name, seq, contacts in pool.imap_unordered(read_pdb, files, chunksize=16):
+            print(name)
+            with open(os.path.join(args.output_dir, name), "w") as out:
+                print(seq, file=out)
+            f.write(f"{name},{len(seq)},{seq},{contacts}\n")
+
+
+def get_pdb_files(path: str, suffix: str) -> list[str]:
+    """Return a PDB file, or the files of a directory containing the suffix"""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(os.path.join(path, x) for x in os.listdir(path) if x.find(suffix) != -1)
+
+
+def read_pdb(pdb_file: str) -> tuple[str, str, int]:
+    """Return the name, HP sequence and contacts of the native fold of a PDB file"""
+    filename = os.path.basename(pdb_file)
+    name = filename[:filename.rfind("_")] if "_" in filename else filename
+    with open(pdb_file) as f:
+        amino_acids, moves = parse_remarks(f)
+    seq = get_binary_sequence(amino_acids)
+    coords = get_coordinates(moves)
+    return name, seq, src.fold.count_contacts(seq, coords.tolist())
+
+
+def parse_remarks(lines: Iterator[str]) -> tuple[str, str]:
+    """
+    Return the amino acids and moves of the native fold from the REMARK lines.
+    The block after the "Native sequence" remark is the sequence and the block
+    starting with "*" the moves, each ending at an empty remark. Reading stops
+    after the moves, so the atoms after them are never read
+    """
+    sequence, moves, block = [], [], None
+    previous = ""
+    for line in lines:
+        if not line.startswith("REMARK"):
+            block = None
+            continue
+        remark = line[len("REMARK"):].strip()
+        if block is not None and not remark:
+            if block is moves:
                 break
-
-        binary_sequence = get_binary_sequence(original_sequence)
-        coords = get_coordinates(coord_str)
-        num_contacts = count_contacts(coords, binary_sequence)
-        print(binary_sequence, file=f)
-        # print("\n" + str(num_contacts), file=f)
+            block = None
+        elif block is not None:
+            block.append(remark)
+        elif "Native sequence" in previous:
+            block = sequence
+            block.append(remark)
+        elif "*" in remark:
+            block = moves
+            block.append(remark[1:])
+        previous = remark
+    return "".join(sequence), "".join(moves)
 
 
 def get_binary_sequence(amino_acid_sequence: str) -> str:
-    ONES = ['A', 'C', 'G', 'I', 'L', 'M', 'F', 'P', 'W', 'Y', 'V']
-    ZEROS = ['R', 'N', 'D', 'Q', 'E', 'H', 'K', 'S', 'T']
-
-    sequence = ""
-
-    for x in amino_acid_sequence:
-        if x in ONES:
-            sequence += "1"
-        elif x in ZEROS:
-            sequence += "0"
-        else:
-            raise Exception("ERROR: invalid character in sequence: {x}")
-
-    return sequence
-
-
-def get_coordinates(coord_str) -> list[list[int]]:
-    coords = list()
-    coords.append([0,0,0])
-
-    for i, c in enumerate(coord_str):
-        coord = list(coords[i])
-
-        if c == "L":
-            coord[0] += 1
-        elif c == "R":
-            coord[0] -= 1
-        elif c == "F":
-            coord[1] += 1
-        elif c == "B":
-            coord[1] -= 1
-        elif c == "U":
-            coord[2] += 1
-        elif c == "D":
-            coord[2] -= 1
-        else:
-            raise Exception("Error: unrecognized coordinate character: {c}")
-
-        coords.append(coord)
-
-    return coords
-
-
-def count_contacts(coords: list[list[int]], string: str) -> int:
-    contacts = 0
-
-    for i, x in enumerate(coords):
-        if string[i] == "0":
-            continue
-        for j, y in enumerate(coords[i+3:]):
-            if string[i+3+j] == "0":
-                continue
-            if x[0] == y[0] and x[1] == y[1] and abs(x[2] - y[2]) == 1:
-                contacts += 1
-            elif x[0] == y[0] and x[2] == y[2] and abs(x[1] - y[1]) == 1:
-                contacts += 1
-            elif x[1] == y[1] and x[2] == y[2] and abs(x[0] - y[0]) == 1:
-                contacts += 1
-    return contacts
-
-
-def main(argv: list[str]) -> None:
-    if len(argv) <= 3:
-        raise Exception("ERROR: Usage\n\tpython3 get_sequences.py {file/directory to read from} {flag (-d(irectory) or -f(ile))} {file type (if flag = -d)}")
-    elif len(argv) == 4:
-        filter = argv[3]
-        flag = argv[2]
-        directory = Path(argv[1])
-    else:
-        flag = "-f"
-        file = Path("./Dataset/" + argv[1] + "_cubic.pdb")
-        out_file = Path("./input/" + argv[1])
-
-    if flag == "-d": # loop through directory
-        directory_contents = os.listdir(directory)
-
-        for x in directory_contents:
-            if x.find(filter) != -1:
-                dash_index = x.rfind("_")
-                if dash_index != -1:
-                    out_file = Path("input/" + x[:dash_index])
-                else:
-                    out_file = Path("input/" + x)
-                print(x)
-                write_binary_sequence_and_contact_number(directory / Path(x), out_file)
-    else:
-        print(file)
-        print(out_file)
-        write_binary_sequence_and_contact_number(file, out_file)
-
-    # parse the remarks and assign original_sequence and coordinates
+    try:
+        return "".join(HP[a] for a in amino_acid_sequence)
+    except KeyError as e:
+        raise ValueError(f"Invalid character in sequence: {e.args[0]}")
+
+
+def get_coordinates(moves: str) -> np.ndarray:
+    """Return the coordinates of the fold, starting at the origin"""
+    try:
+        steps = np.array([(0, 0, 0)] + [MOVES[c] for c in moves])
+    except KeyError as e:
+        raise ValueError(f"Unrecognized coordinate character: {e.args[0]}")
+    return steps.cumsum(axis=0)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "paths",
+        nargs="*", type=str, default=["Dataset"],
+        help="the PDB files or directories of them to read, default value: Dataset"
+    )
+    parser.add_argument(
+        "-f", "--filter",
+        nargs="?", type=str, default=".pdb",
+        help="only read the files of a directory containing this, default value: .pdb"
+    )
+    parser.add_argument(
+        "-n", "--native-file",
+        nargs="?", type=str, default=config.NATIVE_FILE,
+        help=f"the CSV the contacts of the native folds are written to, default value: {config.NATIVE_FILE}"
+    )
+    parser.add_argument(
+        "-o", "--output-dir",
+        nargs="?", type=str, default=INPUT_DIR,
+        help=f"the directory the sequence files are written to, default value: {INPUT_DIR}"
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        nargs="?", type=int,
+        help="the number of worker processes, default: every core"
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    main(["get_sequences.py", "Dataset", "-d", ".pdb"])
+    main()
 
 
 """
@@ -0,0 +1,257 @@
+"""
+Heuristic folding of a sequence on the 2D or 3D lattice. A batch of chains is
+grown residue by residue with PERM-style pruning and enrichment, then improved
+by simulated annealing with pull moves. The folds are kept within the grid of
+the encodings, so the contacts of the best fold are SAT and the search policies
+can start from them instead of from 0.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+import src.bounds
+import src.encode
+
+DEFAULT_CHAINS = 32
+DEFAULT_SWEEPS = 50
+
+# Times the chain growth starts again when every chain is stuck, before giving up
+GROWTH_ATTEMPTS = 10
+
+# Temperatures of the chain growth and the start and end of the annealing
+GROWTH_TEMPERATURE = 0.5
+START_TEMPERATURE = 2.0
+END_TEMPERATURE = 0.05
+
+
+def main() -> None:
+    args = parse_args()
+    seq = src.encode.get_sequence(args.input_file)
+    start = time.time()
+    bound = src.bounds.get_contact_bound(seq, args.dimension)
+    width = src.encode.get_grid_diameter(args.dimension, len(seq))
+    coords, contacts = fold(seq, args.dimension, args.chains, args.sweeps, args.seed, bound, width)
+    print(f"Contacts : {contacts}")
+    print(f"Time     : {time.time() - start:.2f}s")
+    print(f"Fold     : {None if coords is None else coords.tolist()}")
+
+
+def fold(
+    seq: str,
+    dim: int,
+    chains: int = DEFAULT_CHAINS,
+    sweeps: int = DEFAULT_SWEEPS,
+    seed: int = None,
+    bound: int = None,
+    width: int = None
+) -> tuple[np.ndarray | None, int]:
+    """
+    Return the coordinates of the best fold found and its number of contacts,
+    stopping early if a fold reaches the upper bound on the contacts. Folds
+    span at most width points in each dimension if given, no fold and 0
+    contacts are returned if none could be grown within it
+    """
+    rng = np.random.default_rng(seed)
+    pairs = get_potential_contacts(seq)
+    positions = grow(seq, dim, chains, rng, width)
+    if positions is None:
+        return None, 0
+    positions, contacts = anneal(positions, pairs, sweeps, rng, bound, width)
+    best = int(np.argmax(contacts))
+    return positions[best], int(contacts[best])
+
+
+def get_directions(dim: int) -> np.ndarray:
+    """Return the unit vectors of the lattice"""
+    return np.concatenate([np.eye(dim, dtype=np.int64), -np.eye(dim, dtype=np.int64)])
+
+
+def get_potential_contacts(seq: str) -> tuple[np.ndarray, np.ndarray]:
+    """Return the indices (I, J) of the pairs of "1"s which can be in contact"""
+    ones = np.array([c == "1" for c in seq])
+    i, j = np.triu_indices(len(seq), 3)
+    keep = ones[i] & ones[j] & ((j - i) % 2 == 1)
+    return i[keep], j[keep]
+
+
+def count_contacts(positions: np.ndarray, pairs: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    """Return the contacts of every chain of the batch"""
+    i, j = pairs
+    dist = np.abs(positions[:, i] - positions[:, j]).sum(axis=-1)
+    return (dist == 1).sum(axis=-1)
+
+
+def is_occupied(positions: np.ndarray, points: np.ndarray, upto: int = None) -> np.ndarray:
+    """Return if the points, one per chain or several, are taken by the first upto residues"""
+    taken = positions[:, :upto]
+    if points.ndim == 2:
+        return (taken == points[:, None]).all(axis=-1).any(axis=-1)
+    return (taken[:, None] == points[:, :, None]).all(axis=-1).any(axis=-1)
+
+
+def is_within(lo: np.ndarray, hi: np.ndarray, width: int | None) -> np.ndarray:
+    """Return if the bounding boxes from lo to hi span at most width points in each dimension"""
+    if width is None:
+        return np.ones(lo.shape[:-1], dtype=bool)
+    return (hi - lo < width).all(axis=-1)
+
+
+def grow(
+    seq: str,
+    dim: int,
+    chains: int,
+    rng: np.random.Generator,
+    width: int = None,
+    attempt: int = 0
+) -> np.ndarray | None:
+    """
+    Grow a batch of self avoiding chains within width points in each dimension,
+    choosing each step with a Boltzmann weight on the contacts it makes. Chains
+    which are stuck are pruned and replaced with copies of the chains which are
+    doing well. Return None if every chain got stuck GROWTH_ATTEMPTS times
+    """
+    n, moves = len(seq), get_directions(dim)
+    ones = np.array([c == "1" for c in seq])
+    positions = np.zeros((chains, n, dim), dtype=np.int64)
+    if n > 1:
+        positions[:, 1, 0] = 1
+    rows = np.arange(chains)
+    for k in range(2, n):
+        candidates = positions[:, k - 1, None] + moves[None]
+        free = ~is_occupied(positions, candidates, k)
+        lo, hi = positions[:, :k].min(axis=1), positions[:, :k].max(axis=1)
+        free &= is_within(np.minimum(lo[:, None], candidates), np.maximum(hi[:, None], candidates), width)
+        new = np.zeros(free.shape)
+        if ones[k]:
+            # Contacts with the "1"s before, the residue before is a neighbour already
+            dist = np.abs(candidates[:, :, None] - positions[:, None, :k - 1]).sum(axis=-1)
+            new = ((dist == 1) & ones[None, None, :k - 1]).sum(axis=-1)
+        weights = free * np.exp(new / GROWTH_TEMPERATURE)
+        totals = weights.sum(axis=-1)
+
+        alive = totals > 0
+        if not alive.any():
+            # Every chain is stuck, start again
+            return grow(seq, dim, chains, rng, width, attempt + 1) if attempt + 1 < GROWTH_ATTEMPTS else None
+        if not alive.all():
+            p = totals[alive] / totals[alive].sum()
+            parents = rng.choice(rows[alive], size=(~alive).sum(), p=p)
+            positions[~alive], candidates[~alive] = positions[parents], candidates[parents]
+            weights[~alive], totals[~alive] = weights[parents], totals[parents]
+
+        cumulative = weights.cumsum(axis=-1) / totals[:, None]
+        choice = (rng.random(chains)[:, None] > cumulative).sum(axis=-1)
+        choice = np.minimum(choice, len(moves) - 1)
+        positions[:, k] = candidates[rows, choice]
+    return positions
+
+
+def anneal(
+    positions: np.ndarray,
+    pairs: tuple[np.ndarray, np.ndarray],
+    sweeps: int,
+    rng: np.random.Generator,
+    bound: int = None,
+    width: int = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Anneal every chain with pull moves within width, returning the best fold of each chain"""
+    chains, n, dim = positions.shape
+    contacts = count_contacts(positions, pairs)
+    best, best_contacts = positions.copy(), contacts.copy()
+    if n < 3:
+        return best, best_contacts
+    temperatures = np.geomspace(START_TEMPERATURE, END_TEMPERATURE, sweeps)
+    for t in temperatures:
+        for _ in range(n):
+            # Pull towards either end of the chain by reversing it
+            reverse = rng.random() < 0.5
+            current = positions[:, ::-1] if reverse else positions
+            moved, valid = pull(current, rng)
+            if reverse:
+                moved = moved[:, ::-1]
+            valid &= is_within(moved.min(axis=1), moved.max(axis=1), width)
+            new_contacts = count_contacts(moved, pairs)
+            accept = valid & (rng.random(chains) < np.exp((new_contacts - contacts) / t))
+            positions[accept], contacts[accept] = moved[accept], new_contacts[accept]
+
+            improved = contacts > best_contacts
+            best[improved], best_contacts[improved] = positions[improved], contacts[improved]
+        if bound is not None and best_contacts.max() >= bound:
+            break
+    return best, best_contacts
+
+
+def pull(positions: np.ndarray, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Make a random pull move on every chain: residue I moves to a free point L
+    next to I+1 and diagonal to I, I-1 to the corner C next to L and I, and
+    the residues before follow two positions up the chain until it is connected
+    """
+    chains, n, dim = positions.shape
+    rows = np.arange(chains)
+    i = rng.integers(0, n - 1, size=chains)
+    bond = positions[rows, i + 1] - positions[rows, i]
+
+    # A unit vector orthogonal to the bond between I and I+1
+    axis = rng.integers(0, dim - 1, size=chains)
+    axis += axis >= np.argmax(np.abs(bond), axis=-1)
+    side = np.zeros_like(bond)
+    side[rows, axis] = rng.choice([-1, 1], size=chains)
+
+    corner_l = positions[rows, i + 1] + side
+    corner_c = positions[rows, i] + side
+    before = positions[rows, np.maximum(i - 1, 0)]
+    c_is_before = (i > 0) & (corner_c == before).all(axis=-1)
+    valid = ~is_occupied(positions, corner_l) & ((i == 0) | c_is_before | ~is_occupied(positions, corner_c))
+
+    moved = positions.copy()
+    moved[rows, i] = corner_l
+    pulling = valid & (i > 0) & ~c_is_before
+    moved[rows[pulling], i[pulling] - 1] = corner_c[pulling]
+    for j in range(i.max() - 2, -1, -1):
+        if not pulling.any():
+            break
+        # Stop once residue J is next to the residue after it
+        connected = np.abs(moved[:, j + 1] - positions[:, j]).sum(axis=-1) == 1
+        active = pulling & (j <= i - 2)
+        pulling &= ~(active & connected)
+        active &= ~connected
+        moved[active, j] = positions[active, j + 2]
+    return moved, valid
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "input_file",
+        help="the path to the input file containing a string of 1s and 0s"
+    )
+    parser.add_argument(
+        "-c", "--chains",
+        nargs="?", type=int, default=DEFAULT_CHAINS,
+        help=f"the number of chains folded at once, default value: {DEFAULT_CHAINS}"
+    )
+    parser.add_argument(
+        "-d", "--dimension",
+        nargs="?", type=int, default=2, choices={2, 3},
+        help="the dimension of the embedding grid, default value: 2"
+    )
+    parser.add_argument(
+        "--seed",
+        nargs="?", type=int,
+        help="the seed of the random number generator"
+    )
+    parser.add_argument(
+        "-s", "--sweeps",
+        nargs="?", type=int, default=DEFAULT_SWEEPS,
+        help=f"the number of annealing sweeps of n pull moves, default value: {DEFAULT_SWEEPS}"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Incremental solving of the goals probed by a search policy. The sequence is
+encoded once with the bound of the counter left open, and every goal is solved
+by the same solver under the assumption of its bound literal, so that learnt
+clauses are kept between probes.
+"""
+
+from __future__ import annotations
+
+import time
+
+import src.bounds
+import src.encode
+import src.trace
+from src import config
+from src.config import INCREMENTAL_DEFAULT_SOLVER, INCREMENTAL_SOLVERS
+
+
+class IncrementalSolver:
+    """Persistent solver for the base encoding of a sequence"""
+
+    def __init__(self, seq_file: str, dim: int, ver: int, use_cached: bool, solver: str) -> None:
+        try:
+            from pysat.formula import CNF
+            from pysat.solvers import Solver
+        except ImportError:
+            raise ImportError("Incremental solving requires pysat, install it with `pip install python-sat`")
+
+        start = time.time()
+        self.file_path, self.bounds = src.encode.get_base(seq_file, dim, ver, use_cached)
+        self.seq_file, self.seq = seq_file, src.encode.get_sequence(seq_file)
+        # Sequences without potential contacts have no bounds, only goal 0 is SAT
+        if not self.bounds and src.bounds.get_contact_bound(self.seq, dim) > 0:
+            raise ValueError(f"No bound literals in {self.file_path}, cannot solve incrementally")
+        self.dim, self.ver, self.name = dim, ver, solver
+
+        if solver not in INCREMENTAL_SOLVERS:
+            print(f"No incremental interface for {solver}, using {INCREMENTAL_DEFAULT_SOLVER}")
+        name = get_backend(solver, config.PROBE_TIMEOUT is not None or config.SEARCH_TIMEOUT is not None)
+        self.solver = Solver(name=name, bootstrap_with=CNF(from_file=self.file_path).clauses)
+        self.encode_time = time.time() - start
+        # Statistics of the solver up to the last goal, as pysat accumulates them
+        self.stats: dict[str, int] = {}
+
+    def solve(self, goal: int, timeout: float = None) -> tuple[float, float]:
+        """
+        Solve for the goal, returning tuple (encode duration, solve duration),
+        or raise Timeout if there is no answer within timeout seconds
+        """
+        encode_duration, self.encode_time = self.encode_time, 0.0
+        units = src.encode.get_bound_units(self.bounds, self.seq, goal, self.ver)
+        if units == []:
+            # Bounds above the number of potential contacts cannot be reached
+            print("UNSAT")
+            return (encode_duration, -0.0)
+
+        src.trace.start_probe()
+        start = time.time()
+        with src.trace.phase("solve"):
+            if timeout is None:
+                sat = self.solver.solve(assumptions=units or [])
+            else:
+                sat = solve_limited(self.solver, units or [], max(0.0, timeout - encode_duration))
+        solve_duration = time.time() - start
+        stats = src.trace.get_pysat_statistics(self.solver)
+        src.trace.write_probe(
+            self.seq_file, goal, self.dim, self.ver, self.name, {True: "SAT", False: "UNSAT", None: "TIMEOUT"}[sat],
+            {name: value - self.stats.get(name, 0) for name, value in stats.items()})
+        self.stats = stats
+        if sat is None:
+            print("TIMEOUT")
+            raise src.encode.Timeout(goal, encode_duration, solve_duration)
+        print("SAT" if sat else "UNSAT")
+        return (encode_duration, solve_duration if sat else -solve_duration)
+
+    def delete(self) -> None:
+        self.solver.delete()
+
+
+# Backends whose fallback was printed, so it is printed once per process
+FALLBACKS: set[str] = set()
+
+
+def get_backend(solver: str, interruptible: bool = False) -> str:
+    """Return the pysat backend of a solver, one which can be interrupted if wanted"""
+    name = INCREMENTAL_SOLVERS.get(solver, INCREMENTAL_DEFAULT_SOLVER)
+    if interruptible and name.startswith("cadical"):
+        if name not in FALLBACKS:
+            FALLBACKS.add(name)
+            print(f"CaDiCaL cannot be interrupted in pysat, using {config.INCREMENTAL_INTERRUPTIBLE_SOLVER} for the time budget")
+        name = config.INCREMENTAL_INTERRUPTIBLE_SOLVER
+    return name
+
+
+def solve_limited(solver, assumptions: list[int], timeout: float) -> bool | None:
+    """Solve under the assumptions, returning None if it takes longer than timeout seconds"""
+    timer = src.encode.start_timer(timeout, solver.interrupt)
+    try:
+        return solver.solve_limited(assumptions=assumptions, expect_interrupt=True)
+    finally:
+        # The solver must not be interrupted once it is deleted or solving the next goal
+        timer.cancel()
+        timer.join()
+        solver.clear_interrupt()
+
+
+SESSIONS: dict[tuple, IncrementalSolver] = {}
+
+
+def solve_incremental(
+    seq_file: str,
+    goal: int,
+    dim: int,
+    ver: int,
+    use_cached: bool,
+    solver: str,
+    count_encoding: str = None,
+    timeout: float = None
+) -> tuple[float, float]:
+    """Drop in for `solve_sat` which reuses one solver for every goal of a sequence"""
+    if count_encoding not in (None, "counter.bul"):
+        raise ValueError(f"Incremental solving only supports counter.bul, not {count_encoding}")
+    key = (seq_file, dim, ver, solver)
+    if key not in SESSIONS:
+        SESSIONS[key] = IncrementalSolver(seq_file, dim, ver, use_cached, solver)
+    return SESSIONS[key].solve(goal, timeout)
+
+
+def clear_sessions() -> None:
+    """Free the solvers of every session"""
+    for session in SESSIONS.values():
+        session.delete()
+    SESSIONS.clear()
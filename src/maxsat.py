@@ -0,0 +1,158 @@
+"""
+Maximise the contacts in a single MaxSAT call instead of a decision problem per
+goal. The encoding at goal 0, where the counter bounds nothing, gives the hard
+clauses and every var(contact(I,J)) a soft unit clause. It is solved with the
+core guided RC2 of pysat, which keeps the cores of one bound for the next, or
+with a MaxSAT solver binary reading the WCNF
+"""
+
+from __future__ import annotations
+
+import re
+import subprocess
+import time
+
+import src.encode
+import src.fold
+import src.incremental
+import src.trace
+import src.verify
+from src import config
+
+# Status lines of MaxSAT solvers by whether the optimum was proven
+STATUS = {b"OPTIMUM FOUND": True, b"SATISFIABLE": False, b"UNKNOWN": False}
+
+
+def solve_maxsat(
+    seq_file: str,
+    dim: int,
+    ver: int,
+    use_cached: bool,
+    solver: str,
+    count_encoding: str = None,
+    timeout: float = None
+) -> tuple[int | None, int | None, float, float, tuple[int, int]]:
+    """
+    Return the contacts of the best fold found (None if none was) and the
+    bound proven on them (None if none was), equal if it is optimal, the time
+    spent encoding and solving, and the variables and clauses of the encoding
+    """
+    seq = src.encode.get_sequence(seq_file)
+    src.trace.start_probe()
+    start = time.time()
+    cnf_file = src.encode.encode(seq_file, 0, dim, ver, False, use_cached, count_encoding)
+    soft = get_soft_literals(cnf_file)
+    encode_time = time.time() - start
+
+    start = time.time()
+    with src.trace.phase("solve"):
+        if config.MAXSAT_SOLVER:
+            found, bound, model, stats = run_binary(write_wcnf(cnf_file, soft), timeout)
+        else:
+            found, bound, model, stats = run_rc2(cnf_file, soft, solver, timeout)
+    solve_time = time.time() - start
+
+    # Contacts are the satisfied soft clauses, of which v0 counts the adjacent "1"s too
+    offset = len(soft) - (src.encode.get_adjacent_ones(seq) if ver == 0 else 0)
+    lower = None if found is None else offset - found
+    upper = None if bound is None else offset - bound
+    with src.trace.phase("parse"):
+        if model and config.DECODE_FOLDS:
+            fold_file = src.fold.write_fold(seq_file, lower, dim, ver, cnf_file, model)
+            print(f"fold: {fold_file}")
+            src.verify.verify_fold_file(fold_file, lower)
+    result = "OPTIMUM" if lower is not None and lower == upper else "TIMEOUT"
+    src.trace.write_probe(seq_file, lower, dim, ver, config.MAXSAT_SOLVER or "rc2", result, stats)
+    return lower, upper, encode_time, solve_time, src.encode.get_cnf_header(cnf_file)
+
+
+def get_soft_literals(cnf_file: str) -> list[int]:
+    """Return the variables of the contacts of an encoding, which are soft"""
+    return sorted(var for name, var in src.encode.get_variable_map(cnf_file).items() if "contact(" in name)
+
+
+def write_wcnf(cnf_file: str, soft: list[int]) -> str:
+    """Write the clauses of an encoding as hard and the soft literals as unit clauses into a WCNF file"""
+    wcnf_file = re.sub(r"\.cnf(\.\w+)?$", ".wcnf", cnf_file)
+    # Hard clauses weigh more than every soft clause together
+    top = len(soft) + 1
+    with src.encode.open_cnf(cnf_file, "rt") as f, src.encode.replacing(wcnf_file) as temp, open(temp, "w+") as out:
+        for line in f:
+            if line.startswith("c"):
+                continue
+            if line.startswith("p"):
+                _, _, num_vars, num_clauses = line.split()
+                out.write(f"p wcnf {num_vars} {int(num_clauses) + len(soft)} {top}\n")
+            elif line.strip():
+                out.write(f"{top} {line}")
+        out.writelines(f"1 {lit} 0\n" for lit in soft)
+    return wcnf_file
+
+
+def run_rc2(
+    cnf_file: str,
+    soft: list[int],
+    solver: str,
+    timeout: float = None
+) -> tuple[int | None, int, list[int] | None, dict[str, int]]:
+    """Return the cost of the best model, the bound proven on the cost, the model and the statistics of RC2"""
+    try:
+        from pysat.examples.rc2 import RC2
+        from pysat.formula import CNF, WCNF
+    except ImportError:
+        raise ImportError("MaxSAT search requires pysat, install it with `pip install python-sat`")
+
+    wcnf = WCNF()
+    wcnf.extend(CNF(from_file=cnf_file).clauses)
+    for lit in soft:
+        wcnf.append([lit], weight=1)
+    name = src.incremental.get_backend(solver, timeout is not None)
+    # Exhausting and minimising cores and detecting at most one constraints, as in the MaxSAT evaluations
+    with RC2(wcnf, solver=name, adapt=True, exhaust=True, minz=True) as rc2:
+        timer = src.encode.start_timer(timeout, rc2.interrupt)
+        try:
+            model = rc2.compute(expect_interrupt=timeout is not None)
+        finally:
+            timer.cancel()
+            timer.join()
+        stats = src.trace.get_pysat_statistics(rc2.oracle)
+        if model is None and not rc2.interrupted:
+            raise ValueError(f"The fold constraints of {cnf_file} are UNSAT")
+        if model is None:
+            print("TIMEOUT")
+            return None, rc2.cost, None, stats
+        print("OPTIMUM")
+        return rc2.cost, rc2.cost, model, stats
+
+
+def run_binary(wcnf_file: str, timeout: float = None) -> tuple[int | None, int | None, list[int] | None, dict[str, int]]:
+    """
+    Return the cost of the best model, the bound proven on the cost (if it is
+    optimal), the model and the statistics of a MaxSAT solver binary
+    """
+    limit = src.encode.limit_cpu if config.PROBE_CPU_TIMEOUT is not None else None
+    p = subprocess.Popen([config.MAXSAT_SOLVER, wcnf_file], stdout=subprocess.PIPE, preexec_fn=limit)
+    timer = src.encode.start_timer(timeout, src.encode.stop_solver, p)
+    cost, optimal, values, comments = None, False, [], []
+    for line in p.stdout:
+        if line.startswith(b"o "):
+            cost = int(line.split()[1])
+        elif line.startswith(b"s "):
+            optimal = STATUS.get(line[2:].strip(), False)
+        elif line.startswith(b"v "):
+            values.append(line[2:].strip())
+        elif line.startswith(b"c "):
+            comments.append(line)
+    p.wait()
+    timer.cancel()
+    print("OPTIMUM" if optimal else "TIMEOUT")
+    return cost, cost if optimal else None, parse_model(values), src.trace.parse_statistics(comments)
+
+
+def parse_model(values: list[bytes]) -> list[int] | None:
+    """Return the literals of the "v" lines, as a bit string or as literals"""
+    if not values:
+        return None
+    if len(values) == 1 and re.fullmatch(rb"[01]+", values[0]):
+        return [i + 1 if bit == ord("1") else -(i + 1) for i, bit in enumerate(values[0])]
+    return [lit for line in values for lit in map(int, line.split()) if lit != 0]
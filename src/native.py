@@ -0,0 +1,255 @@
+"""
+Generate the order encoding (v2), or with symmetry breaking (v4), with the
+counter encoding directly in Python, emitting the same clauses as
+`bule/constraints_v2.bul` or `bule/constraints_v4.bul` and `bule/counter.bul`
+(or `bule/counter_assume.bul`) without grounding them with bule, or with one of
+the cardinality encodings of src.cardinality instead of the counter
+"""
+
+from __future__ import annotations
+
+from typing import Callable, TextIO
+
+import numpy as np
+
+
+class Variables:
+    """Allocate DIMACS variables in blocks after the first offset ones and keep the name of each one"""
+
+    def __init__(self, offset: int = 0) -> None:
+        self.offset = offset
+        self.names: list[str] = []
+
+    def add(self, names: list[str], shape: tuple[int, ...]) -> np.ndarray:
+        """Allocate a variable for every name, returned as an array of the shape"""
+        start = len(self) + 1
+        self.names.extend(names)
+        return np.arange(start, len(self) + 1, dtype=np.int64).reshape(shape)
+
+    def __len__(self) -> int:
+        return self.offset + len(self.names)
+
+
+def clauses(*literals: np.ndarray | int) -> np.ndarray:
+    """Broadcast the literals against each other and stack them into rows of clauses"""
+    arrays = np.broadcast_arrays(*[np.asarray(lit, dtype=np.int64) for lit in literals])
+    return np.stack(arrays, axis=-1).reshape(-1, len(arrays))
+
+
+def encode_v2(
+    seq: str,
+    dim: int,
+    width: int,
+    goal: int,
+    assume: bool = False,
+    symmetry: bool = False,
+    counter: Callable = None
+) -> tuple[Variables, list[np.ndarray]]:
+    """
+    Return the variables and blocks of clauses of the order encoding, where
+    goal is the number of contacts on top of the adjacent "1"s. If assume is
+    set, the bound is left to assumptions as in `counter_assume.bul`, and if
+    symmetry is set the symmetries of the lattice are broken as in v4. The
+    contacts are counted with counter, one of src.cardinality, if it is given
+    """
+    n, w, dims = len(seq), width, np.arange(dim)
+    variables = Variables()
+    blocks = []
+
+    # y(I,P,D): character I is at least at position P in dimension D
+    y = variables.add(
+        [f"y({i},{p},{d})" for i in range(n) for p in range(w) for d in range(dim)], (n, w, dim))
+
+    # Every character is at least at position 0, and at least P+1 implies at least P
+    blocks.append(clauses(y[:, 0, :]))
+    blocks.append(clauses(-y[:, 2:, :], y[:, 1:-1, :]))
+
+    # diff[I,J]: every pair of characters, same(I,J,D) if they share dimension D
+    di, dj = np.triu_indices(n, 1)
+    pair = np.full((n, n), -1, dtype=np.int64)
+    pair[di, dj] = np.arange(len(di))
+    same = variables.add(
+        [f"same({i},{j},{d})" for i, j in zip(di, dj) for d in range(dim)], (len(di), dim))
+    yi, yj, s = y[di], y[dj], same[:, None, :]
+    blocks.append(clauses(yi[:, 1:, :], -yi[:, :-1, :], yj[:, 1:, :], -yj[:, :-1, :], s))
+    blocks.append(clauses(-yi[:, -1, :], -yj[:, -1, :], same))
+    blocks.append(clauses(yi[:, 1:, :], -yj[:, 1:, :], -s))
+    blocks.append(clauses(-yi[:, 1:, :], yj[:, 1:, :], -s))
+    blocks.append(clauses(*(-same[:, d] for d in dims)))
+
+    # pc[I,J]: potential contacts, adj[I,I+1]: adjacent characters
+    ones = np.array([c == "1" for c in seq])
+    is_pc = ones[di] & ones[dj] & ((dj - di) % 2 == 1) & (di + 2 < dj)
+    pi, pj = di[is_pc], dj[is_pc]
+    ai, aj = np.arange(n - 1), np.arange(1, n)
+    oi, oj = np.concatenate([ai, pi]), np.concatenate([aj, pj])
+    nxt = variables.add(
+        [f"next({i},{j},{d})" for i, j in zip(oi, oj) for d in range(dim)], (len(oi), dim))
+
+    # I and J are next to each other in dimension D
+    yi, yj, x = y[oi], y[oj], nxt[:, None, :]
+    blocks.append(clauses(yi[:, 1:-1, :], -yi[:, :-2, :], yj[:, 2:, :], -yj[:, 1:-1, :], x))
+    blocks.append(clauses(yi[:, -1, :], -yi[:, -2, :], -yj[:, -1, :], nxt))
+    blocks.append(clauses(yi[:, 2:, :], -yi[:, 1:-1, :], yj[:, 1:-1, :], -yj[:, :-2, :], x))
+    blocks.append(clauses(-yi[:, -1, :], yj[:, -1, :], -yj[:, -2, :], nxt))
+    blocks.append(clauses(-yi[:, 2:, :], yj[:, 1:-1, :], -x))
+    blocks.append(clauses(yi[:, 1:-1, :], -yj[:, 2:, :], -x))
+
+    # Adjacent characters are next in one dimension and the same in the others
+    adj_next, adj_same = nxt[:n - 1], same[pair[ai, aj]]
+    blocks.append(clauses(*(adj_next[:, d] for d in dims)))
+    d1, d2 = np.nonzero(dims[:, None] != dims[None, :])
+    blocks.append(clauses(-adj_next[:, d1], adj_same[:, d2]))
+    blocks.append(clauses(-adj_same, -adj_next))
+
+    # var(contact(I,J)) if next in one dimension and the same in the others
+    contact = variables.add([f"var(contact({i},{j}))" for i, j in zip(pi, pj)], (len(pi),))
+    pc_next, pc_same = nxt[n - 1:], same[pair[pi, pj]]
+    others = [dims[dims != d] for d in dims]
+    c = contact[:, None]
+    for d in dims:
+        blocks.append(clauses(-pc_next[:, d], *(-pc_same[:, e] for e in others[d]), contact))
+        blocks.append(clauses(pc_next[:, d], *(-pc_same[:, e] for e in others[d]), -contact))
+        blocks.append(clauses(pc_next[:, d], *(pc_next[:, e] for e in others[d]), -contact))
+    blocks.append(clauses(-pc_next[:, d1], pc_same[:, d2], -c))
+
+    if symmetry:
+        blocks.extend(encode_symmetry(variables, y, nxt[:n - 1]))
+    if counter is None:
+        blocks.extend(encode_counter(variables, contact, goal, assume))
+    else:
+        blocks.extend(counter(variables, contact, goal))
+    return variables, blocks
+
+
+def encode_v4(
+    seq: str,
+    dim: int,
+    width: int,
+    goal: int,
+    assume: bool = False,
+    counter: Callable = None
+) -> tuple[Variables, list[np.ndarray]]:
+    """Return the variables and blocks of clauses of the order encoding with symmetry breaking"""
+    return encode_v2(seq, dim, width, goal, assume, True, counter)
+
+
+def encode_symmetry(variables: Variables, y: np.ndarray, bonds: np.ndarray) -> list[np.ndarray]:
+    """
+    Return the clauses of `constraints_v4.bul` which break the symmetries of
+    the lattice, where bonds[K, D] is next(K,K+1,D)
+    """
+    n, w, dim = y.shape
+    # Some character is at position 0 in every dimension
+    blocks = [-y[:, 1, :].T] if w > 1 else []
+    if n < 2:
+        return blocks
+
+    # The first bond goes up in dimension 0
+    blocks.append(clauses(bonds[0, 0]))
+    blocks.append(clauses(-y[0, :-1, 0], y[1, 1:, 0]))
+    blocks.append(clauses(-y[0, -1, 0]))
+
+    # The first bond off dimension 0 goes up in dimension 1, then the first bond in dimension 2
+    if dim > 1 and n > 2:
+        blocks.extend(encode_first_turn(variables, "straight", y, bonds, 1, False))
+    if dim > 2 and n > 2:
+        blocks.extend(encode_first_turn(variables, "flat", y, bonds, 2, True))
+    return blocks
+
+
+def encode_first_turn(
+    variables: Variables,
+    name: str,
+    y: np.ndarray,
+    bonds: np.ndarray,
+    d: int,
+    turn: bool
+) -> list[np.ndarray]:
+    """
+    Return the clauses forcing the first bond to turn into dimension d to go
+    up, where the bonds turn into d when bonds[K, d] is turn, or else when
+    they leave dimension 0. name(K) is set if no bond before K turned
+    """
+    n = len(y)
+    ks = np.arange(1, n - 1)
+    before = variables.add([f"{name}({k})" for k in ks], (len(ks),))
+    # Literal of the bond not turning, and of the bond turning
+    stays = -bonds[ks, d] if turn else bonds[ks, 0]
+    b, s = before[:, None], stays[:, None]
+    blocks = [
+        clauses(before[0]),
+        clauses(-before[:-1], -stays[:-1], before[1:]),
+        clauses(-b, s, -y[ks, :-1, d], y[ks + 1, 1:, d]),
+        clauses(-before, stays, -y[ks, -1, d])
+    ]
+    if not turn:
+        blocks.append(clauses(-before, stays, bonds[ks, d]))
+    return blocks
+
+
+ENCODERS = {2: encode_v2, 4: encode_v4}
+
+
+def encode_counter(variables: Variables, xs: np.ndarray, bound: int, assume: bool = False) -> list[np.ndarray]:
+    """
+    Return the clauses of the counter encoding of `sum(xs) >= bound` as grounded
+    by `counter.bul`, or of `counter_assume.bul` if assume is set
+    """
+    last = len(xs) - 1
+    if last < 0:
+        # Without potential contacts only a bound of 0 can be reached
+        return [] if assume or bound <= 0 else [np.zeros((1, 0), dtype=np.int64)]
+    js = {j for j in range(last + 1) if j <= bound}
+    if bound > 0:
+        js |= {bound, bound + 1}
+    cells = [
+        (i, j) for i in range(-1, last + 1) for j in sorted(js)
+        if i >= j - 2 and (assume or i - j <= last - bound)
+    ]
+    ids = variables.add([f"count(0,{i},{j})" for i, j in cells], (len(cells),))
+    count = dict(zip(cells, ids.tolist()))
+
+    binary, ternary = [], []
+    for i, j in cells:
+        if (i + 1, j) in count:
+            binary.append([-count[i, j], count[i + 1, j]])
+        if (i + 1, j + 1) in count:
+            ternary.append([-xs[i + 1], -count[i, j], count[i + 1, j + 1]])
+            binary.append([-count[i + 1, j + 1], count[i, j]])
+        if i >= 0 and (i - 1, j) in count:
+            ternary.append([xs[i], -count[i, j], count[i - 1, j]])
+    units = [count[c] * sign for c, sign in [((-1, 0), 1), ((-1, 1), -1)] if c in count]
+    blocks = [
+        np.array(binary, dtype=np.int64).reshape(-1, 2),
+        np.array(ternary, dtype=np.int64).reshape(-1, 3),
+        np.array(units, dtype=np.int64).reshape(-1, 1)
+    ]
+    if not assume:
+        if bound > last + 1:
+            # Fail if the bound cannot be reached
+            blocks.append(np.zeros((1, 0), dtype=np.int64))
+        else:
+            blocks.append(np.array([[count[last, bound]]], dtype=np.int64))
+    return blocks
+
+
+def write_dimacs(f: TextIO, variables: Variables, blocks: list[np.ndarray]) -> None:
+    """Write the clauses in DIMACS into the text file f with the names of the variables as comments"""
+    num_clauses = sum(len(block) for block in blocks)
+    write_names(f, variables)
+    f.write(f"p cnf {len(variables)} {num_clauses}\n")
+    write_clauses(f, blocks)
+
+
+def write_names(f: TextIO, variables: Variables) -> None:
+    """Write the names of the variables as comments"""
+    f.writelines(f"c {i} {name}\n" for i, name in enumerate(variables.names, variables.offset + 1))
+
+
+def write_clauses(f: TextIO, blocks: list[np.ndarray]) -> None:
+    """Write the blocks of clauses in DIMACS"""
+    for block in blocks:
+        if len(block):
+            rows = np.hstack([block, np.zeros((len(block), 1), dtype=np.int64)])
+            np.savetxt(f, rows, fmt="%d")
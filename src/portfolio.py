@@ -0,0 +1,79 @@
+"""
+Race several SAT solvers on the same encoding and take the first definitive
+answer, killing the solvers which are still running
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+
+import src.encode
+from src import config
+
+LOG_HEADER = "cnf,result,winner,solver,time"
+
+
+def solve_portfolio(
+    file_path: str,
+    units: list[int] | None,
+    solvers: list[str],
+    timeout: float = None,
+    model: bool = False,
+    comments: list[bytes] = None
+) -> tuple[bool | None, list[int]]:
+    """
+    Run the solvers concurrently on the encoding (see `src.encode.start_solver`)
+    and return if it is SAT, UNSAT or None if no solver gave an answer within
+    timeout seconds, and the true variables of the winner's model. The comment
+    lines of the winner are added to comments
+    """
+    start = time.time()
+    results = queue.Queue()
+    processes = {solver: src.encode.start_solver(solver, file_path, units) for solver in solvers}
+    outputs = {solver: [] if comments is not None else None for solver in solvers}
+
+    def wait(solver: str) -> None:
+        sat, true_vars = src.encode.wait_solver(processes[solver], model, outputs[solver])
+        results.put((solver, sat, true_vars, time.time() - start))
+
+    def stop() -> None:
+        for p in processes.values():
+            src.encode.stop_solver(p)
+
+    for solver in solvers:
+        threading.Thread(target=wait, args=(solver,), daemon=True).start()
+    timer = src.encode.start_timer(timeout, stop)
+
+    # Take the first definitive answer, a solver which crashes gives none
+    sat, winner, true_vars, times = None, "", [], {}
+    while len(times) < len(solvers):
+        solver, result, solver_vars, duration = results.get()
+        times[solver] = duration
+        if result is not None:
+            sat, winner, true_vars = result, solver, solver_vars
+            break
+    timer.cancel()
+    stop()
+    while len(times) < len(solvers):
+        solver, _, _, duration = results.get()
+        times[solver] = duration
+
+    if winner and comments is not None:
+        comments.extend(outputs[winner])
+    print(f"{winner or 'No solver'} won the portfolio in {times.get(winner, 0):.3f}s:", end=" ")
+    write_log(file_path, sat, winner, times)
+    return sat, true_vars
+
+
+def write_log(file_path: str, sat: bool | None, winner: str, times: dict[str, float]) -> None:
+    """Append how long each solver of a race ran to the portfolio log"""
+    result = {True: "SAT", False: "UNSAT", None: "NA"}[sat]
+    new_file = not os.path.isfile(config.PORTFOLIO_LOG)
+    with open(config.PORTFOLIO_LOG, "a") as f:
+        if new_file:
+            f.write(f"{LOG_HEADER}\n")
+        for solver, duration in times.items():
+            f.write(f"{file_path},{result},{winner or 'NA'},{solver},{duration}\n")
@@ -3,12 +3,18 @@ from __future__ import annotations
 import argparse
 import json
 import os
-import re
 import subprocess
 from datetime import datetime
 
+import src.bounds as bounds
+import src.corpus as corpus
 import src.encode as encode
+import src.scheduler as scheduler
 import src.search_policies as search_policies
+import src.sizes as sizes
+import src.trace as trace
+import src.work_queue as work_queue
+from src import config
 from src.config import TEST_VERSIONS as VERSIONS, SAT_TEST_SEQ, POLICIES, SOLVERS
 
 
@@ -20,9 +26,26 @@ def main() -> None:
     args = parse_args()
     dims = [2, 3] if args.dimension == -1 else [args.dimension]
     vers = VERSIONS if args.version == -1 else [args.version]
+    config.CNF_COMPRESSION = args.compress
+    config.PROBE_TIMEOUT = args.probe_timeout
+    config.SEARCH_TIMEOUT = args.search_timeout
+    config.MAX_CLAUSES = args.max_clauses
+    config.TRACE = args.trace
+    config.DECODE_FOLDS = args.fold
+    config.CUBE = args.cube
+    if args.broker and args.test_type != "generate":
+        sequences = get_sequences(INPUT_DIR, args.sequence_type, args.min_len, args.min_sequence, MAX_LEN)
+        jobs = scheduler.get_jobs(args.test_type, sequences, INPUT_DIR, vers, dims)
+        work_queue.serve(jobs, args.journal, args.broker, args.workers or 0, args.timeout)
+        return print("Finished")
     if args.test_type == "sat":
         run_sat_test(SAT_TEST_SEQ, 2)
         return print("Finished")
+    if args.workers and args.test_type in {"encoding", "policy", "solver"}:
+        sequences = get_sequences(INPUT_DIR, args.sequence_type, args.min_len, args.min_sequence, MAX_LEN)
+        jobs = scheduler.get_jobs(args.test_type, sequences, INPUT_DIR, vers, dims)
+        scheduler.run_jobs(jobs, args.workers, args.timeout, args.journal)
+        return print("Finished")
     for s in get_sequences(INPUT_DIR, args.sequence_type, args.min_len, args.min_sequence, MAX_LEN):
         print(s)
         if args.test_type == "encoding":
@@ -89,7 +112,7 @@ def run_encoding_test(filename: str, seq: str, vers: list[int], dims: list[int])
 def run_sat_test(input_file: str, dim: int) -> None:
     # Check how long it takes to run all the tests
     seq = encode.get_sequence(input_file)
-    max_contacts = encode.get_max_contacts(seq, dim)
+    max_contacts = bounds.get_contact_bound(seq, dim)
     times = []
     goal_contacts = 0
     for i in range(max_contacts):
@@ -148,11 +171,25 @@ def get_double_binary_policy_searches(goal: int) -> list[int]:
 def run_test(input_file: str, seq: str, v: int, d: int, solver: str, policy: str, dir: str) -> None:
     curr_time = datetime.now().strftime("%H:%M:%S")
     print(f"Testing {input_file}: \t{seq} \tv: {v} \td: {d} {curr_time}")
-    # We do not solve using the old encoding if 3D and len > 13
-    solve = "" if d == 3 and len(seq) >= 14 and v == 0 else "-s"
+    if not sizes.is_feasible(seq, d, v):
+        print(f"Skipping, the encoding is over {config.MAX_CLAUSES} clauses")
+        return
+    solve = "-s" if scheduler.is_solved(seq, v, d) else ""
 
     command = f"python3 -m src.encode {input_file}"
     options = f"{solve} -t -u -v {v} -d {d} -p {policy} --solver {solver} -r {dir}"
+    if config.CNF_COMPRESSION:
+        options += f" -z {config.CNF_COMPRESSION}"
+    if config.PROBE_TIMEOUT is not None:
+        options += f" --probe-timeout {config.PROBE_TIMEOUT}"
+    if config.SEARCH_TIMEOUT is not None:
+        options += f" --search-timeout {config.SEARCH_TIMEOUT}"
+    if config.TRACE:
+        options += f" --trace {config.TRACE}"
+    if config.DECODE_FOLDS:
+        options += " --fold"
+    if config.CUBE:
+        options += " --cube"
     subprocess.run((command + " " + options).split(), capture_output=False)
 
 
@@ -163,7 +200,11 @@ def get_sequences(
     min_sequence: str = "",
     max_len: int = 100
 ) -> list[dict[str, str]]:
-    """Get list of dicts of sequences and their filename from the input dir"""
+    """Get list of dicts of sequences and their filename from the corpus, or the input dir if there is none"""
+    if os.path.isfile(corpus.CORPUS_FILE):
+        with corpus.Corpus(corpus.CORPUS_FILE) as c:
+            sequences = c.select(seq_type, min_len, max_len, min_sequence or "")
+        return [s for s in sequences if s["filename"] not in IGNORE]
     sequences = []
     for filename in os.listdir(input_dir_name):
         if filename in IGNORE or not is_type(filename, seq_type):
@@ -181,30 +222,36 @@ def get_sequences(
 
 
 def get_sequence(filename: str) -> str:
-    input_file = os.path.join(INPUT_DIR, filename)
-    with open(input_file) as f:
-        # Remove the last "\n"
-        return f.readline()[:-1]
+    return encode.get_sequence(os.path.join(INPUT_DIR, filename))
 
 
 def is_type(filename: str, seq_type: str) -> bool:
     """Return if a sequence is real, random, or all (either)"""
-    if seq_type == "all":
-        return True
-    elif seq_type == "real" and re.match("^[a-zA-Z0-9]{6}$", filename):
-        return True
-    elif seq_type == "random" and filename.startswith("length_"):
-        return True
-    return False
+    return seq_type == "all" or corpus.get_type(filename) == seq_type
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-b", "--broker",
+        nargs="?", type=str, const=work_queue.ADDRESS,
+        help=f"serve the tests as jobs to workers started with `python -m src.work_queue`, sat tests solving a goal per job, on this host and port, default address: {work_queue.ADDRESS}"
+    )
+    parser.add_argument(
+        "-z", "--compress",
+        nargs="?", type=str, choices={"gz", "xz"},
+        help="compress the generated dimacs files with gzip or xz"
+    )
     parser.add_argument(
         "-d", "--dimension",
         nargs="?", type=int, default=-1, choices={2, 3},
         help="the dimension of the embedding grid, default: 2d and 3d"
     )
+    parser.add_argument(
+        "-j", "--journal",
+        nargs="?", type=str, default=scheduler.JOURNAL,
+        help="the journal of finished jobs, used to resume an interrupted run, running failed jobs and timeouts again"
+    )
     parser.add_argument(
         "--min-len",
         nargs="?", type=int, default=0,
@@ -220,16 +267,56 @@ def parse_args() -> argparse.Namespace:
         nargs="?", type=str, default="all", choices={"all", "random", "real"},
         help="the type of protein sequences to test, default value: all"
     )
+    parser.add_argument(
+        "--trace",
+        nargs="?", type=str, const=trace.TRACE_FILE,
+        help=f"append the phases and solver statistics of every probe to a JSONL file, default file: {trace.TRACE_FILE}"
+    )
     parser.add_argument(
         "-t", "--test-type",
         nargs="?", type=str, default="encoding", choices={"encoding", "generate", "policy", "sat", "solver"},
         help="which independent variable to test, or to generate encodings"
     )
+    parser.add_argument(
+        "--cube",
+        action="store_true",
+        help="split every probe of the tests into cubes solved on every core"
+    )
+    parser.add_argument(
+        "-f", "--fold",
+        action="store_true",
+        help="decode and verify the fold of every SAT answer of the tests"
+    )
+    parser.add_argument(
+        "--max-clauses",
+        nargs="?", type=int,
+        help="skip the tests whose largest encoding is predicted to be over this many clauses, default: no limit"
+    )
+    parser.add_argument(
+        "--probe-timeout",
+        nargs="?", type=float,
+        help="the time in seconds after which a single goal gives up, default: no limit"
+    )
+    parser.add_argument(
+        "--search-timeout",
+        nargs="?", type=float,
+        help="the time in seconds after which a search returns its bounds so far, default: no limit"
+    )
+    parser.add_argument(
+        "--timeout",
+        nargs="?", type=float,
+        help="the time in seconds after which a job is killed, default: no limit"
+    )
     parser.add_argument(
         "-v", "--version",
         nargs="?", type=int, default=-1, choices=set(VERSIONS),
         help="the encoding type to test, default: all"
     )
+    parser.add_argument(
+        "-w", "--workers",
+        nargs="?", type=int,
+        help="run the tests as jobs on this many worker processes, with --broker on this machine besides the remote workers"
+    )
     return parser.parse_args()
 
 
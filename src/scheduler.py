@@ -0,0 +1,186 @@
+"""
+Run the benchmark matrix of run_tests as jobs on a pool of worker processes,
+with a timeout per job and a journal so an interrupted run can be resumed.
+The jobs of a sat test each solve a single goal
+"""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import signal
+import time
+from datetime import datetime
+
+import src.bounds as bounds
+import src.encode as encode
+import src.search_policies as search_policies
+import src.sizes as sizes
+from src import config
+from src.config import TEST_VERSIONS as VERSIONS, POLICIES, SOLVERS
+
+JOURNAL = "results/journal.jsonl"
+
+
+def get_jobs(test_type: str, sequences: list[dict[str, str]], input_dir: str, vers: list[int], dims: list[int]) -> list[dict]:
+    """Expand the tests of the sequences into a list of jobs, in the order run_tests runs them"""
+    jobs = []
+    for s in sequences:
+        input_file = os.path.join(input_dir, s["filename"])
+        if test_type == "encoding":
+            cells = [("kissat", "linear_search_policy", v, d) for d in dims for v in vers]
+        elif test_type == "policy":
+            cells = [(solver, policy, v, d) for policy in POLICIES for solver in SOLVERS for v in VERSIONS for d in dims]
+        elif test_type == "solver":
+            cells = [(solver, "linear_search_policy", v, d) for solver in SOLVERS for v in VERSIONS for d in dims]
+        elif test_type == "sat":
+            cells = [(solver, None, v, d) for solver in SOLVERS for v in vers for d in dims]
+        else:
+            raise ValueError(f"Cannot schedule {test_type} tests")
+        for solver, policy, v, d in cells:
+            if not sizes.is_feasible(s["seq"], d, v):
+                print(f"Skipping {s['filename']} {d}D v{v}, its encoding is over {config.MAX_CLAUSES} clauses")
+                continue
+            if test_type == "sat":
+                jobs += get_goal_jobs(s["filename"], s["seq"], input_file, v, d, solver)
+                continue
+            jobs.append({
+                "id": f"{test_type}:{s['filename']}:{d}d:v{v}:{solver}:{policy}",
+                "input_file": input_file,
+                "seq": s["seq"],
+                "ver": v,
+                "dim": d,
+                "solver": solver,
+                "policy": policy,
+                "results_dir": test_type,
+                "solve": is_solved(s["seq"], v, d)
+            })
+    return jobs
+
+
+def get_goal_jobs(filename: str, seq: str, input_file: str, ver: int, dim: int, solver: str) -> list[dict]:
+    """Return a job solving each goal up to the contact bound of a sequence"""
+    return [{
+        "id": f"sat:{filename}:{dim}d:v{ver}:{solver}:{goal}c",
+        "input_file": input_file,
+        "seq": seq,
+        "ver": ver,
+        "dim": dim,
+        "solver": solver,
+        "goal": goal,
+        "results_dir": "sat",
+        "solve": True
+    } for goal in range(1, bounds.get_contact_bound(seq, dim) + 1)]
+
+
+def is_solved(seq: str, ver: int, dim: int) -> bool:
+    """Return if a test is solved or only encoded"""
+    # We do not solve using the old encoding if 3D and len > 13, unless the search has a budget
+    return not (dim == 3 and len(seq) >= 14 and ver == 0) or config.SEARCH_TIMEOUT is not None
+
+
+def run_jobs(jobs: list[dict], workers: int, timeout: float = None, journal: str = JOURNAL) -> None:
+    """Run the jobs not yet in the journal, at most workers at a time"""
+    finished = read_journal(journal)
+    pending = [job for job in jobs if job["id"] not in finished]
+    print(f"{len(jobs) - len(pending)} of {len(jobs)} jobs already done in {journal}")
+
+    running: dict[str, tuple[multiprocessing.Process, float, dict]] = {}
+    ctx = multiprocessing.get_context("fork")
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                job = pending.pop(0)
+                curr_time = datetime.now().strftime("%H:%M:%S")
+                print(f"Testing {job['input_file']}: \t{job['seq']} \tv: {job['ver']} \td: {job['dim']} {curr_time}")
+                p = ctx.Process(target=run_job, args=(job,))
+                p.start()
+                running[job["id"]] = (p, time.time(), job)
+
+            time.sleep(0.1)
+            for job_id, (p, start, job) in list(running.items()):
+                duration = time.time() - start
+                if p.exitcode is not None:
+                    status = "done" if p.exitcode == 0 else "failed"
+                elif timeout is not None and duration > timeout:
+                    kill_job(p)
+                    status = "timeout"
+                else:
+                    continue
+                p.join()
+                del running[job_id]
+                write_journal(journal, {"id": job_id, "status": status, "time": duration})
+                print(f"Finished {job_id}: {status} in {duration:.2f}s")
+    finally:
+        # Jobs run in their own process group, so they are not interrupted with us
+        for p, _, _ in running.values():
+            kill_job(p)
+
+
+def run_job(job: dict, results_root: str = "results/") -> None:
+    """Run a single job in this process, in its own process group with its solvers"""
+    os.setsid()
+    encode.RESULTS_DIR = os.path.join(results_root, job["results_dir"])
+    if "goal" in job:
+        solve_goal(job)
+    elif job["solve"]:
+        policy = getattr(search_policies, job["policy"])
+        encode.timed_solve(job["input_file"], job["dim"], job["ver"], policy, True, job["solver"])
+    else:
+        encode.encode(job["input_file"], 1, job["dim"], job["ver"], True, True)
+
+
+def solve_goal(job: dict) -> None:
+    """Solve the goal of a job and write if it is SAT and the times into a JSON file"""
+    encode_time, solve_time = encode.solve_sat(job["input_file"], job["goal"], job["dim"], job["ver"], True, job["solver"])
+    filename = os.path.basename(job["input_file"])
+    result_name = f"{filename}_{job['dim']}d_v{job['ver']}_{job['solver'][:2]}s_{job['goal']}c"
+    os.makedirs(encode.RESULTS_DIR, exist_ok=True)
+    with open(f"{os.path.join(encode.RESULTS_DIR, result_name)}.json", "w+") as f:
+        # A negative solve time is UNSAT, as in run_sat_test
+        json.dump({
+            "input_file": job["input_file"],
+            "dim": job["dim"],
+            "ver": job["ver"],
+            "solver": job["solver"],
+            "goal": job["goal"],
+            "sat": solve_time > 0,
+            "encode_time": encode_time,
+            "solve_time": abs(solve_time)
+        }, f, indent=4)
+
+
+def kill_job(p: multiprocessing.Process) -> None:
+    """Kill a job together with the solvers it started"""
+    try:
+        os.killpg(p.pid, signal.SIGTERM)
+        p.join(1)
+        if p.exitcode is None:
+            os.killpg(p.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def read_journal(journal: str) -> set[str]:
+    """Return the ids of the jobs which are done, failed jobs and timeouts are run again"""
+    if not os.path.isfile(journal):
+        return set()
+    finished = set()
+    with open(journal) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                if entry["status"] == "done":
+                    finished.add(entry["id"])
+            except (json.JSONDecodeError, KeyError):
+                # A line cut short when the run was interrupted
+                continue
+    return finished
+
+
+def write_journal(journal: str, entry: dict) -> None:
+    with open(journal, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
@@ -5,65 +5,118 @@ of contacts
 
 from __future__ import annotations
 
+import os
+import queue
+import resource
+import threading
+import time
+
+import src.bounds
+import src.deepening
 import src.encode
+import src.fold
+import src.heuristic
+import src.maxsat
+import src.trace
+import src.verify
+from src import config
+
+
+class Search:
+    """The bounds on the max contacts proven by the probes of a search, and its deadline"""
+
+    def __init__(self, lower: int, upper: int) -> None:
+        self.lower, self.upper = lower, upper
+        # Goals with a SAT or UNSAT answer, whose encodings were solved
+        self.probed: set[int] = set()
+        self.deadline = None if config.SEARCH_TIMEOUT is None else time.time() + config.SEARCH_TIMEOUT
+
+    def get_remaining(self) -> float | None:
+        """Return the seconds left until the deadline, or None if there is none"""
+        return None if self.deadline is None else max(0.0, self.deadline - time.time())
+
+    def get_timeout(self) -> float | None:
+        """Return the seconds the next probe may take, within the probe and search budgets"""
+        budgets = [b for b in (config.PROBE_TIMEOUT, self.get_remaining()) if b is not None]
+        return min(budgets, default=None)
+
+    def update(self, goal: int, sat: bool) -> None:
+        self.probed.add(goal)
+        if sat:
+            self.lower = max(self.lower, goal)
+        else:
+            self.upper = min(self.upper, goal - 1)
+
+    def get_status(self) -> str:
+        """
+        Return "optimal" if the bounds meet, else "timeout" if the search ran
+        out of time or "bounded" if it stopped after a probe ran out of time
+        """
+        if self.lower >= self.upper:
+            return "optimal"
+        if self.deadline is not None and time.time() >= self.deadline:
+            return "timeout"
+        return "bounded"
 
 
 def binary_search_policy(seq_file: str, dim: int, ver: int, use_cached: bool, 
         solver: str, count_encoding: str = None) -> dict[str, float]:
     """Binary search for max contacts"""
     total_encode_time, total_solve_time, sat_solve_time = 0.0, 0.0, 0.0
-    lo, hi = 0, src.encode.get_max_contacts(
+    curr = get_lower_bound(seq_file, dim)
+    lo, hi = curr + 1 if curr else 0, src.bounds.get_contact_bound(
         src.encode.get_sequence(seq_file), dim)
+    search = Search(curr, hi)
     print(f"Start binary search to max contacts from hi: {hi}")
-    while lo <= hi:
-        curr = (hi + lo) // 2
-        print(f"Solving {curr}:", end=" ", flush=True)
-        encode_time, solve_time = src.encode.solve_sat(
-            seq_file, curr, dim, ver, use_cached, solver, count_encoding)
-        total_encode_time += abs(encode_time)
-        total_solve_time += abs(solve_time)
-        sat = solve_time > 0
-        if sat:
-            lo = curr + 1
-            sat_solve_time += solve_time
-        else:
-            curr -= 1
-            hi = curr
+    try:
+        while lo <= hi:
+            curr = (hi + lo) // 2
+            print(f"Solving {curr}:", end=" ", flush=True)
+            encode_time, solve_time = src.encode.solve_sat(
+                seq_file, curr, dim, ver, use_cached, solver, count_encoding, search.get_timeout())
+            total_encode_time += abs(encode_time)
+            total_solve_time += abs(solve_time)
+            sat = solve_time > 0
+            search.update(curr, sat)
+            if sat:
+                lo = curr + 1
+                sat_solve_time += solve_time
+            else:
+                curr -= 1
+                hi = curr
+    except src.encode.Timeout as e:
+        total_encode_time += e.encode_time
+        total_solve_time += e.solve_time
     print()
-    return {
-        "max_contacts": curr,
-        "encode_time": total_encode_time,
-        "solve_time": total_solve_time,
-        "sat_solve_time": sat_solve_time
-    }
+    return get_result(search, total_encode_time, total_solve_time, sat_solve_time)
 
 
 def linear_search_policy(seq_file: str, dim: int, ver: int, use_cached: bool, 
         solver: str, count_encoding: str = None) -> dict[str, float]:
     """Linear search for max contacts"""
     total_encode_time, total_solve_time, sat_solve_time = 0.0, 0.0, 0.0
-    curr, max_contacts = 0, src.encode.get_max_contacts(
+    curr, max_contacts = get_lower_bound(seq_file, dim), src.bounds.get_contact_bound(
         src.encode.get_sequence(seq_file), dim)
+    search = Search(curr, max_contacts)
     print(f"Start linear search to max contacts: {max_contacts}")
-    while curr < max_contacts:
-        curr += 1
-        print(f"Solving {curr}:", end=" ", flush=True)
-        encode_time, solve_time = src.encode.solve_sat(
-            seq_file, curr, dim, ver, use_cached, solver, count_encoding)
-        total_encode_time += abs(encode_time)
-        total_solve_time += abs(solve_time)
-        sat = solve_time > 0
-        if not sat:
-            curr -= 1
-            break
-        sat_solve_time += solve_time
+    try:
+        while curr < max_contacts:
+            curr += 1
+            print(f"Solving {curr}:", end=" ", flush=True)
+            encode_time, solve_time = src.encode.solve_sat(
+                seq_file, curr, dim, ver, use_cached, solver, count_encoding, search.get_timeout())
+            total_encode_time += abs(encode_time)
+            total_solve_time += abs(solve_time)
+            sat = solve_time > 0
+            search.update(curr, sat)
+            if not sat:
+                break
+            sat_solve_time += solve_time
+    except src.encode.Timeout as e:
+        total_encode_time += e.encode_time
+        total_solve_time += e.solve_time
     print()
-    return {
-        "max_contacts": curr,
-        "encode_time": total_encode_time,
-        "solve_time": total_solve_time,
-        "sat_solve_time": sat_solve_time
-    }
+    return get_result(search, total_encode_time, total_solve_time, sat_solve_time)
 
 
 def double_binary_policy(seq_file: str, dim: int, ver: int, use_cached: bool, 
@@ -71,89 +124,310 @@ def double_binary_policy(seq_file: str, dim: int, ver: int, use_cached: bool,
     """
     Start the contacts at 1 doubling until unsolvable. Then binary search for the max solvable
     """
-    curr = 1
-    max_contacts = src.encode.get_max_contacts(
+    curr, lb = 1, get_lower_bound(seq_file, dim)
+    max_contacts = src.bounds.get_contact_bound(
         src.encode.get_sequence(seq_file), dim)
+    search = Search(lb, max_contacts)
     total_encode_time, total_solve_time, sat_solve_time = 0.0, 0.0, 0.0
     print(f"Start doubling until max contacts: {max_contacts}")
-    while curr <= max_contacts:
-        print(f"Solving {curr}: ", end="", flush=True)
-        encode_time, solve_time = src.encode.solve_sat(
-            seq_file, curr, dim, ver, use_cached, solver, count_encoding)
-        total_encode_time += abs(encode_time)
-        total_solve_time += abs(solve_time)
-        sat = solve_time > 0
-        if not sat:
-            break
-        sat_solve_time += solve_time
-        curr *= 2
-    print(f"Failed to solve at {curr}\n")
-
-    curr -= 1
-    lo, hi = curr // 2 + 1, curr
-    print("Start binary search to max contacts")
-    while lo <= hi:
-        curr = (hi + lo) // 2
-        print(f"Solving {curr}:", end=" ")
-        encode_time, solve_time = src.encode.solve_sat(
-            seq_file, curr, dim, ver, use_cached, solver, count_encoding)
-        total_encode_time += abs(encode_time)
-        total_solve_time += abs(solve_time)
-        sat = solve_time > 0
-        if sat:
-            lo = curr + 1
+    try:
+        while lb + curr <= max_contacts:
+            print(f"Solving {lb + curr}: ", end="", flush=True)
+            encode_time, solve_time = src.encode.solve_sat(
+                seq_file, lb + curr, dim, ver, use_cached, solver, count_encoding, search.get_timeout())
+            total_encode_time += abs(encode_time)
+            total_solve_time += abs(solve_time)
+            sat = solve_time > 0
+            search.update(lb + curr, sat)
+            if not sat:
+                break
             sat_solve_time += solve_time
-        else:
-            curr -= 1
-            hi = curr
+            curr *= 2
+        print(f"Failed to solve at {lb + curr}\n")
+
+        curr -= 1
+        lo, hi = lb + curr // 2 + 1, lb + curr
+        curr = hi
+        print("Start binary search to max contacts")
+        while lo <= hi:
+            curr = (hi + lo) // 2
+            print(f"Solving {curr}:", end=" ")
+            encode_time, solve_time = src.encode.solve_sat(
+                seq_file, curr, dim, ver, use_cached, solver, count_encoding, search.get_timeout())
+            total_encode_time += abs(encode_time)
+            total_solve_time += abs(solve_time)
+            sat = solve_time > 0
+            search.update(curr, sat)
+            if sat:
+                lo = curr + 1
+                sat_solve_time += solve_time
+            else:
+                curr -= 1
+                hi = curr
+    except src.encode.Timeout as e:
+        total_encode_time += e.encode_time
+        total_solve_time += e.solve_time
     print()
-    return {
-        "max_contacts": curr,
-        "encode_time": total_encode_time,
-        "solve_time": total_solve_time,
-        "sat_solve_time": sat_solve_time
-    }
+    return get_result(search, total_encode_time, total_solve_time, sat_solve_time)
 
 
 def double_linear_policy(seq_file: str, dim: int, ver: int, use_cached: bool, 
         solver: str, count_encoding: str = None) -> dict[str, float]:
     """Double till UNSAT, then linear search for max contacts"""
-    curr = 1
-    max_contacts = src.encode.get_max_contacts(
+    curr, lb = 1, get_lower_bound(seq_file, dim)
+    max_contacts = src.bounds.get_contact_bound(
         src.encode.get_sequence(seq_file), dim)
+    search = Search(lb, max_contacts)
     total_encode_time, total_solve_time, sat_solve_time = 0.0, 0.0, 0.0
     print(f"Start doubling until max contacts: {max_contacts}")
-    while curr <= max_contacts:
-        print(f"Solving {curr}: ", end="", flush=True)
-        encode_time, solve_time = src.encode.solve_sat(
-            seq_file, curr, dim, ver, use_cached, solver, count_encoding)
-        total_encode_time += abs(encode_time)
-        total_solve_time += abs(solve_time)
-        sat = solve_time > 0
-        if not sat:
+    try:
+        while lb + curr <= max_contacts:
+            print(f"Solving {lb + curr}: ", end="", flush=True)
+            encode_time, solve_time = src.encode.solve_sat(
+                seq_file, lb + curr, dim, ver, use_cached, solver, count_encoding, search.get_timeout())
+            total_encode_time += abs(encode_time)
+            total_solve_time += abs(solve_time)
+            sat = solve_time > 0
+            search.update(lb + curr, sat)
+            if not sat:
+                break
+            sat_solve_time += solve_time
+            curr *= 2
+        print(f"Failed to solve at {lb + curr}\n")
+
+        curr = max(lb, lb + curr // 2 - 1)
+        print("Start linear search to max contacts")
+        while curr < max_contacts:
+            curr += 1
+            print(f"Solving {curr}:", end=" ", flush=True)
+            encode_time, solve_time = src.encode.solve_sat(
+                seq_file, curr, dim, ver, use_cached, solver, count_encoding, search.get_timeout())
+            total_encode_time += abs(encode_time)
+            total_solve_time += abs(solve_time)
+            sat = solve_time > 0
+            search.update(curr, sat)
+            if not sat:
+                break
+            sat_solve_time += solve_time
+    except src.encode.Timeout as e:
+        total_encode_time += e.encode_time
+        total_solve_time += e.solve_time
+    print()
+    return get_result(search, total_encode_time, total_solve_time, sat_solve_time)
+
+
+def parallel_search_policy(seq_file: str, dim: int, ver: int, use_cached: bool, 
+        solver: str, count_encoding: str = None) -> dict[str, float]:
+    """
+    Probe k contacts at once between the highest SAT and the lowest UNSAT,
+    cancelling the probes which a result makes irrelevant
+    """
+    k = config.PARALLEL_PROBES or os.cpu_count()
+    # The probes are solver processes of their own, which these modes would replace
+    modes = {"--incremental": config.INCREMENTAL, "--deepen": config.DEEPENING and src.deepening.can_deepen(ver), "--cube": config.CUBE}
+    if any(modes.values()):
+        raise ValueError(f"The parallel search cannot be combined with {', '.join(m for m, on in modes.items() if on)}")
+    if solver == "portfolio":
+        solver = config.PORTFOLIO[0]
+        print(f"The parallel search runs one solver per probe, using {solver}")
+    start_wall, start_cpu = time.time(), get_cpu_time()
+    total_encode_time, total_solve_time, sat_solve_time = 0.0, 0.0, 0.0
+    seq = src.encode.get_sequence(seq_file)
+    lo, hi = get_lower_bound(seq_file, dim), src.bounds.get_contact_bound(seq, dim) + 1
+    search = Search(lo, hi - 1)
+    if src.encode.use_split_base(count_encoding):
+        # Build the shared base before the probes start
+        src.encode.get_base(seq_file, dim, ver, use_cached)
+
+    results = queue.Queue()
+    lock = threading.Lock()
+    running: dict[int, object] = {}
+    cancelled: set[int] = set()
+    # Exceptions of the probes and folds which failed verification, raised once the probes are stopped
+    errors: list[Exception] = []
+
+    def probe(goal: int) -> None:
+        """Run a probe, always putting a result so the search never waits for a probe which failed"""
+        try:
+            results.put(run_probe(goal))
+        except Exception as e:
+            errors.append(e)
+            with lock:
+                if goal in running:
+                    src.encode.stop_solver(running[goal])
+            results.put((goal, None, 0.0, 0.0, False))
+
+    def run_probe(goal: int) -> tuple[int, bool | None, float, float, bool]:
+        src.trace.start_probe()
+        start, timeout = time.time(), search.get_timeout()
+        if src.encode.use_split_base(count_encoding):
+            file_path, bounds = src.encode.get_base(seq_file, dim, ver, use_cached)
+            units = src.encode.get_bound_units(bounds, seq, goal, ver)
+        else:
+            file_path = src.encode.encode(seq_file, goal, dim, ver, False, use_cached, count_encoding)
+            units = None
+        encode_time = time.time() - start
+        budget = None if timeout is None else max(0.0, timeout - encode_time)
+        with lock:
+            if goal in cancelled:
+                return (goal, None, encode_time, 0.0, False)
+            start = time.time()
+            running[goal] = src.encode.start_solver(solver, file_path, units)
+        timer = src.encode.start_timer(budget, src.encode.stop_solver, running[goal])
+        comments = [] if config.TRACE else None
+        with src.trace.phase("solve"):
+            sat, model = src.encode.wait_solver(running[goal], config.DECODE_FOLDS, comments)
+        timer.cancel()
+        solve_time = time.time() - start
+        out_of_time = sat is None and src.encode.is_out_of_budget(budget, solve_time)
+        if goal not in cancelled:
+            with src.trace.phase("parse"):
+                stats = src.trace.parse_statistics(comments or [])
+                if sat and config.DECODE_FOLDS:
+                    fold_file = src.fold.write_fold(seq_file, goal, dim, ver, file_path, model)
+                    print(f"fold: {fold_file}")
+                    try:
+                        src.verify.verify_fold_file(fold_file, goal)
+                    except src.verify.VerificationError as e:
+                        errors.append(e)
+            result = {True: "SAT", False: "UNSAT", None: "TIMEOUT" if out_of_time else "NA"}[sat]
+            src.trace.write_probe(seq_file, goal, dim, ver, solver, result, stats)
+        return (goal, sat, encode_time, solve_time, out_of_time)
+
+    print(f"Start parallel search with {k} probes to max contacts: {hi - 1}")
+    in_flight: set[int] = set()
+    # Goals whose probe ran out of time, which are not probed again
+    unknown: set[int] = set()
+    while hi - lo > 1:
+        # Spread the free probes evenly over the open goals
+        open_goals = [g for g in range(lo + 1, hi) if g not in in_flight | unknown]
+        free = k - len(in_flight)
+        if free > 0 and open_goals:
+            step = len(open_goals) / (min(free, len(open_goals)) + 1)
+            for i in range(1, min(free, len(open_goals)) + 1):
+                goal = open_goals[int(i * step)]
+                if goal not in in_flight:
+                    in_flight.add(goal)
+                    threading.Thread(target=probe, args=(goal,), daemon=True).start()
+        if not in_flight:
+            break
+
+        try:
+            goal, sat, encode_time, solve_time, out_of_time = results.get(timeout=search.get_remaining())
+        except queue.Empty:
+            print("The search ran out of time")
             break
-        sat_solve_time += solve_time
-        curr *= 2
-    print(f"Failed to solve at {curr}\n")
-
-    curr = curr // 2 - 1
-    print("Start linear search to max contacts")
-    while curr < max_contacts:
-        curr += 1
-        print(f"Solving {curr}:", end=" ", flush=True)
-        encode_time, solve_time = src.encode.solve_sat(
-            seq_file, curr, dim, ver, use_cached, solver, count_encoding)
-        total_encode_time += abs(encode_time)
-        total_solve_time += abs(solve_time)
-        sat = solve_time > 0
-        if not sat:
-            curr -= 1
+        in_flight.discard(goal)
+        with lock:
+            running.pop(goal, None)
+        total_encode_time += encode_time
+        total_solve_time += solve_time
+        if errors:
             break
-        sat_solve_time += solve_time
+        if goal in cancelled:
+            continue
+        if out_of_time:
+            print(f"Solved {goal}: TIMEOUT")
+            unknown.add(goal)
+            continue
+        # Like solve_sat, a solver which gives no answer counts as UNSAT
+        print(f"Solved {goal}: {'SAT' if sat else 'UNSAT'}")
+        search.update(goal, sat)
+        if sat:
+            lo = max(lo, goal)
+            sat_solve_time += solve_time
+        else:
+            hi = min(hi, goal)
+
+        # Cancel the probes outside of the open goals
+        with lock:
+            for g in in_flight:
+                if not lo < g < hi:
+                    cancelled.add(g)
+                    if g in running:
+                        src.encode.stop_solver(running[g])
+
+    # Stop the probes still running when the search ends early
+    with lock:
+        cancelled.update(in_flight)
+        for g in in_flight:
+            if g in running:
+                src.encode.stop_solver(running[g])
+
+    # Wait for the cancelled probes so their solvers are not left running
+    while in_flight:
+        goal, _, encode_time, solve_time, _ = results.get()
+        in_flight.discard(goal)
+        total_encode_time += encode_time
+        total_solve_time += solve_time
+    if errors:
+        raise errors[0]
+    print()
+    return {
+        **get_result(search, total_encode_time, total_solve_time, sat_solve_time),
+        "wall_time": time.time() - start_wall,
+        "cpu_time": get_cpu_time() - start_cpu
+    }
+
+
+def maxsat_policy(seq_file: str, dim: int, ver: int, use_cached: bool,
+        solver: str, count_encoding: str = None) -> dict[str, float]:
+    """Core guided MaxSAT search for max contacts, in one call with the contacts as soft clauses"""
+    lower, upper = get_lower_bound(seq_file, dim), src.bounds.get_contact_bound(
+        src.encode.get_sequence(seq_file), dim)
+    search = Search(lower, upper)
+    print(f"Start MaxSAT search to max contacts: {upper}")
+    print("Solving:", end=" ", flush=True)
+    found, proven, encode_time, solve_time, (num_vars, num_clauses) = src.maxsat.solve_maxsat(
+        seq_file, dim, ver, use_cached, solver, count_encoding, search.get_timeout())
+    if found is not None:
+        search.update(found, True)
+    if proven is not None:
+        search.update(proven + 1, False)
     print()
+    # Only the encoding of goal 0 was solved, so its size is the size of the test
+    return {
+        **get_result(search, encode_time, solve_time, solve_time if found is not None else 0.0),
+        "vars": num_vars,
+        "cls": num_clauses
+    }
+
+
+def get_lower_bound(seq_file: str, dim: int) -> int:
+    """
+    Return the contacts of a heuristic fold within the grid of the encodings,
+    which need no SAT probe, or 0 if disabled or no fold was found
+    """
+    if not config.HEURISTIC:
+        return 0
+    start = time.time()
+    seq = src.encode.get_sequence(seq_file)
+    width = src.encode.get_grid_diameter(dim, len(seq))
+    positions, contacts = src.heuristic.fold(seq, dim, bound=src.bounds.get_contact_bound(seq, dim), width=width)
+    if positions is None:
+        print(f"No heuristic fold within the grid of width {width}")
+        return 0
+    print(f"Heuristic fold with {contacts} contacts in {time.time() - start:.2f}s")
+    return contacts
+
+
+def get_result(search: Search, encode_time: float, solve_time: float, sat_solve_time: float) -> dict[str, float]:
+    """Return the result of a search, with the best proven bounds if it stopped early"""
+    if search.get_status() != "optimal":
+        print(f"Stopped with max contacts between {search.lower} and {search.upper}")
     return {
-        "max_contacts": curr,
-        "encode_time": total_encode_time,
-        "solve_time": total_solve_time,
-        "sat_solve_time": sat_solve_time
+        "max_contacts": search.lower,
+        "encode_time": encode_time,
+        "solve_time": solve_time,
+        "sat_solve_time": sat_solve_time,
+        "lower": search.lower,
+        "upper": search.upper,
+        "status": search.get_status(),
+        "probed": sorted(search.probed)
     }
+
+
+def get_cpu_time() -> float:
+    """Return the CPU time used by this process and its finished child processes"""
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
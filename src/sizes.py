@@ -0,0 +1,294 @@
+"""
+Closed form sizes of the encodings, the number of variables and clauses which
+bule (or src.native) generates for each version and counting encoding, known
+before paying for the grounding, or for src.cardinality by generating them
+which is cheap next to the rest. Run it on a sequence to compare the versions,
+or without one to validate the model against the results of the encoding tests
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import os
+
+import src.bounds
+import src.cardinality
+import src.encode
+from src import config
+
+RESULTS = "results/encoding"
+
+# Clauses of `fullAdder` in cc_a.bul, one per input combination for the sum bit
+# and three each for the carry being set and unset
+FULL_ADDER_CLAUSES = 14
+
+
+def main() -> None:
+    args = parse_args()
+    if args.input_file is None:
+        return validate(RESULTS, args.input_dir)
+    seq = src.encode.get_sequence(args.input_file)
+    goal = src.bounds.get_contact_bound(seq, args.dimension) if args.goal is None else args.goal
+    print(f"Sizes at {goal} contacts, with {args.count_encoding}")
+    for ver in sorted(VERSIONS, key=lambda v: get_size(seq, args.dimension, v, goal, None, args.count_encoding)[1]):
+        num_vars, num_clauses = get_size(seq, args.dimension, ver, goal, None, args.count_encoding)
+        print(f"v{ver}: {num_vars:>10} vars {num_clauses:>12} clauses")
+
+
+def get_size(
+    seq: str,
+    dim: int,
+    ver: int,
+    goal: int,
+    width: int = None,
+    count_encoding: str = "counter.bul"
+) -> tuple[int, int]:
+    """Return the number of variables and clauses of an encoding, as in its DIMACS header"""
+    w = width or src.encode.get_grid_diameter(dim, len(seq))
+    num_vars, num_clauses, counted = VERSIONS[ver](seq, dim, w)
+    # v0 counts the contacts of adjacent "1"s too, the others only potential contacts
+    bound = goal + src.encode.get_adjacent_ones(seq) if ver == 0 else goal
+    if count_encoding in src.cardinality.ENCODINGS:
+        count_vars, count_clauses = src.cardinality.get_size(count_encoding, counted, bound)
+    else:
+        count_vars, count_clauses = COUNTERS[count_encoding or "counter.bul"](counted, bound)
+    return num_vars + count_vars, num_clauses + count_clauses
+
+
+def get_v0_size(seq: str, dim: int, w: int) -> tuple[int, int, int]:
+    """
+    Return the variables, clauses and counted variables of `constraints_2d_v0.bul`
+    and `constraints_3d_v0.bul`, which place the characters on the points of the grid
+    """
+    n, ones = len(seq), seq.count("1")
+    points, edges = w ** dim, dim * w ** (dim - 1) * (w - 1)
+    num_vars = n * points + points + edges
+    num_clauses = (
+        n + n * points * (points - 1) // 2     # Every character on exactly one point
+        + points * n * (n - 1) // 2            # At most one character on a point
+        + (n - 1) * points                     # Adjacent characters on adjacent points
+        + points * ones + points               # is_one(G)
+        + 3 * edges                            # contact(G1,G2)
+    )
+    return num_vars, num_clauses, edges
+
+
+def get_v1_size(seq: str, dim: int, w: int) -> tuple[int, int, int]:
+    """Return the variables, clauses and counted variables of `constraints_v1.bul`"""
+    n, d = len(seq), dim
+    pairs, adjacent, potential = n * (n - 1) // 2, n - 1, get_potential_contacts(seq)
+    num_vars = n * w * d + pairs * d + (adjacent + potential) * d + potential
+    num_clauses = (
+        n * d + n * d * w * (w - 1) // 2       # Exactly one position in every dimension
+        + 3 * pairs * d * w + pairs            # same(I,J,D)
+        + (adjacent + potential) * d * (3 * w - 2)  # next(I,J,D)
+        + get_adjacency_clauses(adjacent, d)
+        + get_contact_clauses(potential, d)
+    )
+    return num_vars, num_clauses, potential
+
+
+def get_v2_size(seq: str, dim: int, w: int, symmetry: bool = False) -> tuple[int, int, int]:
+    """
+    Return the variables, clauses and counted variables of `constraints_v2.bul`,
+    or of `constraints_v4.bul` if symmetry is set
+    """
+    n, d = len(seq), dim
+    pairs, adjacent, potential = n * (n - 1) // 2, n - 1, get_potential_contacts(seq)
+    num_vars = n * w * d + pairs * d + (adjacent + potential) * d + potential
+    num_clauses = (
+        n * d + n * max(0, w - 2) * d          # Order of y(I,P,D)
+        + pairs * (3 * (w - 1) * d + d + 1)    # same(I,J,D)
+        + (adjacent + potential) * d * (4 * w - 6)  # next(I,J,D)
+        + get_adjacency_clauses(adjacent, d)
+        + get_contact_clauses(potential, d)
+    )
+    if symmetry:
+        # Translation and the first bond, then straight(K) and flat(K) for the first turns
+        num_clauses += (d if w > 1 else 0) + (w + 1 if n > 1 else 0)
+        turns = n - 2 if n > 2 else 0
+        if d > 1:
+            num_vars, num_clauses = num_vars + turns, num_clauses + turns * (w + 2)
+        if d > 2:
+            num_vars, num_clauses = num_vars + turns, num_clauses + turns * (w + 1)
+    return num_vars, num_clauses, potential
+
+
+def get_v3_size(seq: str, dim: int, w: int) -> tuple[int, int, int]:
+    """Return the variables, clauses and counted variables of `constraints_v3.bul`"""
+    n, d = len(seq), dim
+    pairs, adjacent, potential = n * (n - 1) // 2, n - 1, get_potential_contacts(seq)
+    num_vars = 2 * n * w * d + pairs * d + potential * d + potential
+    num_clauses = (
+        n * d + n * d * (w - 1)                # Order of y(I,P,D)
+        + 2 * n * d * w + n * d * (w - 1)      # x(I,P,D) from y(I,P,D)
+        # same(I,J,D), where "never two characters in the same position" is stated twice
+        + pairs * d * w + 2 * (adjacent + potential) * d * w + 2 * pairs
+        + 2 * (adjacent + potential) * d * (w - 1)  # near(I,J,D)
+        + potential * d + (adjacent + potential) * d * (d - 1) // 2
+    )
+    return num_vars, num_clauses, potential
+
+
+def get_adjacency_clauses(adjacent: int, d: int) -> int:
+    """Return the clauses making adjacent characters next in one dimension and the same in the others"""
+    return adjacent + adjacent * d * (d - 1) + adjacent * d
+
+
+def get_contact_clauses(potential: int, d: int) -> int:
+    """Return the clauses defining var(contact(I,J)) from next(I,J,D) and same(I,J,D)"""
+    return 3 * potential * d + potential * d * (d - 1)
+
+
+def get_counter_size(n: int, bound: int) -> tuple[int, int]:
+    """Return the variables and clauses of `counter.bul` for sum(xs) >= bound over n variables"""
+    if n == 0:
+        # Fails with an empty clause if the bound cannot be reached
+        return 0, int(bound > 0)
+    last = n - 1
+    js = {j for j in range(min(last, bound) + 1)} | ({bound, bound + 1} if bound > 0 else set())
+    # count(ID,I,J) exists for I from lo to hi, empty ranges have no cells
+    lo = {j: max(-1, j - 2) for j in js}
+    hi = {j: min(last, last - bound + j) for j in js}
+    size = {j: max(0, hi[j] - lo[j] + 1) for j in js}
+
+    num_vars, num_clauses = sum(size.values()), 1
+    for j in js:
+        if not size[j]:
+            continue
+        # count(I,J) -> count(I+1,J), and back down when the input is false
+        num_clauses += size[j] - 1 + max(0, hi[j] - max(0, lo[j] + 1) + 1)
+        if size.get(j + 1):
+            # The input and count(I,J) -> count(I+1,J+1), and count(I+1,J+1) -> count(I,J)
+            overlap = min(hi[j], hi[j + 1] - 1) - max(lo[j], lo[j + 1] - 1) + 1
+            num_clauses += 2 * max(0, overlap)
+    # count(-1,0) and ~count(-1,1)
+    num_clauses += sum(1 for j in (0, 1) if size.get(j) and lo[j] == -1)
+    return num_vars, num_clauses
+
+
+def get_adder_size(n: int, bound: int) -> tuple[int, int]:
+    """
+    Return the variables and clauses of `cc_a.bul` for sum(xs) == bound over n
+    variables, a tree of adders where node (I,K) sums 2^K - 1 inputs into K bits
+    """
+    if n == 0:
+        return 0, 0
+    # K of the root is 1 + 2//(N+1), with bule's integer logarithm
+    top = (n + 1).bit_length()
+    num_vars, num_clauses = 0, 0
+    for k in range(1, top + 1):
+        for i in range(0, 2 ** top, 2 ** k):
+            num_vars += 2 * min(k, n)
+            # The carry in equals an input, or is false past the last one
+            num_clauses += 2 if i + 2 ** (k - 1) - 1 < n else 1
+            # The top bit equals the last carry, and a full adder for each bit below
+            num_clauses += 2 + FULL_ADDER_CLAUSES * min(k - 1, n)
+    # A clause for every bit set in the bound
+    num_clauses += sum(1 for i in range(min(top, n)) if bound > 0 and bound >> i & 1)
+    return num_vars, num_clauses
+
+
+def get_potential_contacts(seq: str) -> int:
+    """Return the number of pc[I,J], the pairs of "1"s an odd distance of at least 3 apart"""
+    n = len(seq)
+    return sum(1 for i in range(n) for j in range(i + 3, n, 2) if seq[i] == seq[j] == "1")
+
+
+def is_feasible(seq: str, dim: int, ver: int) -> bool:
+    """Return if the largest encoding a search may generate is within the clause budget"""
+    if config.MAX_CLAUSES is None:
+        return True
+    goal = src.bounds.get_contact_bound(seq, dim)
+    return get_size(seq, dim, ver, goal)[1] <= config.MAX_CLAUSES
+
+
+def get_cheapest_version(seq: str, dim: int, goal: int, versions: list[int], count_encoding: str = "counter.bul") -> int:
+    """Return the version with the fewest clauses for the goal"""
+    return min(versions, key=lambda ver: get_size(seq, dim, ver, goal, None, count_encoding)[1])
+
+
+def validate(results_dir: str, input_dir: str) -> None:
+    """
+    Compare the model with the sizes recorded by the encoding tests. The goal of
+    a search is not recorded, so it is recovered as the goals where the model
+    matches the v2 result of the same sequence, which src.native checks clause
+    by clause, or any goal the search could have reached if there is none
+    """
+    results: dict[tuple[str, int, bool], dict[int, tuple[int, int]]] = {}
+    for results_file in glob.glob(os.path.join(results_dir, "*.csv")):
+        # Results which only encode do so at a goal of 1
+        encoded = results_file.endswith("_NAs_NAp.csv")
+        with open(results_file) as f:
+            for r in csv.DictReader(f):
+                # Searches which solved no encoding at their max contacts have no size
+                if r["vars"] == "NA":
+                    continue
+                key = (r["name"], int(r["dim"]), encoded)
+                results.setdefault(key, {})[int(r["ver"])] = (int(r["vars"]), int(r["cls"]))
+
+    matches: dict[tuple[int, int], list[int]] = {}
+    for (name, dim, encoded), sizes in sorted(results.items()):
+        input_file = os.path.join(input_dir, name)
+        if not os.path.isfile(input_file):
+            continue
+        seq = src.encode.get_sequence(input_file)
+        # A search may stop at the UNSAT goal past the bound
+        goals = range(src.bounds.get_contact_bound(seq, dim) + 2)
+        if encoded:
+            goals = [1]
+        elif 2 in sizes:
+            goals = [g for g in goals if get_size(seq, dim, 2, g) == sizes[2]] or goals
+        for ver, size in sizes.items():
+            exact = any(get_size(seq, dim, ver, g) == size for g in goals)
+            matches.setdefault((dim, ver), []).append(exact)
+            if not exact:
+                print(f"{name} {dim}D v{ver}: recorded {size}, predicted {get_size(seq, dim, ver, goals[0])}")
+    for (dim, ver), exact in sorted(matches.items()):
+        print(f"{dim}D v{ver}: {sum(exact)} of {len(exact)} exact")
+
+
+VERSIONS = {
+    0: get_v0_size,
+    1: get_v1_size,
+    2: get_v2_size,
+    3: get_v3_size,
+    4: lambda seq, dim, w: get_v2_size(seq, dim, w, True)
+}
+COUNTERS = {"counter.bul": get_counter_size, "cc_a.bul": get_adder_size}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "input_file",
+        nargs="?", type=str,
+        help="the path to the input file containing a string of 1s and 0s, validate the model if not given"
+    )
+    parser.add_argument(
+        "-c", "--count-encoding",
+        nargs="?", type=str, default="counter.bul", choices=set(COUNTERS) | set(src.cardinality.ENCODINGS),
+        help="the encoding of the cardinality constraint, default value: counter.bul"
+    )
+    parser.add_argument(
+        "-d", "--dimension",
+        nargs="?", type=int, default=2, choices={2, 3},
+        help="the dimension of the embedding grid, default value: 2"
+    )
+    parser.add_argument(
+        "-g", "--goal",
+        nargs="?", type=int,
+        help="the number of contacts, default: the contact bound"
+    )
+    parser.add_argument(
+        "-i", "--input-dir",
+        nargs="?", type=str, default="input",
+        help="the folder of the sequences of the results when validating, default value: input"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Append only store of the results of every test in one SQLite database. Every
+run adds its rows instead of overwriting a CSV, workers write to it at once
+through the write ahead log, and the analysis reads it with one query. Run it
+to import the CSVs of the results folders and print the mean times
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import os
+import sqlite3
+from datetime import datetime
+
+from src import config
+
+RESULTS_ROOT = "results"
+
+# Columns of the results, in the order of the CSV header of src.encode
+COLUMNS = {
+    "name": "TEXT",
+    "len": "INTEGER",
+    "dim": "INTEGER",
+    "ver": "INTEGER",
+    "solver": "TEXT",
+    "policy": "TEXT",
+    "encode_time": "REAL",
+    "total_time": "REAL",
+    "sat_time": "REAL",
+    "vars": "INTEGER",
+    "cls": "INTEGER",
+    "status": "TEXT",
+    "lower": "INTEGER",
+    "upper": "INTEGER"
+}
+KEYS = ["name", "dim", "ver", "solver", "policy"]
+
+# Rows of searches which proved their optimum, or only encoded, rows from before the status was recorded have none
+SOLVED = "COALESCE(status, 'optimal') IN ('optimal', 'NA')"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    time TEXT NOT NULL,
+    results_dir TEXT NOT NULL,
+    source TEXT,
+    {", ".join(f"{column} {kind}" for column, kind in COLUMNS.items())}
+);
+CREATE INDEX IF NOT EXISTS results_test ON results (results_dir, {", ".join(KEYS)});
+CREATE INDEX IF NOT EXISTS results_config ON results (dim, ver, solver, policy);
+CREATE TABLE IF NOT EXISTS imports (source TEXT PRIMARY KEY, mtime REAL NOT NULL);
+"""
+
+
+def main() -> None:
+    args = parse_args()
+    with connect(args.store) as conn:
+        if args.import_csvs:
+            for results_dir in glob.glob(os.path.join(RESULTS_ROOT, "*/")):
+                print(f"Imported {import_csvs(conn, results_dir)} results from {results_dir}")
+        print_summary(conn, args.results_dir)
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """Open the store, creating it if needed, so that several processes can write to it"""
+    path = path or config.RESULTS_STORE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Wait for the other writers rather than failing while they hold the lock
+    conn = sqlite3.connect(path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    # Stores created before a column was added get it, empty for the old rows
+    existing = {r["name"] for r in conn.execute("PRAGMA table_info(results)")}
+    for column, kind in COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE results ADD COLUMN {column} {kind}")
+    return conn
+
+
+def add_results(results_dir: str, rows: list[list], source: str = None) -> None:
+    """Append the rows of a test, in the columns of the CSV header, if there is a store"""
+    if not config.RESULTS_STORE:
+        return
+    # Sources are kept normalised, so the same CSV reached by another path is not imported again
+    source = source and os.path.normpath(source)
+    conn = connect()
+    try:
+        with conn:
+            insert(conn, results_dir, rows, source)
+            if source and os.path.isfile(source):
+                # The CSV written next to the rows is already in the store
+                mark_imported(conn, source)
+    finally:
+        conn.close()
+
+
+def insert(conn: sqlite3.Connection, results_dir: str, rows: list[list], source: str = None) -> None:
+    now = datetime.now().isoformat(timespec="seconds")
+    conn.executemany(
+        f"INSERT INTO results (time, results_dir, source, {', '.join(COLUMNS)}) "
+        f"VALUES (?, ?, ?, {', '.join('?' * len(COLUMNS))})",
+        [[now, results_dir, source, *parse_row(row)] for row in rows]
+    )
+
+
+def mark_imported(conn: sqlite3.Connection, source: str) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO imports (source, mtime) VALUES (?, ?)",
+        (os.path.normpath(source), os.path.getmtime(source))
+    )
+
+
+def parse_row(row: list) -> list:
+    """
+    Return the values of a row in the types of the columns, with None for
+    numbers given as NA and for the columns older rows do not have
+    """
+    values = []
+    for value, kind in zip(row, COLUMNS.values()):
+        try:
+            values.append({"TEXT": str, "INTEGER": int, "REAL": float}[kind](value))
+        except ValueError:
+            values.append(None)
+    return values + [None] * (len(COLUMNS) - len(values))
+
+
+def import_csvs(conn: sqlite3.Connection, results_dir: str) -> int:
+    """
+    Add the rows of the CSVs of a results folder which are new or changed since
+    they were imported, returning how many rows were added
+    """
+    imported = {}
+    for r in conn.execute("SELECT source, mtime FROM imports"):
+        # Stores from before the sources were normalised may have several paths of a CSV
+        source = os.path.normpath(r["source"])
+        imported[source] = max(imported.get(source, -1.0), r["mtime"])
+    name = os.path.basename(os.path.normpath(results_dir))
+    count = 0
+    with conn:
+        for source in sorted(map(os.path.normpath, glob.glob(os.path.join(results_dir, "*.csv")))):
+            if imported.get(source, -1.0) >= os.path.getmtime(source):
+                continue
+            with open(source) as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if header is None:
+                    continue
+                rows = [row for row in reader if len(row) == len(header)]
+            insert(conn, name, rows, source)
+            mark_imported(conn, source)
+            count += len(rows)
+    return count
+
+
+def get_result_dicts(conn: sqlite3.Connection, results_dir: str) -> list[dict]:
+    """
+    Return every test of a results folder with the mean of its runs, as
+    analysis.ipynb uses them, leaving out the searches which ran out of time
+    """
+    means = ", ".join(f"AVG({c}) AS {c}" for c, kind in COLUMNS.items() if kind != "TEXT" and c not in KEYS)
+    query = (
+        f"SELECT {', '.join(KEYS)}, {means} FROM results WHERE results_dir = ? AND {SOLVED} "
+        f"GROUP BY {', '.join(KEYS)} ORDER BY {', '.join(KEYS)}"
+    )
+    return [dict(r) for r in conn.execute(query, (results_dir,))]
+
+
+def print_summary(conn: sqlite3.Connection, results_dir: str) -> None:
+    """Print the number of tests and mean times of every configuration of a results folder"""
+    query = (
+        "SELECT dim, ver, solver, policy, COUNT(DISTINCT name) AS tests, "
+        "AVG(encode_time) AS encode_time, AVG(ABS(total_time)) AS total_time "
+        f"FROM results WHERE results_dir = ? AND solver != 'NA' AND {SOLVED} "
+        "GROUP BY dim, ver, solver, policy ORDER BY dim, total_time"
+    )
+    for r in conn.execute(query, (results_dir,)):
+        print(
+            f"{r['dim']}D v{r['ver']} {r['solver']:<14} {r['policy']:<24} "
+            f"{r['tests']:>5} tests {r['encode_time']:>8.2f}s encode {r['total_time']:>10.2f}s total"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--import-csvs",
+        action="store_true",
+        help="import the CSVs of the results folders which are new or changed"
+    )
+    parser.add_argument(
+        "-r", "--results-dir",
+        nargs="?", type=str, default="encoding",
+        help="the results folder summarised, default value: encoding"
+    )
+    parser.add_argument(
+        "--store",
+        nargs="?", type=str,
+        help=f"the path of the store, default value: {config.RESULTS_STORE}"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Tracing of the goal probes of a search. Every probe appends one JSON line to the
+trace file with the time spent in each of its phases and the statistics of the
+solver, so it shows why an instance is slow and not only how slow it is
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from src import config
+
+TRACE_FILE = "results/trace.jsonl"
+
+# Phases of a probe: writing the bul file, grounding it with bule (which writes
+# the CNF too) or natively, writing a native CNF, running the solver and parsing
+# its output
+PHASES = ["bul", "ground", "cnf", "solve", "parse"]
+
+# Statistics lines of the solvers, "c conflicts: 123 ..." from kissat and CaDiCaL,
+# "c conflicts : 123 (...)" from glucose and MapleSAT and CryptoMiniSat which
+# may abbreviate large numbers as "1.23 M"
+STATISTICS = {
+    "conflicts": re.compile(rb"c\s+conflicts\s*:\s*([\d.]+)\s*([KM]?)\b"),
+    "decisions": re.compile(rb"c\s+decisions\s*:\s*([\d.]+)\s*([KM]?)\b"),
+    "propagations": re.compile(rb"c\s+propagations\s*:\s*([\d.]+)\s*([KM]?)\b"),
+    "restarts": re.compile(rb"c\s+restarts\s*:\s*([\d.]+)\s*([KM]?)\b"),
+    "learnt": re.compile(rb"c\s+(?:learned|learnt|learnt clauses|clauses learned)\s*:\s*([\d.]+)\s*([KM]?)\b")
+}
+MULTIPLIERS = {b"": 1, b"K": 10 ** 3, b"M": 10 ** 6}
+
+# Phases of the probe running on each thread, as the parallel search runs several
+PROBES = threading.local()
+LOCK = threading.Lock()
+
+
+def start_probe() -> None:
+    """Start timing the phases of a new probe on this thread"""
+    PROBES.phases = {}
+
+
+@contextmanager
+def phase(name: str):
+    """Add the time spent in the block to a phase of the probe, if one was started"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        phases = getattr(PROBES, "phases", None)
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + time.time() - start
+
+
+def parse_statistics(lines: list[bytes]) -> dict[str, int]:
+    """Return the statistics in the comment lines of a solver, the last value of each"""
+    stats = {}
+    for line in lines:
+        for name, pattern in STATISTICS.items():
+            match = pattern.match(line)
+            if match:
+                stats[name] = int(float(match.group(1)) * MULTIPLIERS[match.group(2)])
+    return stats
+
+
+def get_pysat_statistics(solver) -> dict[str, int]:
+    """Return the statistics of a pysat solver over every call so far"""
+    return {name: value for name, value in solver.accum_stats().items() if name in STATISTICS}
+
+
+def write_probe(seq_file: str, goal: int, dim: int, ver: int, solver: str, result: str, stats: dict[str, int]) -> None:
+    """Append the event of the probe on this thread to the trace, if tracing"""
+    phases, PROBES.phases = getattr(PROBES, "phases", None) or {}, None
+    if not config.TRACE:
+        return
+    event = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "seq": seq_file.split("/")[-1],
+        "goal": goal,
+        "dim": dim,
+        "ver": ver,
+        "solver": solver,
+        "result": result,
+        "phases": {name: phases[name] for name in PHASES if name in phases},
+        "stats": stats
+    }
+    with LOCK, open(config.TRACE, "a") as f:
+        f.write(json.dumps(event) + "\n")
@@ -5,6 +5,8 @@ same number of max contacts.
 from __future__ import annotations
 import os
 
+from src import config
+from src.cardinality import ENCODINGS as CARDINALITY_ENCODINGS
 from src.encode import encode, get_num_vars_and_clauses, get_max_contacts
 from src.run_tests import get_sequences
 from src.search_policies import *
@@ -26,10 +28,10 @@ ENCODINGS = [(2, 1), (2, 4)]
 FUNCTIONS = [binary_search_policy, linear_search_policy,
              double_binary_policy, double_linear_policy]
 
-COUNT_ENCODINGS = ["cc_a.bul", "counter.bul"]
+COUNT_ENCODINGS = ["cc_a.bul", "counter.bul", *CARDINALITY_ENCODINGS]
 
 # Flag to choose if we compare encodings or methods of search
-# {"encoding", "policy", "counting"}
+# {"encoding", "policy", "counting", "native"}
 COMPARISON = "encoding"
 
 def main():
@@ -37,6 +39,8 @@ def main():
         pass
     if COMPARISON == "counting":
         compare_counting()
+    elif COMPARISON == "native":
+        compare_native()
     elif COMPARISON == "encoding":
         compare_encodings()
     elif COMPARISON == "policy":
@@ -181,5 +185,28 @@ def compare_counting():
     return
 
 
+def compare_native():
+    """Check the native encoder generates as many variables and clauses as bule"""
+    mismatches = 0
+    for sequence in get_sequences(INPUT_DIR, "all", min_len=MIN_LEN, max_len=MAX_LEN):
+        filename = os.path.join(INPUT_DIR, sequence["filename"])
+        for dim, ver in [(d, v) for d in [2, 3] for v in [2, 4]]:
+            results = []
+            for native in [False, True]:
+                config.NATIVE_ENCODING = native
+                goal_contacts = get_max_contacts(sequence["seq"], dim)
+                encode(filename, goal_contacts, dim, ver, False, False)
+                results.append(get_num_vars_and_clauses(
+                    sequence["filename"], dim, ver, goal_contacts))
+            config.NATIVE_ENCODING = False
+            same = results[0] == results[1]
+            mismatches += not same
+            with open(OUTPUT, "a") as f:
+                f.write(f"{filename = } | {dim = } | {ver = } | bule = {results[0]} | native = {results[1]}\n")
+                f.write(f"Same size : {same}\n\n")
+    with open(OUTPUT, "a") as f:
+        f.write(f"\n\nMismatches -> {mismatches}\n")
+
+
 if __name__ == "__main__":
     main()
@@ -1,6 +1,6 @@
 """
 Visualise embedding of the protein string on the grid given a solved model from
-a file. Does not work for at least order
+a file, or a 2D fold decoded by `--fold`. Does not work for at least order
 
 Example:
 
@@ -29,6 +29,7 @@ from __future__ import annotations
 import re
 import sys
 
+from src.fold import load_fold
 from src.util.convert import convert
 
 def main():
@@ -59,6 +60,9 @@ def main():
         print("=" * (len(grid[0] * 2) + 1))
 
 def get_sequence_embedding(filepath: str) -> str:
+    if filepath.endswith(".fold.json"):
+        # 2D fold decoded when solving with --fold
+        return [f"x({i},{x},{y})" for i, (x, y) in enumerate(load_fold(filepath)["coords"])]
     with open(filepath) as f:
         line = f.readlines()[-1]
         if re.match(r"x\(\d,\d,\d\)", line):
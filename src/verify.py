@@ -0,0 +1,196 @@
+"""
+Verify folds and optima instead of trusting the encodings. Folds are checked in
+batches with occupancy arrays of their bounding boxes: that consecutive
+characters are next to each other, that no two share a point and how many
+contacts they make. Optima are checked against the references in expected/.
+Run it to verify every decoded fold and the references themselves
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import os
+import re
+
+import numpy as np
+
+import src.encode
+import src.fold
+from src import config
+
+EXPECTED_DIR = "expected"
+FOLDS = "models/cnf/*.fold.json"
+
+# Result lines of the reference solvers in expected/
+EXPECTED = re.compile(r"Maximum contacts found for ([01]+) using \w+: (\d+)")
+
+# Cells of the occupancy arrays of a batch, larger batches are checked in chunks
+MAX_CELLS = 2 ** 24
+
+
+class VerificationError(Exception):
+    """A fold or an optimum which shows that an encoding is wrong"""
+
+
+def main() -> None:
+    args = parse_args()
+    errors = verify_fold_files(sorted(glob.glob(args.folds)))
+    errors += verify_expected(args.input_dir)
+    for error in errors:
+        print(error)
+    print(f"{len(errors)} errors")
+
+
+def check_folds(seq: str, coords: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return if each fold of a batch of shape (folds, n, dim) is a chain, if it
+    is self avoiding and its number of contacts
+    """
+    coords = np.asarray(coords, dtype=np.int64)
+    folds, n, dim = coords.shape
+    span = int((coords.max(axis=1) - coords.min(axis=1)).max(initial=0)) + 2
+    chunk = max(1, MAX_CELLS // span ** dim)
+    if folds > chunk:
+        results = [check_folds(seq, coords[i:i + chunk]) for i in range(0, folds, chunk)]
+        return tuple(np.concatenate(r) for r in zip(*results))
+
+    chain = (np.abs(np.diff(coords, axis=1)).sum(axis=-1) == 1).all(axis=-1)
+    # Index of every point in the bounding box, with a margin so the neighbours of its top corner fit
+    strides = span ** np.arange(dim)
+    points = (coords - coords.min(axis=1, keepdims=True)) @ strides
+    rows = np.broadcast_to(np.arange(folds)[:, None], points.shape)
+    occupancy = np.zeros((folds, span ** dim), dtype=np.int32)
+    np.add.at(occupancy, (rows, points), 1)
+    self_avoiding = occupancy.max(axis=1) <= 1
+
+    # Character at every point, and the "1"s at the next point of each dimension
+    grid = np.full((folds, span ** dim), -1, dtype=np.int32)
+    grid[rows, points] = np.arange(n)
+    ones = np.array([c == "1" for c in seq])
+    contacts = np.zeros(folds, dtype=np.int64)
+    for stride in strides:
+        j = grid[rows, points + stride]
+        contact = (j >= 0) & ones & ones[j] & (np.abs(j - np.arange(n)) > 1)
+        contacts += contact.sum(axis=1)
+    return chain, self_avoiding, contacts
+
+
+def get_fold_errors(seq: str, coords: np.ndarray, goals: list[int]) -> list[str | None]:
+    """Return why each fold of a batch is wrong for its goal, or None if it is right"""
+    chain, self_avoiding, contacts = check_folds(seq, coords)
+    errors = []
+    for i, goal in enumerate(goals):
+        if not chain[i]:
+            errors.append("consecutive characters are not next to each other")
+        elif not self_avoiding[i]:
+            errors.append("two characters are on the same point")
+        elif contacts[i] < goal:
+            errors.append(f"{contacts[i]} contacts instead of at least {goal}")
+        else:
+            errors.append(None)
+    return errors
+
+
+def verify_fold_file(fold_file: str, goal: int) -> None:
+    """Raise if the fold decoded from the model of a goal is not a fold with that many contacts"""
+    fold = src.fold.load_fold(fold_file)
+    error = get_fold_errors(fold["seq"], np.array([fold["coords"]]), [goal])[0]
+    if error:
+        raise VerificationError(f"Fold {fold_file} is wrong, {error}")
+
+
+def verify_fold_files(fold_files: list[str]) -> list[str]:
+    """Return the errors of fold files, checking the folds of a sequence and dimension at once"""
+    batches: dict[tuple[str, int], list[tuple[str, list[list[int]], int]]] = {}
+    for fold_file in fold_files:
+        fold = src.fold.load_fold(fold_file)
+        goal = int(re.search(r"_(\d+)c\.fold\.json$", fold_file).group(1))
+        batches.setdefault((fold["seq"], fold["dim"]), []).append((fold_file, fold["coords"], goal))
+    errors = []
+    for (seq, dim), folds in batches.items():
+        coords = np.array([c for _, c, _ in folds]).reshape(len(folds), len(seq), dim)
+        for (fold_file, _, _), error in zip(folds, get_fold_errors(seq, coords, [g for _, _, g in folds])):
+            if error:
+                errors.append(f"Fold {fold_file} is wrong, {error}")
+    print(f"Verified {len(fold_files)} folds")
+    return errors
+
+
+def get_expected(name: str, dim: int) -> dict[str, set[int]]:
+    """Return the contacts of the reference solvers in expected/ by sequence"""
+    files = [f"{name}_3D.txt"] if dim == 3 else [f"{name}.txt", f"{name}_opt.txt"]
+    expected = {}
+    for filename in files:
+        path = os.path.join(EXPECTED_DIR, filename)
+        if not os.path.isfile(path):
+            continue
+        with open(path) as f:
+            for seq, contacts in EXPECTED.findall(f.read()):
+                expected.setdefault(seq, set()).add(int(contacts))
+    return expected
+
+
+def get_native_contacts(name: str) -> int | None:
+    """Return the contacts of the native fold of a sequence on the cubic lattice, if it was ingested"""
+    if not os.path.isfile(config.NATIVE_FILE):
+        return None
+    with open(config.NATIVE_FILE) as f:
+        for r in csv.DictReader(f):
+            if r["name"] == name:
+                return int(r["contacts"])
+    return None
+
+
+def verify_optimum(seq_file: str, dim: int, max_contacts: int) -> None:
+    """Raise if an optimum differs from the references, or is below the contacts of the native fold"""
+    name, seq = os.path.basename(seq_file), src.encode.get_sequence(seq_file)
+    expected = get_expected(name, dim).get(seq)
+    if expected and max_contacts not in expected:
+        raise VerificationError(f"Found {max_contacts} contacts for {name} in {dim}D, expected {min(expected)}")
+    native = get_native_contacts(name) if dim == 3 else None
+    if native is not None and max_contacts < native:
+        raise VerificationError(f"Found {max_contacts} contacts for {name} in 3D, its native fold has {native}")
+
+
+def verify_expected(input_dir: str) -> list[str]:
+    """Return the errors of the references: disagreeing solvers, or sequences which are not the input"""
+    errors = []
+    names = {re.sub(r"(_opt|_3D)?\.txt$", "", f) for f in os.listdir(EXPECTED_DIR) if f.endswith(".txt")}
+    for name in sorted(names):
+        seq_file = os.path.join(input_dir, name)
+        try:
+            seq = src.encode.get_sequence(seq_file)
+        except FileNotFoundError:
+            seq = None
+        for dim in (2, 3):
+            for expected_seq, contacts in get_expected(name, dim).items():
+                if len(contacts) > 1:
+                    errors.append(f"{name} in {dim}D: the references disagree on {sorted(contacts)} contacts")
+                if seq is not None and expected_seq != seq:
+                    errors.append(f"{name} in {dim}D: the reference is for {expected_seq}, not {seq}")
+                native = get_native_contacts(name) if dim == 3 else None
+                if native is not None and max(contacts) < native:
+                    errors.append(f"{name} in 3D: {max(contacts)} contacts, its native fold has {native}")
+    print(f"Verified the references of {len(names)} sequences")
+    return errors
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-f", "--folds",
+        nargs="?", type=str, default=FOLDS,
+        help=f"the pattern of the fold files to verify, default value: {FOLDS}"
+    )
+    parser.add_argument(
+        "-i", "--input-dir",
+        nargs="?", type=str, default="input",
+        help="the folder of the sequences of the references, default value: input"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Spread the jobs of run_tests over several machines. A broker holds the jobs
+and leases them to workers over plain TCP, one JSON line per request and reply.
+Workers heartbeat while they run a job, and send back the result files it wrote,
+which the broker writes into its own results/ and store. Leases which are not
+renewed expire and go back to the queue. Finished jobs go into the journal of
+src.scheduler, so a broker which is restarted resumes the run. Run it to start
+workers on this machine, which need a checkout with the same input/
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import src.scheduler as scheduler
+import src.store as store
+from src import config
+
+ADDRESS = "localhost:7341"
+
+# Seconds a lease lasts without a heartbeat, and between heartbeats
+LEASE_TIME = 60
+HEARTBEAT_TIME = 10
+
+# Times a job is leased before it is given up on, as its workers died
+MAX_ATTEMPTS = 3
+
+# Seconds a worker keeps trying to reach the broker, and waits for a reply
+CONNECT_TIME = 60
+REPLY_TIMEOUT = 30
+
+# Runtime switches of run_tests which the workers take from the broker
+CONFIG = ["CNF_COMPRESSION", "PROBE_TIMEOUT", "SEARCH_TIMEOUT", "MAX_CLAUSES", "TRACE", "DECODE_FOLDS", "CUBE"]
+
+# Result files a worker may send back
+RESULT_FILE = re.compile(r"[\w.-]+\.(csv|json)")
+
+
+class Broker:
+    """The jobs of a run and their leases, shared by the threads serving the workers"""
+
+    def __init__(self, jobs: list[dict], journal: str, timeout: float = None):
+        finished = scheduler.read_journal(journal)
+        self.jobs = {job["id"]: job for job in jobs}
+        self.pending = [job["id"] for job in jobs if job["id"] not in finished]
+        self.leases: dict[str, tuple[str, float]] = {}
+        self.attempts: dict[str, int] = {}
+        self.timeout = timeout
+        self.journal = journal
+        self.lock = threading.Lock()
+        print(f"{len(jobs) - len(self.pending)} of {len(jobs)} jobs already done in {journal}")
+
+    def is_done(self) -> bool:
+        with self.lock:
+            return not self.pending and not self.leases
+
+    def lease(self, worker: str) -> dict:
+        """Lease the next job to a worker, or tell it to wait for leases to expire or stop"""
+        with self.lock:
+            if not self.pending:
+                return {"wait": HEARTBEAT_TIME} if self.leases else {"done": True}
+            job_id = self.pending.pop(0)
+            self.leases[job_id] = (worker, time.time() + LEASE_TIME)
+            self.attempts[job_id] = self.attempts.get(job_id, 0) + 1
+        job = self.jobs[job_id]
+        print(f"Leased {job_id} to {worker}: \t{job['seq']} \tv: {job['ver']} \td: {job['dim']}")
+        return {"job": job, "timeout": self.timeout, "config": {name: getattr(config, name) for name in CONFIG}}
+
+    def heartbeat(self, worker: str, job_id: str) -> dict:
+        """Renew the lease of a worker, false if its job was leased to another worker or finished"""
+        with self.lock:
+            if job_id in self.pending:
+                # The lease expired, but nobody else took the job yet
+                self.pending.remove(job_id)
+            elif self.leases.get(job_id, (None,))[0] != worker:
+                return {"ok": False}
+            self.leases[job_id] = (worker, time.time() + LEASE_TIME)
+        return {"ok": True}
+
+    def finish(self, worker: str, job_id: str, status: str, duration: float, files: dict[str, str]) -> dict:
+        """Record the result of a job, unless it was leased to another worker or finished since"""
+        with self.lock:
+            if job_id not in self.pending and self.leases.get(job_id, (None,))[0] != worker:
+                return {"ok": False}
+            if job_id in self.pending:
+                self.pending.remove(job_id)
+            self.leases.pop(job_id, None)
+            self.write_results(self.jobs[job_id], files)
+            scheduler.write_journal(self.journal, {"id": job_id, "status": status, "time": duration, "worker": worker})
+        print(f"Finished {job_id} on {worker}: {status} in {duration:.2f}s")
+        return {"ok": True}
+
+    def write_results(self, job: dict, files: dict[str, str]) -> None:
+        """Write the result files of a job into results/, adding the CSV rows to the store"""
+        results_dir = os.path.join("results/", job["results_dir"])
+        os.makedirs(results_dir, exist_ok=True)
+        for name, text in files.items():
+            if not RESULT_FILE.fullmatch(name):
+                print(f"Ignoring result file {name!r} of {job['id']}")
+                continue
+            results_file = os.path.join(results_dir, name)
+            with open(results_file, "w+") as f:
+                f.write(text)
+            if name.endswith(".csv"):
+                rows = [line.split(",") for line in text.splitlines()[1:] if line]
+                store.add_results(job["results_dir"], rows, results_file)
+
+    def expire(self) -> None:
+        """Put the jobs whose leases expired back at the front of the queue, until they ran out of attempts"""
+        now = time.time()
+        with self.lock:
+            for job_id, (worker, expiry) in list(self.leases.items()):
+                if expiry > now:
+                    continue
+                del self.leases[job_id]
+                if self.attempts[job_id] < MAX_ATTEMPTS:
+                    print(f"Lease of {job_id} on {worker} expired, retrying it")
+                    self.pending.insert(0, job_id)
+                else:
+                    print(f"Lease of {job_id} on {worker} expired, giving up after {MAX_ATTEMPTS} attempts")
+                    scheduler.write_journal(self.journal, {"id": job_id, "status": "lost", "time": None, "worker": worker})
+
+    def handle(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "lease":
+            return self.lease(request["worker"])
+        if op == "heartbeat":
+            return self.heartbeat(request["worker"], request["id"])
+        if op == "finish":
+            return self.finish(request["worker"], request["id"], request["status"], request["time"], request["files"])
+        return {"error": f"Unknown op {op!r}"}
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            reply = self.server.broker.handle(json.loads(self.rfile.readline()))
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            reply = {"error": f"Bad request: {e}"}
+        self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "localhost", int(port)
+
+
+def serve(jobs: list[dict], journal: str, address: str = ADDRESS, workers: int = 0, timeout: float = None) -> None:
+    """
+    Serve the jobs not yet in the journal to workers until every job is
+    finished, starting worker processes on this machine too
+    """
+    broker = Broker(jobs, journal, timeout)
+    server = Server(parse_address(address), Handler)
+    server.broker = broker
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    print(f"Serving {len(broker.pending)} jobs on {host}:{port}")
+    local = [start_worker(f"{host}:{port}") for _ in range(workers)]
+    try:
+        while not broker.is_done():
+            time.sleep(1)
+            broker.expire()
+        # Workers waiting for leases to expire ask again within a heartbeat
+        time.sleep(HEARTBEAT_TIME + 1)
+    finally:
+        server.shutdown()
+        server.server_close()
+        for p in local:
+            p.terminate()
+            p.wait()
+
+
+def start_worker(address: str) -> subprocess.Popen:
+    """Start a worker process on this machine, the same as the workers of other machines"""
+    return subprocess.Popen([sys.executable, "-m", "src.work_queue", address])
+
+
+def request(address: str, message: dict) -> dict:
+    """Send a request to the broker, retrying for CONNECT_TIME seconds while it cannot be reached"""
+    deadline = time.time() + CONNECT_TIME
+    while True:
+        try:
+            with socket.create_connection(parse_address(address), timeout=REPLY_TIMEOUT) as s:
+                s.sendall((json.dumps(message) + "\n").encode())
+                reply = json.loads(s.makefile("rb").readline())
+            if "error" in reply:
+                raise ValueError(reply["error"])
+            return reply
+        except (OSError, json.JSONDecodeError):
+            if time.time() > deadline:
+                raise
+            time.sleep(1)
+
+
+def work(address: str, name: str = None) -> None:
+    """Lease and run jobs from the broker until it has none left or cannot be reached"""
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            reply = request(address, {"op": "lease", "worker": name})
+        except OSError:
+            return print(f"Cannot reach the broker at {address}, stopping")
+        if reply.get("done"):
+            return print("No jobs left, stopping")
+        if "wait" in reply:
+            time.sleep(reply["wait"])
+            continue
+        for key, value in reply["config"].items():
+            if key in CONFIG:
+                setattr(config, key, value)
+        job = reply["job"]
+        status, duration, files = run_leased_job(address, name, job, reply["timeout"])
+        if status == "lost":
+            continue
+        try:
+            request(address, {"op": "finish", "worker": name, "id": job["id"], "status": status, "time": duration, "files": files})
+        except OSError:
+            return print(f"Cannot reach the broker at {address} with the result of {job['id']}, stopping")
+
+
+def run_leased_job(address: str, name: str, job: dict, timeout: float = None) -> tuple[str, float, dict[str, str]]:
+    """
+    Run a job with results written into a scratch folder instead of results/,
+    heartbeating while it runs. Return its status, run time and result files
+    """
+    results_root = tempfile.mkdtemp(prefix="work_queue_")
+    results_dir = os.path.join(results_root, job["results_dir"])
+    os.makedirs(results_dir)
+    # The broker adds the rows to its store, so they are not added twice on its machine
+    store_file, config.RESULTS_STORE = config.RESULTS_STORE, None
+    try:
+        p = multiprocessing.get_context("fork").Process(target=scheduler.run_job, args=(job, results_root))
+        start = heartbeat = time.time()
+        p.start()
+        status = None
+        while p.exitcode is None:
+            time.sleep(0.1)
+            if timeout is not None and time.time() - start > timeout:
+                scheduler.kill_job(p)
+                status = "timeout"
+            elif time.time() - heartbeat > HEARTBEAT_TIME:
+                heartbeat = time.time()
+                if not renew_lease(address, name, job["id"]):
+                    print(f"Lost the lease of {job['id']}, stopping it")
+                    scheduler.kill_job(p)
+                    status = "lost"
+        p.join()
+        duration = time.time() - start
+        status = status or ("done" if p.exitcode == 0 else "failed")
+        files = {}
+        for filename in sorted(os.listdir(results_dir)):
+            with open(os.path.join(results_dir, filename)) as f:
+                files[filename] = f.read()
+        return status, duration, files
+    finally:
+        config.RESULTS_STORE = store_file
+        shutil.rmtree(results_root, ignore_errors=True)
+
+
+def renew_lease(address: str, name: str, job_id: str) -> bool:
+    """Return if the lease of a job is still held, keeping the job if the broker cannot be reached"""
+    try:
+        return request(address, {"op": "heartbeat", "worker": name, "id": job_id})["ok"]
+    except OSError:
+        return True
+
+
+def main() -> None:
+    args = parse_args()
+    if args.workers == 1:
+        return work(args.address)
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=work, args=(args.address,)) for _ in range(args.workers)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "address",
+        nargs="?", type=str, default=ADDRESS,
+        help=f"the host and port of the broker, started with run_tests --broker, default value: {ADDRESS}"
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        nargs="?", type=int, default=1,
+        help="the number of workers to run on this machine, default value: 1"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()